@@ -2,22 +2,460 @@
 aggregate_scores.py
 
 聚合 chunk-level 得分为 firm-year 级别指标。
+输入：chunk_scores.csv，或 scoring_chunks 输出的按 year 分区的 Parquet 数据集（INPUT_PARQUET）
 输出：aggregated_scores.csv
+
+增量模式（INCREMENTAL = True，仅支持 CSV 输入）：chunk_scores.csv 只会被追加，
+状态库记录上次聚合读到的字节位置和各分组的可合并直方图（见流式模式）；再次运行时只解析新增部分，
+累加进受影响分组的直方图，只重算这些分组并替换 / 追加到已有输出中，不再扫描整个 CSV 或重算全部分组。
+
+流式模式（STREAMING = True，仅支持 CSV 输入）：按 STREAM_BATCH_ROWS 行分批读取输入，
+每个分组只保留可合并的状态——各分数取值的 (出现次数, 长度和) 直方图。加权平均、max、top-k、
+中位数/分位数和标准差都可以由直方图精确得到，内存只与“分组数 × 不同分数取值数”有关，与输入行数无关。
+
+并行模式（PARALLEL_WORKERS > 1，仅支持 CSV 输入）：输入按字节区间切块，多个进程并行解析，
+并按 firm_id 的哈希把行写入各分区的临时文件；再由进程池对每个分区独立聚合、结果写回文件，
+最后按分组键排序拼接，结果与单进程聚合一致。进程间只传递文件路径，不传递 DataFrame。
 """
 
+import glob
+import io
 import os
+import shutil
+import sqlite3
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
 import numpy as np
 
 
 INPUT_CSV = r"C:\Code\Article\Output\chunk_scores.csv"
+# 若设置，则从 Parquet 数据集读取（只加载聚合需要的列），忽略 INPUT_CSV；需要 pyarrow
+INPUT_PARQUET = None  # r"C:\Code\Article\Output\chunk_scores_parquet"
+YEARS = None  # 仅聚合指定年份，如 [2022, 2023]；None 表示全部
 OUTPUT_CSV = r"C:\Code\Article\Output\aggregated_scores.csv"
+INCREMENTAL = False  # True：只重算上次聚合之后有新 chunk 的分组
+STATE_DB = OUTPUT_CSV + ".state.db"  # 增量模式的状态库（SQLite）
+READ_CHUNKSIZE = 500_000  # 增量模式全量重建时分批读取输入
+STREAMING = False  # True：分批读取输入，内存只与分组数有关
+STREAM_BATCH_ROWS = 1_000_000
+PARALLEL_WORKERS = 0  # > 1 时启用多进程并行聚合，建议设为 CPU 核数
+PARALLEL_BLOCK_BYTES = 64 * 1024 * 1024  # 并行模式下每个解析任务读取的字节数
+BOOTSTRAP_RESAMPLES = 0  # > 0 时额外计算各 firm-year 指标的 bootstrap 置信区间
+BOOTSTRAP_SEED = 20251021
+BOOTSTRAP_CI = 0.95
+BOOTSTRAP_METRICS = ["weighted_avg_score", "topk_avg_score", "median_score"]
+BOOTSTRAP_MAX_ELEMENTS = 5_000_000  # 每批重抽样矩阵的元素上限，控制内存
+BOOTSTRAP_OUTPUT_CSV = r"C:\Code\Article\Output\aggregated_scores_ci.csv"
 TOP_K = 3  # top-k 平均
+REQUIRED_COLS = ["fname", "firm_id", "year", "chunk_id", "chunk_len", "score", "ai_flag"]
+AGG_COLS = ["fname", "firm_id", "year", "chunk_len", "score", "ai_flag"]  # 聚合实际用到的列
+
+
+GROUP_KEYS = ["fname", "firm_id", "year"]
+OUTPUT_COLS = GROUP_KEYS + [
+    "weighted_avg_score", "max_score", "topk_avg_score", "median_score", "q75_score", "q90_score",
+    "z_score_based", "presence_dummy", "chunk_count", "total_len",
+]
+
+
+def _group_quantile(at, starts, counts, q):
+    """
+    按组求分位数，与 np.quantile(method="linear") 的计算步骤一致：
+    virtual = (n-1)*q，取相邻两个次序统计量做 _lerp 插值；virtual >= n-1 时直接取最大值。
+    at(pos) 返回按 (组, 分数) 排序后第 pos 个位置的分数。
+    """
+    virtual = (counts - 1) * q
+    prev = np.floor(virtual)
+    above = virtual >= counts - 1
+    prev_idx = np.where(above, counts - 1, prev).astype(np.int64)
+    next_idx = np.where(above, counts - 1, prev + 1).astype(np.int64)
+    gamma = virtual - prev
+    a = at(starts + prev_idx)
+    b = at(starts + next_idx)
+    diff = b - a
+    return np.where(gamma >= 0.5, b - diff * (1 - gamma), a + diff * gamma)
+
+
+def _order_statistics(at, starts, counts):
+    """
+    由各组排好序的分数计算 max / top-k 平均 / 中位数 / q75 / q90。
+    at(pos) 的结果可以带前导维度（如 bootstrap 的重抽样维度），各指标沿最后一维按组计算。
+    """
+    ends = starts + counts
+    max_score = at(ends - 1)
+    k = np.minimum(counts, TOP_K)
+    topk_sum = max_score.copy()  # 与 sorted(..., reverse=True)[:k] 的求和顺序相同
+    for j in range(1, TOP_K):
+        take = k > j
+        topk_sum[..., take] = topk_sum[..., take] + at((ends - 1 - j)[take])
+    topk_avg = topk_sum / k
+
+    mid = counts // 2
+    median_score = np.where(counts % 2 == 1, at(starts + mid),
+                            (at(starts + np.maximum(mid - 1, 0)) + at(starts + mid)) / 2)
+    return {
+        "max_score": max_score,
+        "topk_avg_score": topk_avg,
+        "median_score": median_score,
+        "q75_score": _group_quantile(at, starts, counts, 0.75),
+        "q90_score": _group_quantile(at, starts, counts, 0.90),
+    }
+
+
+def _z_flags(max_score, mean, std, group_values):
+    """
+    z-score based threshold：存在 z > 1 等价于最大值的 z > 1。
+    求和顺序与 np.std 不同，z 恰好在 1 附近时用 group_values(i) 取回该组分数、按原方法复核。
+    """
+    with np.errstate(invalid="ignore", divide="ignore"):
+        z_max = np.where(std > 0, (max_score - mean) / std, 0.0)
+    z_based = ((std > 0) & (z_max > 1)).astype(np.int64)
+    for t in np.flatnonzero((std > 0) & (np.abs(z_max - 1) < 1e-9)):
+        vals = group_values(t)
+        z_based[t] = 1 if np.mean((vals - np.mean(vals)) / np.std(vals) > 1) > 0 else 0
+    return z_based
+
+
+def _round2(values):
+    # 原实现对 Python float 调用内置 round（十进制正确舍入），逐个调用以保持结果完全一致；开销只与组数有关
+    return np.array([round(v, 2) for v in values.tolist()], dtype=float)
+
+
+def _build_result(keys, counts, weighted_avg, stats, z_based, total_len) -> pd.DataFrame:
+    """组装输出表；weighted_avg / stats / z_based / total_len 只包含有 AI chunk 的分组，其余分组填 0。"""
+    has_ai = counts > 0
+    n_groups = len(keys)
+
+    def spread(values, dtype=float):
+        out = np.zeros(n_groups, dtype=dtype)
+        out[has_ai] = values
+        return out
+
+    result = pd.DataFrame({
+        **{k: keys[k] for k in GROUP_KEYS},
+        "weighted_avg_score": spread(np.round(weighted_avg, 2)),
+        "max_score": spread(_round2(stats["max_score"])),
+        "topk_avg_score": spread(_round2(stats["topk_avg_score"])),
+        "median_score": spread(_round2(stats["median_score"])),
+        "q75_score": spread(_round2(stats["q75_score"])),
+        "q90_score": spread(_round2(stats["q90_score"])),
+        "z_score_based": spread(z_based, dtype=np.int64),
+        "presence_dummy": has_ai.astype(np.int64),
+        "chunk_count": counts.astype(np.int64),
+        "total_len": spread(total_len),
+    })
+    if not has_ai.any():
+        # 与逐组实现一致：全部分组都不含 AI 时各列均为整数 0
+        float_cols = ["weighted_avg_score", "max_score", "topk_avg_score", "median_score",
+                      "q75_score", "q90_score", "total_len"]
+        result[float_cols] = result[float_cols].astype(np.int64)
+    return result
+
+
+def _ai_rows(df: pd.DataFrame):
+    """
+    返回 (keys, g, scores, lengths)：keys 为排序后的分组键；g/scores/lengths 为 ai_flag == 1 的行的
+    分组编号、分数（缺失记 0）与长度（缺失记 0）。分组键含 NaN 的行与 groupby 一样被丢弃。
+    """
+    gb = df.groupby(GROUP_KEYS, sort=True)
+    keys = gb.size().reset_index()[GROUP_KEYS]
+    codes = gb.ngroup().fillna(-1).to_numpy(dtype=np.int64)
+    ai_mask = (df["ai_flag"] == 1).to_numpy() & (codes >= 0)
+    g = codes[ai_mask]
+    scores = df["score"].astype(float).fillna(0).to_numpy()[ai_mask]
+    lengths = df["chunk_len"].astype(float).fillna(0).to_numpy()[ai_mask]
+    return keys, g, scores, lengths
 
 
 def aggregate_firm_year(df: pd.DataFrame) -> pd.DataFrame:
     """
-    输入 chunk-level DataFrame，返回 firm-year 聚合结果
+    输入 chunk-level DataFrame，返回 firm-year 聚合结果。
+
+    向量化实现：一次分组编号 + 一次 (组, 分数) 排序，所有指标用 bincount / 下标运算按组批量计算，
+    结果与逐组循环的 aggregate_firm_year_loop 完全一致。
+    """
+    keys, g, scores, lengths = _ai_rows(df)
+    n_groups = len(keys)
+    if n_groups == 0:
+        return pd.DataFrame(columns=OUTPUT_COLS)
+
+    s_sorted = scores[np.lexsort((scores, g))]
+    counts = np.bincount(g, minlength=n_groups)
+    has_ai = counts > 0
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+
+    # 以下只对含 AI chunk 的分组计算，其余分组各指标为 0
+    n = counts[has_ai]
+    st = starts[has_ai]
+
+    # --- 主指标：加权平均（np.average = sum(s*w) / sum(w)）---
+    weight_sum = np.bincount(g, weights=lengths, minlength=n_groups)[has_ai]
+    weighted_sum = np.bincount(g, weights=scores * lengths, minlength=n_groups)[has_ai]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        weighted_avg = np.where(weight_sum > 0, weighted_sum / weight_sum, 0.0)
+
+    # --- 其他指标 ---
+    stats = _order_statistics(s_sorted.__getitem__, st, n)
+
+    group_mean = np.bincount(g, weights=scores, minlength=n_groups) / np.maximum(counts, 1)
+    dev = scores - group_mean[g]
+    std = np.sqrt(np.bincount(g, weights=dev * dev, minlength=n_groups)[has_ai] / n)
+    z_based = _z_flags(stats["max_score"], group_mean[has_ai], std,
+                       lambda t: s_sorted[st[t]:st[t] + n[t]])
+
+    return _build_result(keys, counts, weighted_avg, stats, z_based, weight_sum)
+
+
+def bootstrap_firm_year_ci(df: pd.DataFrame, n_resamples: int = BOOTSTRAP_RESAMPLES, seed: int = BOOTSTRAP_SEED,
+                           ci: float = BOOTSTRAP_CI, max_elements: int = BOOTSTRAP_MAX_ELEMENTS) -> pd.DataFrame:
+    """
+    对每个 firm-year 的 AI chunk 做有放回重抽样，返回 BOOTSTRAP_METRICS 的百分位置信区间
+    （列名 <metric>_ci_low / <metric>_ci_high）。不含 AI chunk 的分组置信区间为 0。
+
+    所有分组一起批量重抽样：行按 (组, 分数) 排序后，每组的抽样下标落在该组自己的连续区间内，
+    对整行下标排序即可同时得到每组排好序的重抽样分数，再复用 _order_statistics 计算各指标。
+    相同 seed 与 max_elements 下结果可复现。
+    """
+    keys, g, scores, lengths = _ai_rows(df)
+    n_groups = len(keys)
+    ci_cols = [f"{m}_ci_{side}" for m in BOOTSTRAP_METRICS for side in ("low", "high")]
+    if n_groups == 0:
+        return pd.DataFrame(columns=GROUP_KEYS + ci_cols)
+
+    order = np.lexsort((scores, g))
+    s_sorted = scores[order]
+    l_sorted = lengths[order]
+    counts = np.bincount(g, minlength=n_groups)
+    has_ai = counts > 0
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    n = counts[has_ai]
+    st = starts[has_ai]
+    n_ai = len(n)
+
+    rng = np.random.default_rng(seed)
+    alpha = (1 - ci) / 2
+    bounds = {m: np.zeros((2, n_ai)) for m in BOOTSTRAP_METRICS}
+
+    # 按分组分块：每块保存 n_resamples x 块内组数 的重抽样结果；块内再按重抽样次数分批
+    groups_per_block = max(1, max_elements // n_resamples)
+    for b0 in range(0, n_ai, groups_per_block):
+        b1 = min(n_ai, b0 + groups_per_block)
+        blk_n = n[b0:b1]
+        row0 = st[b0]
+        n_rows = int(blk_n.sum())
+        local_st = st[b0:b1] - row0
+        s_blk = s_sorted[row0:row0 + n_rows]
+        l_blk = l_sorted[row0:row0 + n_rows]
+        row_start = np.repeat(local_st, blk_n)
+        row_n = np.repeat(blk_n, blk_n)
+
+        samples = {m: np.empty((n_resamples, b1 - b0)) for m in BOOTSTRAP_METRICS}
+        per_batch = max(1, max_elements // n_rows)
+        for r0 in range(0, n_resamples, per_batch):
+            r1 = min(n_resamples, r0 + per_batch)
+            idx = row_start + (rng.random((r1 - r0, n_rows)) * row_n).astype(np.int64)
+            idx.sort(axis=1)
+            s = s_blk[idx]
+            w = l_blk[idx]
+            weight_sum = np.add.reduceat(w, local_st, axis=1)
+            weighted_sum = np.add.reduceat(s * w, local_st, axis=1)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                weighted = np.where(weight_sum > 0, weighted_sum / weight_sum, 0.0)
+            stats = _order_statistics(lambda pos: s[:, pos], local_st, blk_n)
+            stats["weighted_avg_score"] = weighted
+            for m in BOOTSTRAP_METRICS:
+                samples[m][r0:r1] = stats[m]
+
+        for m in BOOTSTRAP_METRICS:
+            bounds[m][:, b0:b1] = np.quantile(samples[m], [alpha, 1 - alpha], axis=0)
+
+    result = {k: keys[k] for k in GROUP_KEYS}
+    for m in BOOTSTRAP_METRICS:
+        for i, side in enumerate(("low", "high")):
+            col = np.zeros(n_groups)
+            col[has_ai] = np.round(bounds[m][i], 2)
+            result[f"{m}_ci_{side}"] = col
+    return pd.DataFrame(result)
+
+
+def _restore_key_dtypes(keys: pd.DataFrame) -> pd.DataFrame:
+    """分批读取时分组键按字符串读入；与整表 read_csv 一样，可以全部转成数值的列转回数值。"""
+    for col in ("firm_id", "year"):
+        try:
+            keys[col] = pd.to_numeric(keys[col])
+        except (ValueError, TypeError):
+            pass
+    return keys
+
+
+def _batch_state(batch: pd.DataFrame):
+    """
+    一批 chunk 行的可合并状态：(每个分组的总行数, 直方图)。
+    直方图以 (fname, firm_id, year, score) 为索引，列为 count / len_sum，只统计 ai_flag == 1 的行。
+    """
+    sizes = batch.groupby(GROUP_KEYS).size()
+    ai = batch[batch["ai_flag"] == 1]
+    ai = ai.assign(score=ai["score"].astype(float).fillna(0),
+                   chunk_len=ai["chunk_len"].astype(float).fillna(0))
+    part = ai.groupby(GROUP_KEYS + ["score"]).agg(count=("chunk_len", "size"), len_sum=("chunk_len", "sum"))
+    return sizes, part
+
+
+def _merge_state(group_rows, hist, sizes, part):
+    group_rows = sizes if group_rows is None else group_rows.add(sizes, fill_value=0)
+    hist = part if hist is None else pd.concat([hist, part]).groupby(level=list(range(4))).sum()
+    return group_rows, hist
+
+
+def _aggregate_state(group_rows, hist) -> pd.DataFrame:
+    """由合并后的状态计算各分组指标，输出列与 aggregate_firm_year 相同。"""
+    if group_rows is None or len(group_rows) == 0:
+        return pd.DataFrame(columns=OUTPUT_COLS)
+
+    group_index = group_rows.sort_index().index
+    keys = _restore_key_dtypes(group_index.to_frame(index=False))
+    n_groups = len(keys)
+
+    hist = hist.sort_index()
+    g = group_index.get_indexer(hist.index.droplevel("score"))
+    values = hist.index.get_level_values("score").to_numpy(dtype=float)
+    value_counts = hist["count"].to_numpy(dtype=np.int64)
+    len_sums = hist["len_sum"].to_numpy(dtype=float)
+
+    counts = np.bincount(g, weights=value_counts, minlength=n_groups).astype(np.int64)
+    has_ai = counts > 0
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    n = counts[has_ai]
+    st = starts[has_ai]
+
+    # 直方图按 (组, 分数) 排序，相当于排好序的分数序列的游程编码：第 pos 个位置落在 ends > pos 的第一个条目
+    ends = np.cumsum(value_counts)
+
+    def at(pos):
+        return values[np.searchsorted(ends, pos, side="right")]
+
+    weight_sum = np.bincount(g, weights=len_sums, minlength=n_groups)[has_ai]
+    weighted_sum = np.bincount(g, weights=values * len_sums, minlength=n_groups)[has_ai]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        weighted_avg = np.where(weight_sum > 0, weighted_sum / weight_sum, 0.0)
+
+    stats = _order_statistics(at, st, n)
+
+    group_mean = np.bincount(g, weights=values * value_counts, minlength=n_groups) / np.maximum(counts, 1)
+    dev = values - group_mean[g]
+    std = np.sqrt(np.bincount(g, weights=value_counts * dev * dev, minlength=n_groups)[has_ai] / n)
+    z_based = _z_flags(stats["max_score"], group_mean[has_ai], std,
+                       lambda t: at(np.arange(st[t], st[t] + n[t])))
+
+    result = _build_result(keys, counts, weighted_avg, stats, z_based, weight_sum)
+    return result.sort_values(GROUP_KEYS, kind="stable").reset_index(drop=True)
+
+
+def _stream_state(input_csv: str, batch_rows: int):
+    """分批读取整个 CSV，返回合并后的 (group_rows, hist)。"""
+    key_dtypes = {k: str for k in GROUP_KEYS}
+    group_rows = None  # 每个分组的总行数（包括不含 AI 的分组）
+    hist = None        # (fname, firm_id, year, score) -> [count, len_sum]，只统计 ai_flag == 1 的行
+    total_rows = 0
+    for batch in pd.read_csv(input_csv, usecols=AGG_COLS, dtype=key_dtypes, chunksize=batch_rows):
+        total_rows += len(batch)
+        group_rows, hist = _merge_state(group_rows, hist, *_batch_state(batch))
+        print(f"[Streaming] 已读取 {total_rows} 行，当前 {len(group_rows)} 个分组")
+    return group_rows, hist
+
+
+def aggregate_streaming(input_csv: str = INPUT_CSV, batch_rows: int = STREAM_BATCH_ROWS) -> pd.DataFrame:
+    """
+    流式聚合：分批读取 chunk_scores.csv，按分组合并 (分数取值 -> 次数, 长度和) 直方图，最后由直方图计算指标。
+    输出列与 aggregate_firm_year 相同。
+    """
+    if not os.path.exists(input_csv):
+        raise FileNotFoundError(f"未找到输入文件: {input_csv}")
+    return _aggregate_state(*_stream_state(input_csv, batch_rows))
+
+
+def _line_aligned(f, pos: int) -> int:
+    """返回 pos 处或其后的第一个行首位置。"""
+    if pos == 0:
+        return 0
+    f.seek(pos - 1)
+    f.readline()
+    return f.tell()
+
+
+def _partition_block(input_csv, start, end, columns, n_parts, tmp_dir, block_id):
+    """并行第一阶段：解析 [start, end) 字节区间，按 firm_id 哈希把行写入各分区文件。"""
+    with open(input_csv, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start)
+    df = pd.read_csv(io.BytesIO(data), header=None, names=columns, usecols=AGG_COLS,
+                     dtype={k: str for k in GROUP_KEYS})
+    part_ids = pd.util.hash_array(df["firm_id"].fillna("").to_numpy(dtype=object)) % n_parts
+    for part_id, part in df.groupby(part_ids):
+        part.to_csv(os.path.join(tmp_dir, f"p{part_id:04d}-b{block_id:06d}.csv"),
+                    index=False, header=False, columns=AGG_COLS)
+
+
+def _aggregate_partition(tmp_dir, part_id):
+    """并行第二阶段：读取一个分区的全部块，独立聚合，结果写入文件并返回路径。"""
+    files = sorted(glob.glob(os.path.join(tmp_dir, f"p{part_id:04d}-b*.csv")))
+    if not files:
+        return None
+    df = pd.concat([pd.read_csv(p, header=None, names=AGG_COLS, dtype={k: str for k in GROUP_KEYS})
+                    for p in files], ignore_index=True)
+    out_path = os.path.join(tmp_dir, f"result-p{part_id:04d}.csv")
+    aggregate_firm_year(df).to_csv(out_path, index=False)
+    return out_path
+
+
+def aggregate_parallel(input_csv: str = INPUT_CSV, workers: int = PARALLEL_WORKERS,
+                       n_parts: int = None, block_bytes: int = PARALLEL_BLOCK_BYTES) -> pd.DataFrame:
+    """
+    多进程并行聚合，按 firm_id 哈希分区（同一企业的全部分组落在同一分区），输出列与 aggregate_firm_year 相同。
+    """
+    if not os.path.exists(input_csv):
+        raise FileNotFoundError(f"未找到输入文件: {input_csv}")
+    workers = max(1, workers or os.cpu_count() or 1)
+    n_parts = n_parts or workers * 4
+
+    with open(input_csv, "rb") as f:
+        columns = pd.read_csv(io.BytesIO(f.readline())).columns.tolist()
+        data_start = f.tell()
+        size = os.path.getsize(input_csv)
+        bounds = sorted({data_start, size} | {
+            _line_aligned(f, pos) for pos in range(data_start + block_bytes, size, block_bytes)})
+    missing = set(REQUIRED_COLS) - set(columns)
+    if missing:
+        raise ValueError(f"输入文件缺少必要列: {missing}")
+
+    tmp_dir = tempfile.mkdtemp(prefix="aggregate_parallel_", dir=os.path.dirname(os.path.abspath(input_csv)))
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            blocks = [(s, e) for s, e in zip(bounds[:-1], bounds[1:]) if e > s]
+            print(f"[Parallel] {len(blocks)} 个数据块 → {n_parts} 个分区，{workers} 个进程")
+            futures = [pool.submit(_partition_block, input_csv, s, e, columns, n_parts, tmp_dir, i)
+                       for i, (s, e) in enumerate(blocks)]
+            for fut in futures:
+                fut.result()
+
+            result_paths = list(pool.map(_aggregate_partition, [tmp_dir] * n_parts, range(n_parts)))
+
+        parts = [pd.read_csv(p, dtype={k: str for k in GROUP_KEYS}, float_precision="round_trip")
+                 for p in result_paths if p is not None]
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    if not parts:
+        return pd.DataFrame(columns=OUTPUT_COLS)
+    result = pd.concat(parts, ignore_index=True)
+    _restore_key_dtypes(result)
+    return result.sort_values(GROUP_KEYS, kind="stable").reset_index(drop=True)
+
+
+def aggregate_firm_year_loop(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    逐组循环的参考实现（原实现），用于校验向量化版本和基准测试。
     """
     grouped = []
     for (fname, firm_id, year), g in df.groupby(["fname", "firm_id", "year"]):
@@ -87,24 +525,265 @@ def aggregate_firm_year(df: pd.DataFrame) -> pd.DataFrame:
     return pd.DataFrame(grouped)
 
 
-def main():
-    if not os.path.exists(INPUT_CSV):
-        raise FileNotFoundError(f"未找到输入文件: {INPUT_CSV}")
+def load_chunk_scores(input_csv: str = INPUT_CSV, input_parquet: str = INPUT_PARQUET, years=YEARS) -> pd.DataFrame:
+    """
+    读取 chunk-level 得分。Parquet 数据集只读取聚合需要的列，并按 year 分区裁剪；
+    CSV 则整体解析后按 years 过滤。
+    """
+    if input_parquet:
+        if not os.path.exists(input_parquet):
+            raise FileNotFoundError(f"未找到输入数据集: {input_parquet}")
+        print(f"正在加载 {input_parquet} ...")
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+        dataset = ds.dataset(input_parquet, format="parquet",
+                             partitioning=ds.partitioning(pa.schema([("year", pa.int16())]), flavor="hive"))
+        row_filter = ds.field("year").isin([int(y) for y in years]) if years is not None else None
+        df = dataset.to_table(columns=AGG_COLS, filter=row_filter).to_pandas()
+        # 无法解析年份的记录在分组时本就会被丢弃；去掉后年份列恢复为整数
+        df = df[df["year"].notna()]
+        df["year"] = df["year"].astype(int)
+        return df
+
+    if not os.path.exists(input_csv):
+        raise FileNotFoundError(f"未找到输入文件: {input_csv}")
+
+    print(f"正在加载 {input_csv} ...")
+    df = pd.read_csv(input_csv)
+    missing = set(REQUIRED_COLS) - set(df.columns)
+    if missing:
+        raise ValueError(f"输入文件缺少必要列: {missing}")
+    if years is not None:
+        df = df[df["year"].isin([int(y) for y in years])]
+    return df
+
+
+def _complete_size(path: str, block_size: int = 64 * 1024) -> int:
+    """返回文件中最后一个换行符之后的位置，即完整行的字节数（忽略正在写入的半行）。"""
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        pos = f.tell()
+        while pos > 0:
+            read_size = min(block_size, pos)
+            pos -= read_size
+            f.seek(pos)
+            idx = f.read(read_size).rfind(b"\n")
+            if idx >= 0:
+                return pos + idx + 1
+    return 0
+
+
+def _read_anchor(path: str, offset: int, size: int = 256) -> str:
+    """offset 之前的若干字节，用于判断输入文件是否只是被追加（而不是被重写）。"""
+    start = max(0, offset - size)
+    with open(path, "rb") as f:
+        f.seek(start)
+        return f.read(offset - start).hex()
+
+
+class _HeadReader(io.RawIOBase):
+    """只暴露文件前 limit 个字节的只读流。"""
+
+    def __init__(self, f, limit: int):
+        self._f = f
+        self._remaining = limit
+
+    def readable(self):
+        return True
 
-    print(f"正在加载 {INPUT_CSV} ...")
-    df = pd.read_csv(INPUT_CSV)
+    def readinto(self, b):
+        n = self._f.readinto(memoryview(b)[:min(len(b), self._remaining)])
+        self._remaining -= n
+        return n
 
-    required_cols = {"fname", "firm_id", "year", "chunk_id", "chunk_len", "score", "ai_flag"}
-    if not required_cols.issubset(df.columns):
-        raise ValueError(f"输入文件缺少必要列: {required_cols - set(df.columns)}")
 
-    print(f"共 {len(df)} 条 chunk-level 记录，将按 firm_id/year 聚合。")
-    agg_df = aggregate_firm_year(df)
-    agg_df.to_csv(OUTPUT_CSV, index=False, encoding="utf-8-sig")
+_STATE_SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)",
+    "CREATE TABLE IF NOT EXISTS groups (fname TEXT, firm_id TEXT, year TEXT, rows INTEGER, "
+    "PRIMARY KEY (fname, firm_id, year))",
+    "CREATE TABLE IF NOT EXISTS hist (fname TEXT, firm_id TEXT, year TEXT, score REAL, count INTEGER, len_sum REAL, "
+    "PRIMARY KEY (fname, firm_id, year, score))",
+    # 状态已更新、输出尚未写入的分组；崩溃后下次运行会一并重算
+    "CREATE TABLE IF NOT EXISTS dirty (fname TEXT, firm_id TEXT, year TEXT, PRIMARY KEY (fname, firm_id, year))",
+]
+
+
+def _open_state(state_path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(state_path, isolation_level=None)
+    for statement in _STATE_SCHEMA:
+        conn.execute(statement)
+    return conn
+
+
+def _state_offset(conn: sqlite3.Connection, input_csv: str):
+    """上次聚合读到的字节位置；状态属于其他输入文件或输入已被重写时返回 None。"""
+    meta = dict(conn.execute("SELECT key, value FROM meta").fetchall())
+    if meta.get("input") != os.path.abspath(input_csv) or "offset" not in meta:
+        return None
+    offset = int(meta["offset"])
+    if offset > os.path.getsize(input_csv) or _read_anchor(input_csv, offset) != meta.get("anchor"):
+        print("[Incremental] 输入文件已被重写，改为全量聚合。")
+        return None
+    return offset
+
+
+def _set_offset_locked(conn: sqlite3.Connection, input_csv: str, offset: int):
+    conn.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", [
+        ("input", os.path.abspath(input_csv)), ("offset", str(offset)), ("anchor", _read_anchor(input_csv, offset))])
+
+
+def _state_params(group_rows, hist):
+    groups = [(*key, int(rows)) for key, rows in group_rows.items()]
+    bins = [(*key, int(count), float(len_sum))
+            for key, count, len_sum in zip(hist.index, hist["count"], hist["len_sum"])]
+    return groups, bins
+
+
+def _replace_state(conn: sqlite3.Connection, input_csv: str, offset: int, group_rows, hist):
+    """全量聚合后整体替换状态。"""
+    groups, bins = _state_params(group_rows, hist)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for table in ("groups", "hist", "dirty"):
+            conn.execute(f"DELETE FROM {table}")
+        conn.executemany("INSERT INTO groups VALUES (?, ?, ?, ?)", groups)
+        conn.executemany("INSERT INTO hist VALUES (?, ?, ?, ?, ?, ?)", bins)
+        _set_offset_locked(conn, input_csv, offset)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def _apply_delta(conn: sqlite3.Connection, input_csv: str, offset: int, sizes, part):
+    """
+    把新增部分的状态累加进对应的分组和直方图条目，并把这些分组标记为待重算；
+    与新的 offset 在同一个事务中提交，崩溃时不会重复累加或漏掉新增部分。
+    """
+    groups, bins = _state_params(sizes, part)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.executemany(
+            "INSERT INTO groups VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (fname, firm_id, year) DO UPDATE SET rows = rows + excluded.rows", groups)
+        conn.executemany(
+            "INSERT INTO hist VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (fname, firm_id, year, score) DO UPDATE SET "
+            "count = count + excluded.count, len_sum = len_sum + excluded.len_sum", bins)
+        conn.executemany("INSERT OR IGNORE INTO dirty VALUES (?, ?, ?)", [g[:3] for g in groups])
+        _set_offset_locked(conn, input_csv, offset)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def _dirty_state(conn: sqlite3.Connection):
+    """只取出待重算分组的 (group_rows, hist)。"""
+    group_rows = pd.read_sql_query(
+        "SELECT g.fname, g.firm_id, g.year, g.rows FROM groups g JOIN dirty USING (fname, firm_id, year)",
+        conn).set_index(GROUP_KEYS)["rows"]
+    hist = pd.read_sql_query(
+        "SELECT h.fname, h.firm_id, h.year, h.score, h.count, h.len_sum FROM hist h "
+        "JOIN dirty USING (fname, firm_id, year)", conn).set_index(GROUP_KEYS + ["score"])
+    return group_rows, hist
+
+
+def _write_output(agg_df: pd.DataFrame, output_csv: str):
+    tmp_path = output_csv + ".tmp"
+    agg_df.to_csv(tmp_path, index=False, encoding="utf-8-sig")
+    os.replace(tmp_path, output_csv)
+
+
+def _splice_output(output_csv: str, updated: pd.DataFrame) -> pd.DataFrame:
+    """用重算的分组替换输出中键相同的行，新分组追加进去，按分组键排序（与全量聚合的顺序一致）。"""
+    existing = pd.read_csv(output_csv, encoding="utf-8-sig")
+
+    def keys(df):
+        return pd.MultiIndex.from_frame(df[GROUP_KEYS].astype(str))
+
+    kept = existing[~keys(existing).isin(keys(updated))]
+    merged = pd.concat([kept, updated], ignore_index=True) if len(kept) else updated
+    merged = merged.sort_values(GROUP_KEYS, kind="stable").reset_index(drop=True)
+    _write_output(merged, output_csv)
+    return merged
+
+
+def aggregate_incremental(input_csv: str = INPUT_CSV, output_csv: str = OUTPUT_CSV,
+                          state_path: str = STATE_DB) -> pd.DataFrame:
+    """
+    增量聚合：状态库（SQLite）中保存各分组的可合并直方图（与流式模式相同）和上次读到的字节位置。
+    再次运行时只解析新增部分，把它累加进受影响分组的状态，只重算这些分组，
+    再按分组键替换 / 追加到已有输出中；其余分组的状态和指标都不重新读取或计算。
+    没有状态、输出文件不存在或输入被重写时退化为全量（流式）聚合。
+    """
+    if not os.path.exists(input_csv):
+        raise FileNotFoundError(f"未找到输入文件: {input_csv}")
+
+    end = _complete_size(input_csv)
+    conn = _open_state(state_path)
+    try:
+        offset = _state_offset(conn, input_csv) if os.path.exists(output_csv) else None
+        if offset is None:
+            print(f"[Incremental] 全量聚合 {input_csv}。")
+            # 只读到 end：文件末尾正在写入的半行留给下一次增量
+            with open(input_csv, "rb") as f:
+                group_rows, hist = _stream_state(_HeadReader(f, end), READ_CHUNKSIZE)
+            agg_df = _aggregate_state(group_rows, hist)
+            _write_output(agg_df, output_csv)
+            if group_rows is not None:
+                _replace_state(conn, input_csv, end, group_rows, hist)
+            return agg_df
+
+        if end > offset:
+            with open(input_csv, "rb") as f:
+                f.seek(offset)
+                new_bytes = f.read(end - offset)
+            new_rows = pd.read_csv(io.BytesIO(new_bytes), header=None, names=REQUIRED_COLS, usecols=AGG_COLS,
+                                   dtype={k: str for k in GROUP_KEYS})
+            _apply_delta(conn, input_csv, end, *_batch_state(new_rows))
+            print(f"[Incremental] 新增 {len(new_rows)} 条记录。")
+
+        group_rows, hist = _dirty_state(conn)
+        if len(group_rows) == 0:
+            print("[Incremental] 自上次聚合以来没有新的 chunk 记录。")
+            return pd.read_csv(output_csv, encoding="utf-8-sig")
+        print(f"[Incremental] 重算 {len(group_rows)} 个受影响的分组。")
+        agg_df = _splice_output(output_csv, _aggregate_state(group_rows, hist))
+        conn.execute("DELETE FROM dirty")
+        return agg_df
+    finally:
+        conn.close()
+
+
+def main():
+    df = None
+    if INCREMENTAL and not INPUT_PARQUET and YEARS is None:
+        agg_df = aggregate_incremental()
+    elif STREAMING and not INPUT_PARQUET and YEARS is None:
+        agg_df = aggregate_streaming()
+        agg_df.to_csv(OUTPUT_CSV, index=False, encoding="utf-8-sig")
+    elif PARALLEL_WORKERS > 1 and not INPUT_PARQUET and YEARS is None:
+        agg_df = aggregate_parallel(workers=PARALLEL_WORKERS)
+        agg_df.to_csv(OUTPUT_CSV, index=False, encoding="utf-8-sig")
+    else:
+        df = load_chunk_scores()
+
+        print(f"共 {len(df)} 条 chunk-level 记录，将按 firm_id/year 聚合。")
+        agg_df = aggregate_firm_year(df)
+        agg_df.to_csv(OUTPUT_CSV, index=False, encoding="utf-8-sig")
 
     print(f"\n聚合完成，输出文件: {OUTPUT_CSV}")
     print(agg_df.head())
 
+    if BOOTSTRAP_RESAMPLES > 0:
+        if df is None:
+            df = load_chunk_scores()
+        print(f"\n正在计算 bootstrap 置信区间（{BOOTSTRAP_RESAMPLES} 次重抽样）...")
+        ci_df = bootstrap_firm_year_ci(df)
+        ci_df.to_csv(BOOTSTRAP_OUTPUT_CSV, index=False, encoding="utf-8-sig")
+        print(f"置信区间输出文件: {BOOTSTRAP_OUTPUT_CSV}")
+
 
 if __name__ == "__main__":
     main()
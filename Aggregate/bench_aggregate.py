@@ -0,0 +1,90 @@
+"""
+bench_aggregate.py
+
+aggregate_firm_year 的基准测试：用合成的 chunk-level 数据比较向量化实现与逐组循环实现的耗时，
+并校验两者输出完全一致；另外对 CSV 输入比较单进程（read_csv + 聚合）与 aggregate_parallel 在不同进程数下的耗时。
+
+用法：python bench_aggregate.py
+"""
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from aggregate_scores import aggregate_firm_year, aggregate_firm_year_loop, aggregate_parallel
+
+ROW_COUNTS = [1_000_000, 10_000_000]
+CHUNKS_PER_REPORT = 60        # 平均每份年报的 chunk 数
+LOOP_MAX_ROWS = 1_000_000     # 逐组循环太慢，只在该行数以内运行并做一致性校验
+SEED = 42
+PARALLEL_ROWS = 10_000_000
+PARALLEL_WORKER_COUNTS = [2, 4, 8, 16, 32]
+
+
+def make_chunk_scores(n_rows: int, seed: int = SEED) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    n_reports = max(1, n_rows // CHUNKS_PER_REPORT)
+    report = rng.integers(0, n_reports, n_rows)
+    firm = report // 5 + 1
+    year = 2019 + report % 5
+    fnames = np.char.add(np.char.add(np.char.zfill(firm.astype(str), 6), "_"), year.astype(str))
+    fnames = np.char.add(fnames, "_年度报告.pdf")
+    ai_flag = (rng.random(n_rows) < 0.95).astype(np.int64)
+    return pd.DataFrame({
+        "fname": fnames,
+        "firm_id": firm,
+        "year": year,
+        "chunk_id": np.arange(n_rows),
+        "chunk_len": np.where(ai_flag == 1, rng.integers(200, 2000, n_rows), 0),
+        "score": np.where(ai_flag == 1, rng.integers(1, 6, n_rows), 0).astype(float),
+        "ai_flag": ai_flag,
+    })
+
+
+def _timed(func, df):
+    start = time.perf_counter()
+    result = func(df)
+    return result, time.perf_counter() - start
+
+
+def main():
+    for n_rows in ROW_COUNTS:
+        df = make_chunk_scores(n_rows)
+        vec_result, vec_time = _timed(aggregate_firm_year, df)
+        print(f"[{n_rows:>11,} rows, {len(vec_result):,} groups] vectorized: {vec_time:8.2f}s")
+
+        if n_rows <= LOOP_MAX_ROWS:
+            loop_result, loop_time = _timed(aggregate_firm_year_loop, df)
+            pd.testing.assert_frame_equal(loop_result, vec_result, check_exact=True)
+            print(f"{'':>36} loop:       {loop_time:8.2f}s  (speedup x{loop_time / vec_time:.1f}, 结果一致)")
+
+    bench_parallel()
+
+
+def bench_parallel(n_rows: int = PARALLEL_ROWS):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        input_csv = os.path.join(tmp_dir, "chunk_scores.csv")
+        df = make_chunk_scores(n_rows)
+        df["firm_id"] = df["firm_id"].map("{:06d}".format)
+        df.to_csv(input_csv, index=False)
+        del df
+
+        start = time.perf_counter()
+        baseline = aggregate_firm_year(pd.read_csv(input_csv))
+        base_time = time.perf_counter() - start
+        print(f"[{n_rows:>11,} rows, CSV] single process: {base_time:8.2f}s")
+
+        for workers in PARALLEL_WORKER_COUNTS:
+            if workers > (os.cpu_count() or 1):
+                break
+            start = time.perf_counter()
+            result = aggregate_parallel(input_csv, workers=workers)
+            par_time = time.perf_counter() - start
+            pd.testing.assert_frame_equal(baseline, result, check_exact=True)
+            print(f"{'':>26} {workers:>2} workers:     {par_time:8.2f}s  (speedup x{base_time / par_time:.1f}, 结果一致)")
+
+
+if __name__ == "__main__":
+    main()
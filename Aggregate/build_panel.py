@@ -0,0 +1,172 @@
+"""
+build_panel.py
+
+在 aggregate_scores.py 之后运行：把 firm-year 聚合结果与行业（证监会行业门类，见 Spider 的 trade.TRADE）
+和爬虫元数据（A股年报.csv：股票代码, 年份, 股票简称, 文件标题, 发布日期, 下载链接）合并成面板数据，
+并计算各指标在行业-年度内去均值（_dm）和标准化（_z）后的版本。
+
+所有连接都用整数键完成：企业键为 int(股票代码)，企业-年度键为 firm * 10000 + year，
+通过 pd.Index.get_indexer 一次性对齐，不做字符串 merge。股票代码或年份无法解析（键为 -1）的行不参与连接，
+与字符串 merge 一样不会互相匹配。
+输出：panel_firm_year.csv
+"""
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from aggregate_scores import OUTPUT_CSV as AGGREGATED_CSV
+
+SPIDER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Spider", "scrape-cop-reports-CnInfo")
+# 爬虫 file_download=0 模式输出的元数据；不存在时跳过该连接
+METADATA_CSV = r"C:\Code\Article\Spider\scrape-cop-reports-CnInfo\YearlyReport\A股年报\A股年报.csv"
+# 企业所属行业：至少包含 股票代码、行业 两列，行业取值为 trade.TRADE 中的门类名称
+INDUSTRY_CSV = r"C:\Code\Article\Output\industry.csv"
+PANEL_CSV = os.path.join(os.path.dirname(AGGREGATED_CSV), "panel_firm_year.csv")
+
+METRICS = ["weighted_avg_score", "max_score", "topk_avg_score", "median_score", "q75_score", "q90_score"]
+METADATA_COLS = ["股票简称", "文件标题", "发布日期", "下载链接"]
+
+
+def load_trade_categories():
+    """
+    行业门类列表，与爬虫查询参数使用同一份定义（Spider 的 trade.TRADE），列表下标即行业编码。
+    只导入无依赖的 trade.py；SPIDER_DIR 追加在 sys.path 末尾，不会遮蔽本目录的同名模块。
+    """
+    if SPIDER_DIR not in sys.path:
+        sys.path.append(SPIDER_DIR)
+    from trade import TRADE
+    return list(TRADE)
+
+
+def _firm_key(codes: pd.Series) -> np.ndarray:
+    """股票代码 / firm_id → 整数企业键；无法解析的记为 -1。"""
+    return pd.to_numeric(codes, errors="coerce").fillna(-1).to_numpy(dtype=np.int64)
+
+
+def _firm_year_key(firm: np.ndarray, year: np.ndarray) -> np.ndarray:
+    return firm * 10000 + year
+
+
+def _take(values: np.ndarray, positions: np.ndarray, fill):
+    """按 get_indexer 的结果取值，-1（未匹配）处填 fill。"""
+    out = values[np.maximum(positions, 0)].astype(object if fill is None else values.dtype, copy=True)
+    out[positions < 0] = fill
+    return out
+
+
+def load_metadata(path: str = METADATA_CSV) -> pd.DataFrame:
+    """读取爬虫元数据，同一企业-年度有多条公告（如更正版）时保留发布日期最新的一条。"""
+    meta = pd.read_csv(path, encoding="utf-8-sig", encoding_errors="ignore", dtype=str)
+    meta["_firm"] = _firm_key(meta["股票代码"])
+    meta["_year"] = pd.to_numeric(meta["年份"], errors="coerce").fillna(-1).astype(np.int64)
+    meta = meta[(meta["_firm"] >= 0) & (meta["_year"] >= 0)]
+    meta = meta.sort_values("发布日期", kind="stable").drop_duplicates(["_firm", "_year"], keep="last")
+    return meta
+
+
+def load_industry(path: str = INDUSTRY_CSV, trade=None) -> pd.DataFrame:
+    trade = trade if trade is not None else load_trade_categories()
+    ind = pd.read_csv(path, encoding="utf-8-sig", dtype=str)
+    ind["_firm"] = _firm_key(ind["股票代码"])
+    codes = pd.Index(trade).get_indexer(ind["行业"].str.strip())
+    unknown = ind.loc[codes < 0, "行业"].dropna().unique()
+    if len(unknown):
+        print(f"[Warning] 以下行业名称不在 trade.TRADE 中，将视为未知行业: {list(unknown)[:10]}")
+    ind["_industry"] = codes.astype(np.int64)
+    return ind[ind["_firm"] >= 0].drop_duplicates("_firm", keep="last")
+
+
+def industry_year_normalize(values: np.ndarray, industry: np.ndarray, year: np.ndarray):
+    """
+    一次性计算所有指标的行业-年度去均值与 z 分数（样本标准差，ddof=1）。
+    values: (N, M)；行业未知（-1）时两者均为 NaN；组内少于 2 个样本或标准差为 0 时 z 为 NaN。
+    """
+    demeaned = np.full(values.shape, np.nan)
+    zscores = np.full(values.shape, np.nan)
+    idx = np.flatnonzero(industry >= 0)
+    if len(idx) == 0:
+        return demeaned, zscores
+
+    # 行业-年度单元格编号，按编号排序后每个单元格是一段连续的行，用 reduceat 按段求和
+    _, cell = np.unique(industry[idx] * 10000 + year[idx], return_inverse=True)
+    order = np.argsort(cell, kind="stable")
+    rows = idx[order]
+    cell_sorted = cell[order]
+    seg_starts = np.flatnonzero(np.r_[True, cell_sorted[1:] != cell_sorted[:-1]])
+    counts = np.diff(np.r_[seg_starts, len(rows)])[:, None]
+
+    x = values[rows].astype(float)
+    means = np.add.reduceat(x, seg_starts, axis=0) / counts
+    dev = x - means[cell_sorted]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        std = np.sqrt(np.add.reduceat(dev * dev, seg_starts, axis=0) / (counts - 1))
+    std[counts[:, 0] < 2] = np.nan
+    std[std == 0] = np.nan
+
+    demeaned[rows] = dev
+    zscores[rows] = dev / std[cell_sorted]
+    return demeaned, zscores
+
+
+def build_panel(aggregated_csv: str = AGGREGATED_CSV, metadata_csv: str = METADATA_CSV,
+                industry_csv: str = INDUSTRY_CSV) -> pd.DataFrame:
+    agg = pd.read_csv(aggregated_csv, encoding="utf-8-sig")
+    firm = _firm_key(agg["firm_id"])
+    year = pd.to_numeric(agg["year"], errors="coerce").fillna(-1).to_numpy(dtype=np.int64)
+    firm_year = _firm_year_key(firm, year)
+
+    panel = pd.DataFrame({
+        "股票代码": pd.Series(firm).map(lambda v: f"{v:06d}" if v >= 0 else None),
+        "firm_id": firm,
+        "year": year,
+    })
+
+    trade = load_trade_categories()
+    if industry_csv and os.path.exists(industry_csv):
+        ind = load_industry(industry_csv, trade)
+        pos = pd.Index(ind["_firm"].to_numpy()).get_indexer(firm)
+        pos[firm < 0] = -1
+        industry = _take(ind["_industry"].to_numpy(), pos, -1)
+    else:
+        print(f"[Warning] 未找到行业文件 {industry_csv}，行业相关列为空。")
+        industry = np.full(len(agg), -1, dtype=np.int64)
+    panel["industry_code"] = industry
+    panel["行业"] = _take(np.array(trade, dtype=object), industry, None)
+
+    if metadata_csv and os.path.exists(metadata_csv):
+        meta = load_metadata(metadata_csv)
+        meta_key = _firm_year_key(meta["_firm"].to_numpy(), meta["_year"].to_numpy())
+        pos = pd.Index(meta_key).get_indexer(firm_year)
+        pos[(firm < 0) | (year < 0)] = -1
+        for col in METADATA_COLS:
+            panel[col] = _take(meta[col].to_numpy(dtype=object), pos, None)
+    else:
+        print(f"[Warning] 未找到元数据文件 {metadata_csv}，跳过元数据连接。")
+
+    panel["fname"] = agg["fname"].to_numpy()
+    for col in agg.columns:
+        if col not in ("fname", "firm_id", "year"):
+            panel[col] = agg[col].to_numpy()
+
+    values = agg[METRICS].to_numpy(dtype=float)
+    demeaned, zscores = industry_year_normalize(values, industry, year)
+    for j, metric in enumerate(METRICS):
+        panel[f"{metric}_dm"] = demeaned[:, j]
+        panel[f"{metric}_z"] = zscores[:, j]
+
+    return panel.sort_values(["firm_id", "year"], kind="stable").reset_index(drop=True)
+
+
+def main():
+    if not os.path.exists(AGGREGATED_CSV):
+        raise FileNotFoundError(f"未找到聚合结果: {AGGREGATED_CSV}，请先运行 aggregate_scores.py")
+    panel = build_panel()
+    panel.to_csv(PANEL_CSV, index=False, encoding="utf-8-sig")
+    print(f"面板数据共 {len(panel)} 行，输出文件: {PANEL_CSV}")
+    print(panel.head())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""
+dry_run.py
+
+正式打分前的试运行：只做 PDF 读取、章节提取、分块和 AI 关键词预筛（多进程并行），不调用 API。
+
+输出：
+    - 每个文件、每个年份需要打分的 chunk 数（含 AI 关键词的 chunk）
+    - 估算的 token 总数：输入按 len(build_prompt(chunk)) * tokens_per_char，输出按 MAX_TOKENS
+    - 按目标速率和并发数估算的耗时：调用次数 / min(target_rate, concurrency / latency)
+    - 计划文件 <output_csv>.plan.json：每个文件的 chunk 数、含 AI 的 chunk 编号和估算 token 数
+
+正式运行时传入 plan（run_json_scoring_resume_by_lastline(plan=...)）：按计划中的文件顺序处理，
+不含 AI chunk 的文件直接写 ai_flag=0 的默认行，不再读取 PDF。计划中的分块参数必须与正式运行一致。
+试运行中读取出错的文件在计划中带 "error" 字段（汇总中计入 files_failed），不会被当作不含 AI chunk 的文件：
+正式运行时默认跳过这些文件（不标记完成），修复后传入 retry_failed=True 重新读取。
+
+tokens_per_char 和 latency 未指定时，若 <output_csv>.usage.csv（usage.py）中已有之前运行的记录，
+则用实际的 prompt_tokens 和延迟校准，否则使用 DEFAULT_TOKENS_PER_CHAR / DEFAULT_LATENCY。
+"""
+import csv
+import json
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+from loader import ReportLoader
+from scorer import build_prompt, MAX_TOKENS
+from scoring_chunks import chunk_contains_ai, parse_fname_to_firm_year
+from usage import read_calls
+
+DEFAULT_TOKENS_PER_CHAR = 0.7  # GLM 分词器下中文约 1.4 个字符一个 token
+DEFAULT_LATENCY = 1.0          # 单次打分调用的延迟（秒）
+PLAN_VERSION = 1
+
+_worker_loader = None
+
+
+def _init_worker(loader_params):
+    global _worker_loader
+    _worker_loader = ReportLoader(**loader_params)
+
+
+def _plan_file(path):
+    """
+    子进程中执行：读取并分块一个文件，返回 (chunk 数, 含 AI 的 chunk 编号, 这些 chunk 的提示词字符数, 错误)。
+    读取出错时返回 (0, [], [], 错误信息)，不让一个文件的异常中断整个试运行。
+    """
+    try:
+        chunks = _worker_loader.load_and_chunk(path)
+        ai_ids, prompt_chars = [], []
+        for idx, chunk in enumerate(chunks, start=1):
+            if chunk_contains_ai(chunk):
+                ai_ids.append(idx)
+                prompt_chars.append(len(build_prompt(chunk)))
+    except Exception as e:
+        return 0, [], [], f"{type(e).__name__}: {e}"
+    return len(chunks), ai_ids, prompt_chars, None
+
+
+def calibrate(output_csv):
+    """
+    用之前运行的记录校准：tokens_per_char = 实际 prompt_tokens / 提示词字符数，
+    latency 为成功打分的 chunk 的平均调用耗时（含失败重试的调用）。
+    没有记录时返回 (None, None)。
+    """
+    usage_csv = output_csv + ".usage.csv"
+    if not (os.path.exists(usage_csv) and os.path.exists(output_csv)):
+        return None, None
+    chunk_lens = {}
+    with open(output_csv, "r", newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            try:
+                if row["ai_flag"] == "1":
+                    chunk_lens[(row["fname"], int(row["chunk_id"]))] = int(row["chunk_len"])
+            except (KeyError, TypeError, ValueError):
+                continue
+    template_chars = len(build_prompt(""))
+    tokens = chars = calls = 0
+    latency = 0.0
+    for (fname, chunk_id), row in read_calls(usage_csv).items():
+        try:
+            if row["ok"] != "1":
+                continue
+            calls += 1
+            latency += float(row["latency"])
+            chunk_len = chunk_lens.get((fname, chunk_id))
+            if chunk_len is not None:
+                tokens += int(row["prompt_tokens"])
+                chars += template_chars + chunk_len
+        except (KeyError, TypeError, ValueError):
+            continue
+    return (tokens / chars if tokens and chars else None), (latency / calls if calls else None)
+
+
+def plan_corpus(pdf_dir, output_csv, loader_params, num_files=None, workers=None, skip=None,
+                target_rate=None, concurrency=1, tokens_per_char=None, latency=None):
+    """
+    试运行并保存计划，返回计划字典。
+    skip：可选的 fname -> bool 函数（如进度清单中已完成的文件），这些文件不计入计划。
+    target_rate：API 允许的调用速率（次/秒），None 表示不限；concurrency：同时进行的调用数。
+    """
+    calibrated_tpc, calibrated_latency = calibrate(output_csv)
+    tokens_per_char = tokens_per_char or calibrated_tpc or DEFAULT_TOKENS_PER_CHAR
+    latency = latency or calibrated_latency or DEFAULT_LATENCY
+
+    loader = ReportLoader(**loader_params)
+    fnames = [f for f in loader.list_files(pdf_dir, num_files) if skip is None or not skip(f)]
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(loader_params,)) as executor:
+        results = list(executor.map(_plan_file, [os.path.join(pdf_dir, f) for f in fnames], chunksize=4))
+    extract_time = time.perf_counter() - start
+
+    files = []
+    by_year = defaultdict(lambda: {"files": 0, "files_with_ai": 0, "files_failed": 0, "chunks": 0, "ai_chunks": 0,
+                                   "est_tokens": 0})
+    for fname, (n_chunks, ai_ids, prompt_chars, error) in zip(fnames, results):
+        firm_id, year = parse_fname_to_firm_year(fname)
+        est_tokens = int(sum(prompt_chars) * tokens_per_char) + MAX_TOKENS * len(ai_ids)
+        entry = {"fname": fname, "firm_id": firm_id, "year": year, "chunks": n_chunks,
+                 "ai_chunk_ids": ai_ids, "est_tokens": est_tokens}
+        if error is not None:
+            entry["error"] = error
+        files.append(entry)
+        stats = by_year[year]
+        stats["files"] += 1
+        stats["files_failed"] += error is not None
+        stats["files_with_ai"] += bool(ai_ids)
+        stats["chunks"] += n_chunks
+        stats["ai_chunks"] += len(ai_ids)
+        stats["est_tokens"] += est_tokens
+
+    calls = sum(len(f["ai_chunk_ids"]) for f in files)
+    throughput = max(1, concurrency) / latency
+    if target_rate:
+        throughput = min(throughput, target_rate)
+    summary = {
+        "files": len(files),
+        "files_with_ai": sum(bool(f["ai_chunk_ids"]) for f in files),
+        "files_failed": sum("error" in f for f in files),
+        "chunks": sum(f["chunks"] for f in files),
+        "ai_chunks": calls,
+        "est_tokens": sum(f["est_tokens"] for f in files),
+        "tokens_per_char": tokens_per_char,
+        "latency": latency,
+        "target_rate": target_rate,
+        "concurrency": concurrency,
+        "est_wall_seconds": calls / throughput,
+        "extract_seconds": extract_time,
+    }
+    plan = {
+        "version": PLAN_VERSION,
+        "pdf_dir": pdf_dir,
+        "loader": loader_params,
+        "summary": summary,
+        "by_year": dict(sorted(by_year.items(), key=lambda kv: str(kv[0]))),
+        "files": files,
+    }
+    plan_path = output_csv + ".plan.json"
+    tmp_path = plan_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(plan, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, plan_path)
+    report(plan)
+    print(f"[DryRun] 计划已保存：{os.path.abspath(plan_path)}")
+    return plan
+
+
+def report(plan):
+    s = plan["summary"]
+    print(f"\n=== Dry run：{s['files']} 个文件，读取与分块用时 {s['extract_seconds']:.1f}s ===")
+    print(f"{'year':<8}{'files':>8}{'with_ai':>9}{'failed':>8}{'chunks':>9}{'ai_chunks':>11}{'est_tokens':>13}")
+    for year, y in plan["by_year"].items():
+        print(f"{str(year):<8}{y['files']:>8}{y['files_with_ai']:>9}{y['files_failed']:>8}{y['chunks']:>9}"
+              f"{y['ai_chunks']:>11}{y['est_tokens']:>13}")
+    rate = "不限" if s["target_rate"] is None else f"{s['target_rate']} 次/秒"
+    print(f"合计：需打分 {s['ai_chunks']} 个 chunk（共 {s['chunks']} 个），估算 {s['est_tokens']} tokens；"
+          f"按并发 {s['concurrency']}、单次延迟 {s['latency']:.2f}s、速率上限 {rate}，"
+          f"预计耗时 {s['est_wall_seconds']:.0f}s（{s['est_wall_seconds'] / 3600:.2f} 小时）")
+    if s["files_failed"]:
+        print(f"读取出错 {s['files_failed']} 个文件（未计入估算；正式运行时跳过，retry_failed=True 时重新读取）：")
+        for f in plan["files"]:
+            if "error" in f:
+                print(f"    {f['fname']}: {f['error']}")
+
+
+def load_plan(plan_path, loader_params):
+    """读取计划；分块参数与本次运行不一致时 chunk 编号会对不上，直接报错。"""
+    with open(plan_path, "r", encoding="utf-8") as f:
+        plan = json.load(f)
+    if plan.get("version") != PLAN_VERSION:
+        raise ValueError(f"计划版本不匹配：{plan.get('version')} != {PLAN_VERSION}，请重新试运行")
+    if plan["loader"] != loader_params:
+        raise ValueError(f"计划的分块参数 {plan['loader']} 与本次运行 {loader_params} 不一致，请重新试运行")
+    return plan
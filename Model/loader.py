@@ -3,6 +3,7 @@ import re
 from typing import List, Dict
 from langchain_community.document_loaders import PyPDFLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
+from timer import METRICS
 
 HEADING_VARIANTS = [
     "管理层讨论与分析",
@@ -35,36 +36,57 @@ class ReportLoader:
         return "\n".join(sections) if sections else ""
 
     def load_and_chunk(self, pdf_path):
-        loader = PyPDFLoader(pdf_path)
-        pages = loader.load()[self.skip_pages:]
-        full_text = "\n".join(p.page_content for p in pages)
+        with METRICS.timer("load"):
+            return self._load_and_chunk(pdf_path)
+
+    def _load_and_chunk(self, pdf_path):
+        with METRICS.timer("pdf_parse"):
+            loader = PyPDFLoader(pdf_path)
+            pages = loader.load()[self.skip_pages:]
+            full_text = "\n".join(p.page_content for p in pages)
 
         if not any(h in full_text for h in HEADING_VARIANTS):
             self.failed_to_read.append(os.path.basename(pdf_path))
+            METRICS.count("files_failed_to_read")
             return []
 
-        content = self.extract_sections(full_text)
+        with METRICS.timer("extract_sections"):
+            content = self.extract_sections(full_text)
         if not content:
             self.failed_to_read.append(os.path.basename(pdf_path))
+            METRICS.count("files_failed_to_read")
             return []
 
-        splitter = RecursiveCharacterTextSplitter(
-            separators=["\n\n", "\n", ".", " ", ""],
-            chunk_size=self.chunk_size,
-            chunk_overlap=self.chunk_overlap
-        )
-        return splitter.split_text(content)
+        with METRICS.timer("split"):
+            splitter = RecursiveCharacterTextSplitter(
+                separators=["\n\n", "\n", ".", " ", ""],
+                chunk_size=self.chunk_size,
+                chunk_overlap=self.chunk_overlap
+            )
+            chunks = splitter.split_text(content)
+        METRICS.count("files_loaded")
+        METRICS.count("chunks_loaded", len(chunks))
+        return chunks
 
-    def iter_files(self, pdf_dir, num_files = None):
+    def list_files(self, pdf_dir, num_files = None):
         all_files = sorted(
             f for f in os.listdir(pdf_dir)
             if os.path.isfile(os.path.join(pdf_dir, f)) and f.lower().endswith(".pdf")
         )
         if num_files:
             all_files = all_files[:num_files]
+        return all_files
 
+    def iter_files(self, pdf_dir, num_files = None, skip = None, files = None):
+        """
+        skip: 可选的 fname -> bool 函数，返回 True 的文件不读取、不返回（如续跑时已完成的文件）
+        files: 可选的文件名列表（如 dry_run.py 生成的计划），给出时不再列目录
+        """
+        all_files = self.list_files(pdf_dir, num_files) if files is None else files
 
         for fname in all_files:
+            if skip is not None and skip(fname):
+                continue
             path = os.path.join(pdf_dir, fname)
             chunks = self.load_and_chunk(path)
             yield fname, chunks
@@ -0,0 +1,196 @@
+"""
+parquet_sink.py
+
+chunk 级得分的列式输出（可选，需要 pyarrow）。
+
+数据集按 year 分区：<root_dir>/year=2023/<part>.parquet，列类型固定：
+    fname: string, firm_id: string（保留前导 0）, year: int16, chunk_id: int32,
+    chunk_len: int32, score: float64, ai_flag: int8
+
+ParquetChunkSink 可作为 GroupCommitWriter 的 sink 使用：行先在内存中缓冲，满 rows_per_file 行或 close() 时
+才写出（每个 year 分区一个文件），避免每个提交分组都生成一批小文件。
+CSV 与进度清单仍是落盘的主记录：崩溃时缓冲中的行会丢失，续跑前调用 recover(output_csv, manifest)，
+把 CSV 中已提交、数据集中缺少的行补回缓冲区，续跑结束后两份输出一致。
+"""
+import csv
+import os
+import shutil
+import threading
+import uuid
+from typing import Iterable, List, Optional
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow 为可选依赖，仅在使用 Parquet 输出时需要
+    pa = None
+    pq = None
+
+COLUMNS = ["fname", "firm_id", "year", "chunk_id", "chunk_len", "score", "ai_flag"]
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise ImportError("Parquet 输出需要安装 pyarrow：pip install pyarrow")
+
+
+def chunk_schema():
+    _require_pyarrow()
+    return pa.schema([
+        ("fname", pa.string()),
+        ("firm_id", pa.string()),
+        ("year", pa.int16()),
+        ("chunk_id", pa.int32()),
+        ("chunk_len", pa.int32()),
+        ("score", pa.float64()),
+        ("ai_flag", pa.int8()),
+    ])
+
+
+def _to_int(value) -> Optional[int]:
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_float(value) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class ParquetChunkSink:
+    def __init__(self, root_dir: str, rows_per_file: int = 100_000):
+        _require_pyarrow()
+        self.root_dir = root_dir
+        self.rows_per_file = rows_per_file
+        self.schema = chunk_schema()
+        self._columns = {c: [] for c in COLUMNS}
+        self._count = 0
+        self._lock = threading.Lock()
+        os.makedirs(root_dir, exist_ok=True)
+
+    def write_rows(self, rows: Iterable[list]):
+        """rows 的列顺序与结果 CSV 相同：fname, firm_id, year, chunk_id, chunk_len, score, ai_flag"""
+        with self._lock:
+            for fname, firm_id, year, chunk_id, chunk_len, score, ai_flag in rows:
+                self._columns["fname"].append(str(fname))
+                self._columns["firm_id"].append(None if firm_id is None else str(firm_id))
+                self._columns["year"].append(_to_int(year))
+                self._columns["chunk_id"].append(_to_int(chunk_id))
+                self._columns["chunk_len"].append(_to_int(chunk_len))
+                self._columns["score"].append(_to_float(score))
+                self._columns["ai_flag"].append(_to_int(ai_flag))
+                self._count += 1
+            if self._count >= self.rows_per_file:
+                self._flush_locked()
+
+    def recover(self, csv_path: str, manifest=None) -> int:
+        """
+        续跑前调用：把 csv_path 中已提交（manifest 中已记录）但数据集中没有的行补入缓冲区，返回补入的行数。
+        未记入清单的行续跑时会重新打分并经 write_rows 写入，这里跳过，避免重复。
+        """
+        if not os.path.exists(csv_path):
+            return 0
+        existing = self._dataset_keys()
+        recovered = 0
+        batch = []
+        with open(csv_path, "r", newline="", encoding="utf-8") as f:
+            for row in csv.reader(f):
+                if len(row) != len(COLUMNS) or row[0] == "fname":
+                    continue  # 表头或崩溃时写了一半的行
+                chunk_id = _to_int(row[3])
+                key = (row[0], chunk_id)
+                if chunk_id is None or key in existing:
+                    continue
+                if manifest is not None and not manifest.is_chunk_done(row[0], chunk_id):
+                    continue
+                existing.add(key)
+                batch.append(row)
+                if len(batch) >= self.rows_per_file:
+                    self.write_rows(batch)
+                    recovered += len(batch)
+                    batch = []
+        self.write_rows(batch)
+        recovered += len(batch)
+        if recovered:
+            print(f"[Parquet] 从 {csv_path} 补回数据集中缺少的 {recovered} 行")
+        return recovered
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def close(self):
+        self.flush()
+
+    def _dataset_keys(self) -> set:
+        """数据集中已有的 (fname, chunk_id)。"""
+        if not any(name.endswith(".parquet") for _, _, names in os.walk(self.root_dir) for name in names):
+            return set()
+        df = read_chunk_scores(self.root_dir, columns=["fname", "chunk_id"])
+        return set(zip(df["fname"], df["chunk_id"].astype(int)))
+
+    def _flush_locked(self):
+        if not self._count:
+            return
+        table = pa.table(self._columns, schema=self.schema)
+        # 每次写出一个批次：每个 year 分区各生成一个新文件，文件名带随机后缀，多进程写入互不覆盖
+        pq.write_to_dataset(
+            table,
+            root_path=self.root_dir,
+            partition_cols=["year"],
+            basename_template=f"part-{uuid.uuid4().hex[:12]}-{{i}}.parquet",
+        )
+        self._columns = {c: [] for c in COLUMNS}
+        self._count = 0
+
+
+def read_chunk_scores(root_dir: str, columns: Optional[List[str]] = None, years: Optional[Iterable[int]] = None):
+    """
+    读取 Parquet 数据集为 DataFrame，只加载需要的列和年份分区。
+    """
+    _require_pyarrow()
+    import pyarrow.dataset as ds
+
+    dataset = ds.dataset(root_dir, format="parquet",
+                         partitioning=ds.partitioning(pa.schema([("year", pa.int16())]), flavor="hive"))
+    row_filter = ds.field("year").isin([int(y) for y in years]) if years is not None else None
+    return dataset.to_table(columns=columns, filter=row_filter).to_pandas()
+
+
+def csv_to_parquet(csv_path: str, root_dir: str, batch_rows: int = 500_000, overwrite: bool = False):
+    """
+    将已有的 chunk_scores.csv 转换为分区 Parquet 数据集（分批读取，内存占用有界）。
+    先写到临时目录，完成后再换入 root_dir；root_dir 非空时需 overwrite=True（整体替换，不会在旧数据上追加重复行）。
+    """
+    _require_pyarrow()
+    import pandas as pd
+
+    if os.path.isdir(root_dir) and os.listdir(root_dir) and not overwrite:
+        raise ValueError(f"{root_dir} 非空：追加会产生重复行，请传入 overwrite=True 整体重建")
+
+    parent = os.path.dirname(os.path.abspath(root_dir))
+    suffix = uuid.uuid4().hex[:12]
+    tmp_dir = os.path.join(parent, f".{os.path.basename(root_dir)}.tmp-{suffix}")
+    try:
+        sink = ParquetChunkSink(tmp_dir, rows_per_file=batch_rows)
+        for batch in pd.read_csv(csv_path, dtype={"fname": str, "firm_id": str, "year": str},
+                                 chunksize=batch_rows):
+            batch = batch[COLUMNS].astype(object)
+            batch = batch.where(batch.notna(), None)
+            sink.write_rows(batch.itertuples(index=False, name=None))
+        sink.close()
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    old_dir = None
+    if os.path.exists(root_dir):
+        old_dir = os.path.join(parent, f".{os.path.basename(root_dir)}.old-{suffix}")
+        os.replace(root_dir, old_dir)
+    os.replace(tmp_dir, root_dir)
+    if old_dir is not None:
+        shutil.rmtree(old_dir, ignore_errors=True)
@@ -0,0 +1,232 @@
+"""
+pipeline.py
+
+爬取 → 读取 → 打分 的流式流水线：三个阶段同时运行，不必等整个爬取结束再开始打分。
+
+    爬虫（FuncScraper / AsyncScraper，后台线程）
+        每下载完成一份年报，通过 customer_req["on_download"] 把路径放入持久化队列（report_queue.py）
+    读取（loader_workers 个线程）
+        从队列取出年报，用 ReportLoader 读取 PDF、提取章节并分块，放入有界的内存队列
+    打分（scorer_workers 个线程）
+        对每份年报调用 scoring_chunks.score_file（关键词预筛、重试、写结果与进度清单），提交后从队列确认
+
+背压：内存队列最多存放 max_loaded_files 份已分块的年报，打分跟不上时读取线程阻塞；
+持久化队列中待处理的年报超过 max_pending 时（可选），爬虫的下载线程在回调中等待。
+打分失败的年报放回持久化队列，由读取线程重新取出（读取线程在所有已取出的年报确认或放回之前不会退出）。
+崩溃后重新运行即可继续：队列中未确认的年报会重新处理，已完成的 chunk 由进度清单跳过；
+seed_existing=True 时，目录中已有但未入队的年报（如先前单独爬取的）也会入队。
+"""
+import os
+import queue
+import sys
+import threading
+import time
+
+from loader import ReportLoader
+from scorer import GLM4FlashJsonScorer
+from report_queue import ReportQueue
+from result_writer import GroupCommitWriter
+from progress_manifest import ProgressManifest
+from scoring_chunks import ensure_csv_header, score_file, FLUSH_ROWS, FLUSH_INTERVAL_MS
+import local_settings
+from timer import Timer, METRICS
+from usage import UsageLedger
+
+SPIDER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Spider", "scrape-cop-reports-CnInfo")
+
+POLL_INTERVAL = 1.0  # 队列为空时的轮询间隔（秒）
+
+
+class ScoringPipeline:
+    def __init__(self, report_queue: ReportQueue, loader: ReportLoader, scorer, writer: GroupCommitWriter,
+                 manifest: ProgressManifest, loader_workers: int = 2, scorer_workers: int = 4,
+                 max_loaded_files: int = 8, max_pending: int = None, usage: UsageLedger = None, store=None):
+        self.report_queue = report_queue
+        self.loader = loader
+        self.scorer = scorer
+        self.writer = writer
+        self.manifest = manifest
+        self.loader_workers = max(1, loader_workers)
+        self.scorer_workers = max(1, scorer_workers)
+        self.max_pending = max_pending
+        self.usage = usage
+        self.store = store
+        self._loaded = queue.Queue(maxsize=max(1, max_loaded_files))
+        self._producers_done = threading.Event()
+        self._loader_threads = []
+        self._threads = []
+        self.files_scored = 0
+        self.files_failed = 0
+        self._in_flight = 0  # 已取出、尚未确认或放回队列的年报数
+        self._count_lock = threading.Lock()
+
+    def on_download(self, path: str):
+        """爬虫的下载完成回调：入队；待处理过多时等待打分追上。"""
+        self.report_queue.put(path)
+        if self.max_pending:
+            while self.report_queue.pending_count() > self.max_pending and not self._producers_done.is_set():
+                time.sleep(POLL_INTERVAL)
+
+    def start(self):
+        loaders = [threading.Thread(target=self._load_loop, name=f"ReportLoader-{i}", daemon=True)
+                   for i in range(self.loader_workers)]
+        scorers = [threading.Thread(target=self._score_loop, name=f"Scorer-{i}", daemon=True)
+                   for i in range(self.scorer_workers)]
+        self._loader_threads = loaders
+        self._threads = loaders + scorers
+        for t in self._threads:
+            t.start()
+
+    def finish(self):
+        """生产者（爬虫）已结束：处理完队列中剩余的年报后返回。"""
+        self._producers_done.set()
+        for t in self._loader_threads:
+            t.join()
+        for _ in range(self.scorer_workers):
+            self._loaded.put(None)
+        for t in self._threads:
+            t.join()
+
+    # ------------------------------------------------------------------
+    # 内部实现
+    # ------------------------------------------------------------------
+    def _load_loop(self):
+        while True:
+            with self._count_lock:
+                path = self.report_queue.claim()
+                if path is not None:
+                    self._in_flight += 1
+                # 爬取结束、队列已空且没有正在处理的年报才退出：打分失败的年报会放回队列，需要有读取线程重新取出
+                done = (path is None and self._producers_done.is_set() and self._in_flight == 0
+                        and self.report_queue.pending_count() == 0)
+            if done:
+                return
+            if path is None:
+                time.sleep(POLL_INTERVAL)
+                continue
+            fname = os.path.basename(path)
+            if self.manifest.is_file_done(fname):
+                self._settle(path, ok=True)
+                continue
+            try:
+                chunks = self.loader.load_and_chunk(path)
+            except Exception as e:
+                print(f"[Pipeline] 读取失败：{fname} -> {e}")
+                self._settle(path, ok=False)
+                continue
+            # 队列满时阻塞，直到打分线程取走（背压）
+            self._loaded.put((path, fname, chunks))
+
+    def _score_loop(self):
+        while True:
+            item = self._loaded.get()
+            if item is None:
+                return
+            path, fname, chunks = item
+            try:
+                print(f"\n=== Scoring {fname} (chunks: {len(chunks)}) ===")
+                score_file(self.scorer, self.writer, self.manifest, fname, chunks, usage=self.usage,
+                           store=self.store)
+                # 结果和完成标记落盘后才从队列确认，崩溃时该年报会重新处理
+                self.writer.flush()
+                self._settle(path, ok=True, scored=True)
+            except Exception as e:
+                print(f"[Pipeline] 打分失败：{fname} -> {e}")
+                self._settle(path, ok=False)
+
+    def _settle(self, path, ok, scored=False):
+        """确认或放回一份已取出的年报，并更新计数（与 claim 在同一把锁下，读取线程据此判断能否退出）。"""
+        with self._count_lock:
+            if ok:
+                self.report_queue.ack(path)
+            else:
+                self.report_queue.fail(path)
+                self.files_failed += 1
+            self.files_scored += scored
+            self._in_flight -= 1
+
+
+def _run_spider(customer_req):
+    """在当前进程中运行爬虫（线程模式或异步模式，与 spider.py 相同）。"""
+    if SPIDER_DIR not in sys.path:
+        sys.path.append(SPIDER_DIR)
+    if customer_req.get("async_mode", 0) == 1:
+        import AsyncScraper
+        AsyncScraper.main(customer_req)
+    else:
+        import FuncScraper
+        FuncScraper.main(customer_req)
+
+
+def run_pipeline(customer_req=None, output_csv: str = "chunk_scores.csv", queue_db: str = None,
+                 loader_workers: int = 2, scorer_workers: int = 4, max_loaded_files: int = 8,
+                 max_pending: int = None, seed_existing: bool = True, parquet_dir: str = None,
+                 store_db: str = None):
+    """
+    customer_req：爬虫配置（与 spider.py 相同）；为 None 时只处理队列和已有年报，不爬取。
+    queue_db：持久化队列路径，默认为 <output_csv>.queue.db。
+    """
+    reading_path = local_settings.YEARLY_REPORTS_PATH
+    api_key = local_settings.GLM4_FLASH_API_KEY
+
+    loader = ReportLoader(skip_pages=5, chunk_size=2000, chunk_overlap=500)
+    scorer = GLM4FlashJsonScorer(api_key=api_key, model="glm-4-flash")
+
+    ensure_csv_header(output_csv)
+    manifest = ProgressManifest.for_output(output_csv)
+    report_queue = ReportQueue(queue_db or output_csv + ".queue.db")
+    if seed_existing and os.path.isdir(reading_path):
+        report_queue.put_many(
+            os.path.join(reading_path, f) for f in sorted(os.listdir(reading_path))
+            if f.lower().endswith(".pdf") and not manifest.is_file_done(f))
+
+    sinks = []
+    if parquet_dir:
+        from parquet_sink import ParquetChunkSink
+        parquet_sink = ParquetChunkSink(parquet_dir)
+        parquet_sink.recover(output_csv, manifest)
+        sinks.append(parquet_sink)
+    store = None
+    if store_db:
+        from result_store import SQLiteResultStore
+        store = SQLiteResultStore(store_db, prompt_version=scorer.PROMPT_VERSION, model=scorer.model)
+        sinks.append(store)
+    writer = GroupCommitWriter(output_csv, flush_rows=FLUSH_ROWS, flush_interval_ms=FLUSH_INTERVAL_MS,
+                               manifest=manifest, sinks=sinks)
+    usage = UsageLedger.for_output(output_csv, model=scorer.model)
+
+    pipeline = ScoringPipeline(report_queue, loader, scorer, writer, manifest, loader_workers=loader_workers,
+                               scorer_workers=scorer_workers, max_loaded_files=max_loaded_files,
+                               max_pending=max_pending, usage=usage, store=store)
+
+    METRICS.reset()
+    overall_timer = Timer(name="Overall pipeline")
+    overall_timer.start()
+    pipeline.start()
+    try:
+        if customer_req is not None:
+            _run_spider(dict(customer_req, file_download=1, on_download=pipeline.on_download))
+    finally:
+        pipeline.finish()
+        writer.close()
+    elapsed = overall_timer.stop()
+
+    counts = report_queue.counts()
+    report_queue.close()
+    print(f"\nTimer 'Overall pipeline': {elapsed:.4f} seconds")
+    METRICS.report()
+    METRICS.write_report(output_csv)
+    usage.report(elapsed)
+    usage.write_file_summary()
+    print(f"[Pipeline] 打分完成 {pipeline.files_scored} 份，失败 {pipeline.files_failed} 次；队列状态 {counts}")
+    if loader.failed_to_read:
+        print(f"[Pipeline] 未能提取正文的文件: {loader.failed_to_read}")
+    print(f"结果写入: {os.path.abspath(output_csv)}")
+
+
+if __name__ == "__main__":
+    sys.path.append(SPIDER_DIR)
+    from spider import customer_req as spider_req  # 爬虫配置沿用 spider.py，下载目录应与 YEARLY_REPORTS_PATH 一致
+
+    output_path = r"C:\Code\Article\Output\chunk_scores.csv"
+    run_pipeline(spider_req, output_csv=output_path)
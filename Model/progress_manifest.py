@@ -0,0 +1,203 @@
+"""
+progress_manifest.py
+
+断点续跑用的进度清单（sidecar 文件，默认为 <output_csv>.progress）。
+
+文件为仅追加的文本，每行一条记录：
+    C\t<fname>\t<chunk_id>    某个 chunk 已写入结果 CSV
+    F\t<fname>                某个文件的全部 chunk 均已处理完
+
+启动时只读取清单而不是结果 CSV，已完成文件的 C 记录在加载时被压缩掉，
+因此清单大小约等于“文件数 + 进行中文件的 chunk 数”，与结果 CSV 的大小无关。
+chunk 可以乱序完成，续跑时精确跳过已完成的 (fname, chunk_id)。
+
+多个进程可以共用同一个清单：追加和压缩都持有锁文件 <清单>.lock 上的排他锁，
+压缩在加锁后重新读取清单，不会丢失其他进程在此之前追加的行。
+"""
+import os
+import csv
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, Set, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+COMPACT_MIN_LINES = 1000  # 可压缩的冗余行数超过该值时，加载后重写清单
+
+
+class ProgressManifest:
+    def __init__(self, path: str):
+        self.path = path
+        self.lock_path = path + ".lock"
+        self._done_files: Set[str] = set()
+        self._done_chunks: Dict[str, Set[int]] = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    @classmethod
+    def for_output(cls, output_csv: str) -> "ProgressManifest":
+        """
+        打开 output_csv 对应的清单；若清单不存在而 CSV 中已有数据（旧版本产生的结果），
+        则流式扫描一次 CSV 生成清单，之后启动不再读取 CSV。
+        """
+        path = output_csv + ".progress"
+        if not os.path.exists(path) and os.path.exists(output_csv):
+            _bootstrap_from_csv(output_csv, path)
+        return cls(path)
+
+    # ------------------------------------------------------------------
+    # 查询
+    # ------------------------------------------------------------------
+    def is_file_done(self, fname: str) -> bool:
+        return fname in self._done_files
+
+    def is_chunk_done(self, fname: str, chunk_id: int) -> bool:
+        if fname in self._done_files:
+            return True
+        return chunk_id in self._done_chunks.get(fname, ())
+
+    def has_chunks(self, fname: str) -> bool:
+        """该文件是否已有写入结果的 chunk（用于判断续跑时是否还需要写 ai_flag=0 的默认行）。"""
+        return bool(self._done_chunks.get(fname))
+
+    @property
+    def done_file_count(self) -> int:
+        return len(self._done_files)
+
+    # ------------------------------------------------------------------
+    # 记录（线程安全；多进程下由锁文件互斥）
+    # ------------------------------------------------------------------
+    def record(self, chunk_keys: Iterable[Tuple[str, int]] = (), done_files: Iterable[str] = ()):
+        lines = []
+        with self._lock:
+            for fname, chunk_id in chunk_keys:
+                chunk_id = int(chunk_id)
+                self._done_chunks.setdefault(fname, set()).add(chunk_id)
+                lines.append(f"C\t{fname}\t{chunk_id}\n")
+            for fname in done_files:
+                self._done_files.add(fname)
+                lines.append(f"F\t{fname}\n")
+            if lines:
+                with _file_lock(self.lock_path):
+                    _append_lines(self.path, lines)
+
+    # ------------------------------------------------------------------
+    # 内部实现
+    # ------------------------------------------------------------------
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        total_lines = self._read()
+        live_lines = len(self._done_files) + sum(len(s) for s in self._done_chunks.values())
+        if total_lines - live_lines > COMPACT_MIN_LINES:
+            with _file_lock(self.lock_path):
+                # 加锁后重新读取：包含其他进程在第一次读取之后追加的行
+                self._done_files.clear()
+                self._done_chunks.clear()
+                self._read()
+                self._compact()
+
+    def _read(self) -> int:
+        """读取清单，返回总行数。"""
+        total_lines = 0
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                parts = line.rstrip("\n").split("\t")
+                total_lines += 1
+                if parts[0] == "C" and len(parts) == 3:
+                    try:
+                        self._done_chunks.setdefault(parts[1], set()).add(int(parts[2]))
+                    except ValueError:
+                        continue  # 崩溃时写了一半的行
+                elif parts[0] == "F" and len(parts) == 2:
+                    self._done_files.add(parts[1])
+
+        # 已完成文件的 chunk 记录不再需要
+        for fname in self._done_files:
+            self._done_chunks.pop(fname, None)
+        return total_lines
+
+    def _compact(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for fname in sorted(self._done_files):
+                f.write(f"F\t{fname}\n")
+            for fname, ids in self._done_chunks.items():
+                for chunk_id in sorted(ids):
+                    f.write(f"C\t{fname}\t{chunk_id}\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+
+@contextmanager
+def _file_lock(lock_path: str):
+    """锁文件上的跨进程排他锁（锁文件本身从不替换，因此压缩时 os.replace 清单不影响互斥）。"""
+    with open(lock_path, "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+                    break
+                except OSError:
+                    time.sleep(0.01)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _append_lines(path: str, lines):
+    with open(path, "a", encoding="utf-8") as f:
+        f.write("".join(lines))
+        f.flush()
+        try:
+            os.fsync(f.fileno())
+        except Exception:
+            pass
+
+
+def _bootstrap_from_csv(output_csv: str, manifest_path: str):
+    """
+    从旧的结果 CSV 生成清单（只在第一次升级时执行一次）。
+    旧版本按文件顺序写入，因此除最后一个文件外都视为已完成，只需保留最后一个文件的 chunk 记录。
+    """
+    print(f"[ProgressManifest] 未找到进度清单，从 {output_csv} 生成...")
+    done_files = []
+    last_fname, last_ids = None, []
+    with open(output_csv, "r", encoding="utf-8", newline="") as f:
+        for row in csv.reader(f):
+            if len(row) < 4 or row[0].strip().lower() == "fname":
+                continue
+            fname = row[0].strip()
+            try:
+                chunk_id = int(float(row[3]))
+            except ValueError:
+                continue
+            if fname != last_fname:
+                if last_fname is not None:
+                    done_files.append(last_fname)
+                last_fname, last_ids = fname, []
+            last_ids.append(chunk_id)
+
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for fname in done_files:
+            f.write(f"F\t{fname}\n")
+        for chunk_id in last_ids:
+            f.write(f"C\t{last_fname}\t{chunk_id}\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, manifest_path)
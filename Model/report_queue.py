@@ -0,0 +1,121 @@
+"""
+report_queue.py
+
+待打分年报的持久化队列（SQLite，WAL 模式），连接爬虫和打分流水线（pipeline.py）。
+
+爬虫每下载完成一份年报就 put(path)；ReportLoader 工作线程 claim() 取出一份读取，
+打分并提交结果后 ack(path)，读取失败时 fail(path) 放回队列（超过 max_attempts 次后标记为 failed）。
+同一路径只入队一次（主键去重）。进程崩溃时处于 claimed 状态的记录在下次打开时放回 pending，
+因此已下载但尚未打分的年报不会丢失。
+
+状态：pending → claimed → done / failed
+"""
+import sqlite3
+import threading
+import time
+from typing import Iterable, Optional
+
+PENDING = "pending"
+CLAIMED = "claimed"
+DONE = "done"
+FAILED = "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS report_queue (
+    path        TEXT    PRIMARY KEY,
+    status      TEXT    NOT NULL,
+    attempts    INTEGER NOT NULL DEFAULT 0,
+    enqueued_at REAL,
+    updated_at  REAL
+)
+"""
+_INDEX = "CREATE INDEX IF NOT EXISTS report_queue_status ON report_queue (status, enqueued_at)"
+
+
+class ReportQueue:
+    def __init__(self, db_path: str, max_attempts: int = 3, timeout: float = 60.0):
+        self.db_path = db_path
+        self.max_attempts = max_attempts
+        # 进程内共用一个连接，由锁串行化（爬虫的下载线程和流水线的读取线程都会访问）
+        self._conn = sqlite3.connect(db_path, timeout=timeout, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(f"PRAGMA busy_timeout={int(timeout * 1000)}")
+            self._conn.execute(_SCHEMA)
+            self._conn.execute(_INDEX)
+            # 上次运行中途退出时已取出但未完成的记录
+            self._conn.execute("UPDATE report_queue SET status = ? WHERE status = ?", (PENDING, CLAIMED))
+
+    def put(self, path: str):
+        """入队一份年报；已在队列中（任意状态）的路径忽略。可作为爬虫的 on_download 回调。"""
+        self.put_many([path])
+
+    def put_many(self, paths: Iterable[str]):
+        now = time.time()
+        params = [(str(path), PENDING, now, now) for path in paths]
+        if not params:
+            return
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO report_queue (path, status, enqueued_at, updated_at) VALUES (?, ?, ?, ?)",
+                    params)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def claim(self) -> Optional[str]:
+        """取出最早入队的一份 pending 年报并标记为 claimed；队列为空时返回 None。"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT path FROM report_queue WHERE status = ? ORDER BY enqueued_at LIMIT 1",
+                    (PENDING,)).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE report_queue SET status = ?, attempts = attempts + 1, updated_at = ? WHERE path = ?",
+                        (CLAIMED, time.time(), row[0]))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return None if row is None else row[0]
+
+    def ack(self, path: str):
+        """该年报已打分完成（结果已提交）。"""
+        self._set_status(path, DONE)
+
+    def fail(self, path: str):
+        """处理失败：尝试次数未用完时放回 pending，否则标记为 failed。"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE report_queue SET status = CASE WHEN attempts >= ? THEN ? ELSE ? END, updated_at = ? "
+                "WHERE path = ?",
+                (self.max_attempts, FAILED, PENDING, time.time(), path))
+
+    def counts(self) -> dict:
+        """各状态的记录数。"""
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM report_queue GROUP BY status").fetchall()
+        counts = {PENDING: 0, CLAIMED: 0, DONE: 0, FAILED: 0}
+        counts.update(rows)
+        return counts
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM report_queue WHERE status = ?", (PENDING,)).fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _set_status(self, path: str, status: str):
+        with self._lock:
+            self._conn.execute("UPDATE report_queue SET status = ?, updated_at = ? WHERE path = ?",
+                               (status, time.time(), path))
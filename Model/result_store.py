@@ -0,0 +1,125 @@
+"""
+result_store.py
+
+基于 SQLite（WAL 模式）的打分结果库。
+
+主键为 (fname, chunk_id, prompt_version, model)，写入采用 upsert：同一 chunk 重复写入只保留最后一次结果，
+崩溃后重跑不会产生重复行。WAL 模式下同一台机器上的多个打分进程可以同时写同一个库，
+写事务由 SQLite 串行化（busy_timeout 内自动等待），无需额外协调。
+
+可作为 GroupCommitWriter 的 sink 使用（write_rows），也可用 export_csv() 导出为原 chunk_scores.csv 格式。
+"""
+import csv
+import sqlite3
+import threading
+import time
+from typing import Iterable, Optional
+
+CSV_COLUMNS = ["fname", "firm_id", "year", "chunk_id", "chunk_len", "score", "ai_flag"]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunk_scores (
+    fname          TEXT    NOT NULL,
+    chunk_id       INTEGER NOT NULL,
+    prompt_version TEXT    NOT NULL,
+    model          TEXT    NOT NULL,
+    firm_id        TEXT,
+    year           TEXT,
+    chunk_len      INTEGER,
+    score          REAL,
+    ai_flag        INTEGER,
+    updated_at     REAL,
+    PRIMARY KEY (fname, chunk_id, prompt_version, model)
+)
+"""
+
+_UPSERT = """
+INSERT INTO chunk_scores (fname, chunk_id, prompt_version, model, firm_id, year, chunk_len, score, ai_flag, updated_at)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (fname, chunk_id, prompt_version, model) DO UPDATE SET
+    firm_id = excluded.firm_id,
+    year = excluded.year,
+    chunk_len = excluded.chunk_len,
+    score = excluded.score,
+    ai_flag = excluded.ai_flag,
+    updated_at = excluded.updated_at
+"""
+
+
+class SQLiteResultStore:
+    def __init__(self, db_path: str, prompt_version: str, model: str, timeout: float = 60.0):
+        self.db_path = db_path
+        self.prompt_version = prompt_version
+        self.model = model
+        # 进程内共用一个连接，由锁串行化；进程间并发由 WAL + busy_timeout 处理
+        self._conn = sqlite3.connect(db_path, timeout=timeout, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(f"PRAGMA busy_timeout={int(timeout * 1000)}")
+            self._conn.execute(_SCHEMA)
+
+    def upsert_rows(self, rows: Iterable[list]):
+        """
+        批量 upsert，一批在一个事务内提交。
+        rows 的列顺序与结果 CSV 相同：fname, firm_id, year, chunk_id, chunk_len, score, ai_flag
+        """
+        now = time.time()
+        params = [
+            (str(fname), int(chunk_id), self.prompt_version, self.model,
+             None if firm_id is None else str(firm_id), None if year is None else str(year),
+             chunk_len, score, ai_flag, now)
+            for fname, firm_id, year, chunk_id, chunk_len, score, ai_flag in rows
+        ]
+        if not params:
+            return
+        with self._lock:
+            # BEGIN IMMEDIATE：一开始就拿写锁，避免多进程下读锁升级失败
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(_UPSERT, params)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    # 作为 GroupCommitWriter 的 sink
+    write_rows = upsert_rows
+
+    def completed_chunk_ids(self, fname: str) -> set:
+        with self._lock:
+            cur = self._conn.execute(
+                "SELECT chunk_id FROM chunk_scores WHERE fname = ? AND prompt_version = ? AND model = ?",
+                (fname, self.prompt_version, self.model))
+            return {r[0] for r in cur.fetchall()}
+
+    def count(self) -> int:
+        with self._lock:
+            cur = self._conn.execute(
+                "SELECT COUNT(*) FROM chunk_scores WHERE prompt_version = ? AND model = ?",
+                (self.prompt_version, self.model))
+            return cur.fetchone()[0]
+
+    def export_csv(self, output_csv: str, prompt_version: Optional[str] = None, model: Optional[str] = None):
+        """导出为原 chunk_scores.csv 的列格式（每个 chunk 一行，按 fname、chunk_id 排序）。"""
+        prompt_version = prompt_version or self.prompt_version
+        model = model or self.model
+        with self._lock:
+            cur = self._conn.execute(
+                "SELECT fname, firm_id, year, chunk_id, chunk_len, score, ai_flag FROM chunk_scores "
+                "WHERE prompt_version = ? AND model = ? ORDER BY fname, chunk_id",
+                (prompt_version, model))
+            with open(output_csv, "w", newline="", encoding="utf-8") as f:
+                writer = csv.writer(f)
+                writer.writerow(CSV_COLUMNS)
+                while True:
+                    batch = cur.fetchmany(10_000)
+                    if not batch:
+                        break
+                    writer.writerows(batch)
+        print(f"[SQLiteResultStore] 已导出到 {output_csv}")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,172 @@
+"""
+result_writer.py
+
+分组提交（group commit）的 CSV 结果写入器。
+
+多个打分线程可以同时调用 write()，行先进入内存缓冲区，满足以下任一条件时整组写入并 fsync：
+    1. 缓冲区行数达到 flush_rows；
+    2. 距离第一条未提交行已超过 flush_interval_ms 毫秒（由后台线程触发）；
+    3. 显式调用 flush() / close()。
+
+崩溃安全性：fsync 返回后整组数据已落盘；崩溃时最多丢失尚未提交的那一组
+（原 safe_write_row 的逐行保证，粒度变为分组）。
+写盘出错（磁盘满、EIO）时 CSV 截断回写入前的长度，该组放回缓冲区头部后重新抛出异常，
+后续分组和清单不会越过这一组继续提交。
+若传入 manifest（progress_manifest.ProgressManifest），每组在 CSV fsync 之后才记入清单，
+因此清单中记录的 (fname, chunk_id) 一定已经在 CSV 中。
+sinks 为附加输出（如 parquet_sink.ParquetChunkSink），每组提交后调用 sink.write_rows(group)，close() 时一并关闭。
+sink 可以自行缓冲，崩溃后由 sink 从 CSV 和清单补齐（见 ParquetChunkSink.recover）。
+"""
+import os
+import csv
+import threading
+import time
+from typing import List, Optional
+
+from timer import METRICS
+
+
+class GroupCommitWriter:
+    def __init__(self, output_csv: str, flush_rows: int = 50, flush_interval_ms: int = 500, manifest=None,
+                 sinks=()):
+        self.output_csv = output_csv
+        self.manifest = manifest
+        self.sinks = list(sinks)
+        self.flush_rows = max(1, int(flush_rows))
+        self.flush_interval = max(0, flush_interval_ms) / 1000.0
+
+        self._buffer: List[list] = []
+        self._done_files: List[str] = []
+        self._first_pending_at: Optional[float] = None
+        self._lock = threading.Lock()            # 保护缓冲区
+        self._commit_lock = threading.Lock()     # 保证同一时刻只有一个分组在写盘
+        self._wakeup = threading.Condition(self._lock)
+        self._closed = False
+
+        self.rows_written = 0
+        self.groups_committed = 0
+
+        self._flusher = None
+        if self.flush_interval > 0:
+            self._flusher = threading.Thread(target=self._flush_loop, name="GroupCommitWriter", daemon=True)
+            self._flusher.start()
+
+    # ------------------------------------------------------------------
+    # 对外接口
+    # ------------------------------------------------------------------
+    def write(self, row: list):
+        """写入一行；缓冲区满时由调用线程同步提交该分组。"""
+        self.write_many([row])
+
+    def write_many(self, rows: List[list]):
+        if not rows:
+            return
+        with self._lock:
+            if self._closed:
+                raise RuntimeError(f"GroupCommitWriter({self.output_csv}) 已关闭")
+            if self._first_pending_at is None:
+                self._first_pending_at = time.monotonic()
+                self._wakeup.notify()
+            self._buffer.extend(rows)
+            full = len(self._buffer) >= self.flush_rows
+        if full:
+            self.flush()
+
+    def mark_file_done(self, fname: str):
+        """标记文件已全部处理；随该文件最后一行所在的分组（或之后的分组）一起记入清单。"""
+        with self._lock:
+            if self._first_pending_at is None:
+                self._first_pending_at = time.monotonic()
+                self._wakeup.notify()
+            self._done_files.append(fname)
+
+    def flush(self):
+        """立即提交缓冲区中的全部行。"""
+        # 先拿 _commit_lock 再取分组：分组的取出顺序与落盘顺序一致，写盘期间其他线程仍可继续缓冲
+        with self._commit_lock:
+            with self._lock:
+                group, done_files = self._take_group_locked()
+            if group:
+                try:
+                    self._write_group(group)
+                except Exception:
+                    with self._lock:
+                        self._restore_group_locked(group, done_files)
+                    raise
+                for sink in self.sinks:
+                    sink.write_rows(group)
+            if self.manifest is not None and (group or done_files):
+                self.manifest.record(((row[0], row[3]) for row in group), done_files)
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._wakeup.notify()
+        if self._flusher is not None:
+            self._flusher.join()
+        self.flush()
+        for sink in self.sinks:
+            sink.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    # ------------------------------------------------------------------
+    # 内部实现
+    # ------------------------------------------------------------------
+    def _take_group_locked(self):
+        group, self._buffer = self._buffer, []
+        done_files, self._done_files = self._done_files, []
+        self._first_pending_at = None
+        return group, done_files
+
+    def _restore_group_locked(self, group: List[list], done_files: List[str]):
+        """写盘失败：把取出的分组放回缓冲区头部，保持行的先后顺序，下次 flush 时重试。"""
+        self._buffer = group + self._buffer
+        self._done_files = done_files + self._done_files
+        if self._first_pending_at is None:
+            self._first_pending_at = time.monotonic()
+            self._wakeup.notify()
+
+    def _write_group(self, group: List[list]):
+        with METRICS.timer("csv_write"):
+            start = os.path.getsize(self.output_csv) if os.path.exists(self.output_csv) else 0
+            try:
+                with open(self.output_csv, "a", newline="", encoding="utf-8") as f:
+                    csv.writer(f).writerows(group)
+                    f.flush()
+                    os.fsync(f.fileno())
+            except Exception:
+                # 去掉写了一半的内容，重试时不会留下残行或重复行
+                try:
+                    os.truncate(self.output_csv, start)
+                except OSError:
+                    pass
+                raise
+        self.rows_written += len(group)
+        self.groups_committed += 1
+
+    def _flush_loop(self):
+        while True:
+            with self._lock:
+                while not self._closed and self._first_pending_at is None:
+                    self._wakeup.wait()
+                if self._closed:
+                    return
+                remaining = self._first_pending_at + self.flush_interval - time.monotonic()
+                if remaining > 0:
+                    self._wakeup.wait(remaining)
+                    continue
+            try:
+                self.flush()
+            except Exception as e:
+                # 分组已放回缓冲区：等一个间隔后重试，错误同时会在下一次同步 flush() / close() 中抛出
+                print(f"[GroupCommitWriter] 提交失败，稍后重试：{e}")
+                with self._lock:
+                    if not self._closed:
+                        self._wakeup.wait(self.flush_interval)
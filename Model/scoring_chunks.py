@@ -3,20 +3,29 @@ scoring_chunks_iter.py
 
 使用 ReportLoader.iter_files() 按文件迭代读取年报并对包含 AI 关键词的 chunk 打分。
 输出 CSV 包含列：fname, firm_id, year, chunk_id, chunk_len, score, ai_flag
-
-兼容断点续跑：脚本会读取输出 CSV 的最后一条有效数据行并从该位置继续。
+可选同时输出按 year 分区的 Parquet 数据集（parquet_dir，需要 pyarrow），供聚合/分析按列、按年份读取。
+可选同时写入 SQLite 结果库（store_db，见 result_store.py）：多个打分进程各自使用不同的 output_csv、
+共用同一个 store_db，即可在同一台机器上并发写入，最后用 SQLiteResultStore.export_csv() 导出去重后的 CSV。
+使用 store_db 时，结果库中已有的 chunk（其他进程已打分）直接跳过，不再调用 API，也不写入本进程的 CSV；
+此时以结果库为完整结果。各进程仍会读取每份 PDF，要避免重复读取，可给各进程分配不相交的文件集合。
+
+兼容断点续跑：已完成的 (fname, chunk_id) 记录在进度清单 <output_csv>.progress 中，
+续跑时精确跳过这些 chunk（支持乱序完成）；清单不存在时会从已有 CSV 生成一次。
+dry_run=True 时只做试运行并保存计划（dry_run.py）；plan 传入计划文件时按计划处理。
 """
 import os
 import csv
-import io
 import time
 import random
 from typing import Tuple
 
 from loader import ReportLoader
 from scorer import GLM4FlashJsonScorer
+from result_writer import GroupCommitWriter
+from progress_manifest import ProgressManifest
 import local_settings
-from timer import Timer   # 你本地的 Timer 实现
+from timer import Timer, METRICS   # 你本地的 Timer 实现；METRICS 为各阶段的计时/计数
+from usage import UsageLedger
 
 # -------------------------
 # AI 关键词列表
@@ -36,6 +45,8 @@ AI_KEYWORDS =[
 
 MAX_RETRIES = 5
 BASE_SLEEP = 1.0  # base for exponential backoff
+FLUSH_ROWS = 50          # 结果写入：每累计 N 行提交一次（fsync）
+FLUSH_INTERVAL_MS = 500  # 结果写入：最早一条未提交行等待超过 T 毫秒即提交
 # -------------------------
 
 def chunk_contains_ai(chunk: str):
@@ -57,51 +68,6 @@ def parse_fname_to_firm_year(fname: str):
     return parts[0], parts[1]
 
 
-def read_last_csv_line(output_csv: str):
-    """
-    从 CSV 文件末尾往上查找第一条有效数据行（跳过 header / 空行 / 损坏行）。
-    返回 (last_fname, last_chunk_id)；若无数据返回 (None, 0)。
-    """
-    if not os.path.exists(output_csv):
-        return None, 0
-
-    try:
-        with open(output_csv, "r", encoding="utf-8") as f:
-            lines = f.read().splitlines()
-    except Exception as e:
-        print(f"[read_last_csv_line] 无法读取文件 {output_csv}: {e}")
-        return None, 0
-
-    for raw in reversed(lines):
-        line = raw.strip()
-        if not line:
-            continue
-        # 解析 CSV 行以正确处理引号/逗号
-        try:
-            row = next(csv.reader(io.StringIO(line)))
-        except Exception:
-            continue
-        # 期望至少有 4 列： fname, firm_id, year, chunk_id, ...
-        if len(row) < 4:
-            continue
-        # 如果是 header，则跳过
-        first_col = row[0].strip().lower()
-        if first_col == "fname":
-            continue
-        fname = row[0].strip()
-        chunk_id_raw = row[3].strip()
-        try:
-            chunk_id = int(chunk_id_raw)
-        except Exception:
-            try:
-                chunk_id = int(float(chunk_id_raw))
-            except Exception:
-                continue
-        return fname, chunk_id
-
-    return None, 0
-
-
 def ensure_csv_header(output_csv: str):
     if not os.path.exists(output_csv):
         with open(output_csv, "w", newline="", encoding="utf-8") as f:
@@ -112,6 +78,7 @@ def ensure_csv_header(output_csv: str):
 def safe_write_row(output_csv: str, row: list):
     """
     追加写一行并 flush + fsync（若可用）
+    批量打分请使用 result_writer.GroupCommitWriter，避免逐行 open/fsync。
     """
     with open(output_csv, "a", newline="", encoding="utf-8") as f:
         writer = csv.writer(f)
@@ -123,89 +90,208 @@ def safe_write_row(output_csv: str, row: list):
             pass
 
 
-def run_json_scoring_resume_by_lastline(num_files: None, output_csv: str = "chunk_scores.csv"):
+def score_with_retries(scorer, chunk: str, label: str):
+    """
+    带指数退避重试的单个 chunk 打分，返回 (score, usage, latency, retries)。
+    latency 为各次 API 调用耗时之和（不含退避等待），retries 为失败后重试的次数；
+    重试用完仍失败时 score 和 usage 为 None，latency / retries 仍记录实际花费，供用量统计。
+    """
+    latency = 0.0
+    with METRICS.timer("score_chunk"):
+        for attempt in range(MAX_RETRIES):
+            call_start = time.perf_counter()
+            try:
+                score, call_usage = scorer.score_chunk_with_usage(chunk, debug=False)
+            except Exception as e:
+                latency += time.perf_counter() - call_start
+                if attempt == MAX_RETRIES - 1:
+                    break
+                wait_time = BASE_SLEEP * (2 ** attempt) + random.random()
+                print(f"[Retry {attempt+1}/{MAX_RETRIES}] 打分出错：{label} -> {e}. 等待 {wait_time:.1f}s 后重试...")
+                METRICS.count("retries")
+                with METRICS.timer("retry_sleep"):
+                    time.sleep(wait_time)
+                continue
+            latency += time.perf_counter() - call_start
+            METRICS.count("chunks_scored")
+            return score, call_usage, latency, attempt
+    print(f"[Warning] {label} 连续 {MAX_RETRIES} 次失败，记录 score=None 并继续。")
+    METRICS.count("chunks_failed")
+    return None, None, latency, MAX_RETRIES - 1
+
+
+def score_file(scorer, writer, manifest, fname: str, chunks, usage=None, store=None):
+    """
+    对一份年报的 chunks 打分并写入 writer：含 AI 关键词的 chunk 写 ai_flag=1 的行，
+    整份报告没有含 AI 的 chunk 时写一行 ai_flag=0 的默认行，最后标记该文件完成。
+    已记录在进度清单中的 chunk 跳过。顺序执行和流水线模式（pipeline.py）共用。
+    usage：可选的 usage.UsageLedger，记录每个 chunk 的 token 用量、延迟和重试次数。
+    store：可选的 result_store.SQLiteResultStore，结果库中已有的 chunk（其他进程写入的）也跳过。
+    """
+    firm_id, year = parse_fname_to_firm_year(fname)
+    if firm_id is None or year is None:
+        print(f"[Warning] 无法从文件名解析 firm_id/year: {fname}")
+
+    stored_ids = store.completed_chunk_ids(fname) if store is not None else set()
+    if 0 in stored_ids:
+        # 其他进程已为该文件写入 ai_flag=0 的默认行
+        writer.mark_file_done(fname)
+        return
+
+    # 本文件是否写入过 ai_flag=1 的 chunk（包含 AI）；续跑时以清单和结果库中已有的记录为准
+    wrote_any_chunk = manifest.has_chunks(fname) or bool(stored_ids)
+
+    # 遍历 chunks（1-based）
+    for idx, chunk in enumerate(chunks, start=1):
+        if manifest.is_chunk_done(fname, idx):
+            continue
+        if idx in stored_ids:
+            METRICS.count("chunks_in_store")
+            continue
+
+        # 关键词预筛：若 chunk 不含 AI 关键词，则跳过评分
+        with METRICS.timer("keyword_filter"):
+            contains_ai = chunk_contains_ai(chunk)
+        if not contains_ai:
+            METRICS.count("chunks_without_ai")
+            continue
+
+        # 现在是含 AI 的 chunk，需要打分
+        wrote_any_chunk = True
+        chunk_len = len(chunk)
+
+        score, call_usage, latency, retries = score_with_retries(scorer, chunk, f"{fname} chunk-{idx}")
+        if usage is not None:
+            usage.record(fname, firm_id, year, idx, call_usage, latency, retries)
+
+        # 写入行（ai_flag=1）
+        row = [fname, firm_id, year, idx, chunk_len, score, 1]
+        writer.write(row)
+
+    # 如果整份报告没有任何含 AI 的 chunk（wrote_any_chunk False），写默认行 ai_flag=0
+    if not wrote_any_chunk:
+        print(f"[No AI content] {fname} — 写入默认行 ai_flag=0")
+        row = [fname, firm_id, year, 0, 0, 0, 0]
+        writer.write(row)
+    writer.mark_file_done(fname)
+
+
+def iter_planned_files(loader, pdf_dir: str, files, skip, failed: list):
+    """
+    按计划逐个读取文件，返回 (fname, chunks)；skip(fname) 为 True 的文件跳过。
+    读取出错的文件记入 failed 并跳过：不标记完成，下次运行会重试，也不会中断其余文件。
+    """
+    for fname in files:
+        if skip(fname):
+            continue
+        try:
+            chunks = loader.load_and_chunk(os.path.join(pdf_dir, fname))
+        except Exception as e:
+            print(f"[Plan] 读取失败，跳过：{fname} -> {e}")
+            failed.append(fname)
+            continue
+        yield fname, chunks
+
+
+def run_json_scoring_resume_by_lastline(num_files: None, output_csv: str = "chunk_scores.csv",
+                                        parquet_dir: str = None, store_db: str = None,
+                                        dry_run: bool = False, plan: str = None, retry_failed: bool = False,
+                                        **dry_run_kwargs):
+    """
+    dry_run=True：只读取、分块和关键词预筛（见 dry_run.py），不调用 API；打印估算并保存
+        <output_csv>.plan.json 后返回计划。dry_run_kwargs 传给 dry_run.plan_corpus
+        （workers、target_rate、concurrency、tokens_per_char、latency）。
+    plan：计划文件路径；按计划中的文件处理，不含 AI chunk 的文件不再读取 PDF。
+        试运行中读取出错的文件默认跳过，retry_failed=True 时重新读取；按计划读取时出错的文件记录并跳过，
+        不标记完成，不中断整个运行。
+    """
     reading_path = local_settings.YEARLY_REPORTS_PATH
     api_key = local_settings.GLM4_FLASH_API_KEY
 
     # 更大 overlap 减少关键词被截断风险（如需再调大，修改这里）
-    loader = ReportLoader(skip_pages=5, chunk_size=2000, chunk_overlap=500)
-    scorer = GLM4FlashJsonScorer(api_key=api_key, model="glm-4-flash")
+    loader_params = dict(skip_pages=5, chunk_size=2000, chunk_overlap=500)
+    loader = ReportLoader(**loader_params)
 
     # 准备输出 CSV 与断点信息
     ensure_csv_header(output_csv)
-    last_processed_file, last_processed_chunk_id = read_last_csv_line(output_csv)
-    if last_processed_file:
-        print(f"[Resume] last processed file: {last_processed_file}, last chunk_id: {last_processed_chunk_id}")
+    manifest = ProgressManifest.for_output(output_csv)
+
+    if dry_run:
+        from dry_run import plan_corpus
+        return plan_corpus(reading_path, output_csv, loader_params, num_files=num_files,
+                           skip=manifest.is_file_done, **dry_run_kwargs)
+    ai_files = None
+    load_failed = []
+    if plan:
+        from dry_run import load_plan
+        planned = load_plan(plan, loader_params)
+        # 试运行中读取出错的文件不能当作不含 AI chunk：默认跳过（不标记完成），retry_failed=True 时重新读取
+        failed = [f for f in planned["files"] if "error" in f]
+        ai_files = [f["fname"] for f in planned["files"] if f["ai_chunk_ids"] or (retry_failed and "error" in f)]
+        no_ai_files = [f["fname"] for f in planned["files"] if not (f["ai_chunk_ids"] or "error" in f)]
+        print(f"[Plan] {len(ai_files)} files to score, {len(no_ai_files)} files without AI chunks")
+        if failed and not retry_failed:
+            print(f"[Warning] 跳过试运行中读取出错的 {len(failed)} 个文件（retry_failed=True 时重新读取）：")
+            for f in failed:
+                print(f"    {f['fname']}: {f['error']}")
+
+    scorer = GLM4FlashJsonScorer(api_key=api_key, model="glm-4-flash")
+    if manifest.done_file_count:
+        print(f"[Resume] {manifest.done_file_count} files already completed, will skip them")
     else:
         print("[Resume] no previous data found → start from beginning")
 
+    sinks = []
+    if parquet_dir:
+        from parquet_sink import ParquetChunkSink
+        parquet_sink = ParquetChunkSink(parquet_dir)
+        parquet_sink.recover(output_csv, manifest)
+        sinks.append(parquet_sink)
+    store = None
+    if store_db:
+        from result_store import SQLiteResultStore
+        store = SQLiteResultStore(store_db, prompt_version=scorer.PROMPT_VERSION, model=scorer.model)
+        sinks.append(store)
+    writer = GroupCommitWriter(output_csv, flush_rows=FLUSH_ROWS, flush_interval_ms=FLUSH_INTERVAL_MS,
+                               manifest=manifest, sinks=sinks)
+    usage = UsageLedger.for_output(output_csv, model=scorer.model)
+
+    METRICS.reset()
     overall_timer = Timer(name="Overall scoring batch")
     overall_timer.start()
 
-    start_processing = True if last_processed_file is None else False
-
-    # iter_files 按文件逐个返回 (fname, chunks)
-    for i, (fname, chunks) in enumerate(loader.iter_files(reading_path, num_files=num_files), start=1):
-        # 若存在断点且还没到断点文件之前，跳过
-        if not start_processing:
-            if fname == last_processed_file:
-                start_processing = True
-                print(f"[Resume] reached last processed file: {fname}, will resume inside this file from chunk {last_processed_chunk_id+1}")
-            else:
-                # skip this file
-                continue
-
-        print(f"\n=== Processing file {i}: {fname} (chunks: {len(chunks)}) ===")
-        firm_id, year = parse_fname_to_firm_year(fname)
-        if firm_id is None or year is None:
-            print(f"[Warning] 无法从文件名解析 firm_id/year: {fname}")
-
-        skip_up_to = last_processed_chunk_id if (last_processed_file and fname == last_processed_file) else 0
-        wrote_any_chunk = False  # 本文件是否写入过 ai_flag=1 的 chunk（包含 AI）
-
-        # 遍历 chunks（1-based）
-        for idx, chunk in enumerate(chunks, start=1):
-            if idx <= skip_up_to:
-                continue
-
-            # 关键词预筛：若 chunk 不含 AI 关键词，则跳过评分
-            if not chunk_contains_ai(chunk):
-                continue
-
-            # 现在是含 AI 的 chunk，需要打分
-            wrote_any_chunk = True
-            chunk_len = len(chunk)
-
-            # 重试机制
-            score = None
-            for attempt in range(MAX_RETRIES):
-                try:
-                    score = scorer.score_chunk(chunk, debug=False)
-                    break
-                except Exception as e:
-                    wait_time = BASE_SLEEP * (2 ** attempt) + random.random()
-                    print(f"[Retry {attempt+1}/{MAX_RETRIES}] 打分出错：{fname} chunk-{idx} -> {e}. 等待 {wait_time:.1f}s 后重试...")
-                    time.sleep(wait_time)
-                    score = None
-            if score is None:
-                print(f"[Warning] {fname} chunk-{idx} 连续 {MAX_RETRIES} 次失败，记录 score=None 并继续。")
-
-            # 写入行（ai_flag=1）
-            row = [fname, firm_id, year, idx, chunk_len, score, 1]
-            safe_write_row(output_csv, row)
-
-        # 如果整份报告没有任何含 AI 的 chunk（wrote_any_chunk False），写默认行 ai_flag=0
-        if not wrote_any_chunk:
-            print(f"[No AI content] {fname} — 写入默认行 ai_flag=0")
-            row = [fname, firm_id, year, 0, 0, 0, 0]
-            safe_write_row(output_csv, row)
+    # iter_files 按文件逐个返回 (fname, chunks)；已完成的文件在读取 PDF 之前就跳过
+    try:
+        if ai_files is not None:
+            # 试运行已确认这些文件没有含 AI 的 chunk：直接写 ai_flag=0 的默认行
+            for fname in no_ai_files:
+                if not manifest.is_file_done(fname):
+                    score_file(scorer, writer, manifest, fname, [], usage=usage, store=store)
+            file_iter = iter_planned_files(loader, reading_path, ai_files, manifest.is_file_done, load_failed)
+        else:
+            file_iter = loader.iter_files(reading_path, num_files=num_files, skip=manifest.is_file_done)
+        for i, (fname, chunks) in enumerate(file_iter, start=1):
+            print(f"\n=== Processing file {i}: {fname} (chunks: {len(chunks)}) ===")
+            score_file(scorer, writer, manifest, fname, chunks, usage=usage, store=store)
+    finally:
+        # 异常退出时也要把缓冲中的行提交落盘
+        writer.close()
 
     elapsed = overall_timer.stop()
     print(f"\nTimer 'Overall scoring batch': {elapsed:.4f} seconds")
+    METRICS.report()
+    METRICS.write_report(output_csv)
+    usage.report(elapsed)
+    usage.write_file_summary()
+    if load_failed:
+        print(f"[Warning] 读取失败、未完成的文件（下次运行会重试）: {load_failed}")
     print(f"结果写入: {os.path.abspath(output_csv)}")
 
     # 尝试返回 pandas DataFrame（便于后续处理/调试），若失败则返回 None
     try:
+        if parquet_dir:
+            from parquet_sink import read_chunk_scores
+            return read_chunk_scores(parquet_dir)
         import pandas as pd
         df = pd.read_csv(output_csv, dtype={"fname": str, "chunk_id": int, "ai_flag": int})
         return df
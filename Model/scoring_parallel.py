@@ -1,23 +1,33 @@
 # run_scoring_parallel.py
 from loader import ReportLoader
 from scorer import GLM4FlashJsonScorer
+from scoring_chunks import parse_fname_to_firm_year, score_with_retries
+from usage import UsageLedger
 import local_settings
-from timer import Timer 
+from timer import Timer
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
-def run_json_scoring_parallel():
+def run_json_scoring_parallel(num_files = 10, usage_csv = None):
+    """usage_csv：可选，逐次调用的 token 用量写入该 CSV（并汇总为按文件的 CSV）。"""
     reading_path = local_settings.YEARLY_REPORTS_PATH
     api_key = local_settings.GLM4_FLASH_API_KEY
 
     loader = ReportLoader(skip_pages=5, chunk_size=2000, chunk_overlap=300)
     scorer = GLM4FlashJsonScorer(api_key=api_key, model="glm-4-flash")
+    usage = UsageLedger(usage_csv, model=scorer.model)
 
-    results = loader.process_dir(reading_path, num_files=10)
+    def score_one(fname, chunk_id, chunk):
+        # 与顺序打分相同的重试；用量中记录实际的重试次数和各次调用的总耗时，失败的 chunk 返回 None
+        firm_id, year = parse_fname_to_firm_year(fname)
+        s, call_usage, latency, retries = score_with_retries(scorer, chunk, f"{fname} chunk-{chunk_id}")
+        usage.record(fname, firm_id, year, chunk_id, call_usage, latency, retries)
+        return s
 
     overall_timer = Timer(name="Overall scoring parallel batch")
     overall_timer.start()
 
-    for fname, chunks in results.items():
+    # iter_files 按文件逐个读取并分块（原来调用的 process_dir 并不存在）
+    for fname, chunks in loader.iter_files(reading_path, num_files=num_files):
         file_timer = Timer(name=f"Scoring {fname} in parallel")
         file_timer.start()
 
@@ -25,7 +35,8 @@ def run_json_scoring_parallel():
         # 用线程池来并发处理 chunk
         max_workers = 10  # 你可以调这个，看 API 能承受多少并发
         with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            future_to_chunk = {executor.submit(scorer.score_chunk, c, False): c for c in chunks}
+            future_to_chunk = {executor.submit(score_one, fname, idx, c): c
+                               for idx, c in enumerate(chunks, start=1)}
             for future in as_completed(future_to_chunk):
                 chunk_text = future_to_chunk[future]
                 try:
@@ -44,6 +55,8 @@ def run_json_scoring_parallel():
 
     total_time = overall_timer.stop()
     print(f"Total time for batch: {total_time:.2f}s")
+    usage.report(total_time)
+    usage.write_file_summary()
 
 if __name__ == "__main__":
     run_json_scoring_parallel()
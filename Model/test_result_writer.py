@@ -0,0 +1,31 @@
+import csv
+import os
+
+import pytest
+
+import result_writer
+from result_writer import GroupCommitWriter
+
+
+def test_failed_group_is_kept_and_retried(tmp_path, monkeypatch):
+    output_csv = str(tmp_path / "scores.csv")
+    writer = GroupCommitWriter(output_csv, flush_rows=1000, flush_interval_ms=0)
+    writer.write_many([["a.pdf", "000001", 2020, i, 10, 1.0, 1] for i in range(1, 4)])
+
+    real_fsync = os.fsync
+
+    def failing_fsync(fd):
+        raise OSError(28, "No space left on device")
+
+    monkeypatch.setattr(result_writer.os, "fsync", failing_fsync)
+    with pytest.raises(OSError):
+        writer.flush()
+    # 写了一半的内容已截断，分组仍在缓冲区中
+    assert os.path.getsize(output_csv) == 0
+
+    monkeypatch.setattr(result_writer.os, "fsync", real_fsync)
+    writer.write(["a.pdf", "000001", 2020, 4, 10, 1.0, 1])
+    writer.close()
+    with open(output_csv, newline="", encoding="utf-8") as f:
+        chunk_ids = [int(row[3]) for row in csv.reader(f)]
+    assert chunk_ids == [1, 2, 3, 4]
@@ -0,0 +1,96 @@
+import csv
+import json
+import os
+
+import pytest
+
+scoring_chunks = pytest.importorskip("scoring_chunks")
+
+import local_settings
+from dry_run import PLAN_VERSION
+from progress_manifest import ProgressManifest
+
+LOADER_PARAMS = dict(skip_pages=5, chunk_size=2000, chunk_overlap=500)
+GOOD = "000001_2020_report.pdf"
+BROKEN = "000002_2020_report.pdf"
+NO_AI = "000003_2020_report.pdf"
+
+
+class FakeLoader:
+    def __init__(self, **loader_params):
+        self.failed_to_read = []
+
+    def load_and_chunk(self, path):
+        if os.path.basename(path) == BROKEN:
+            raise ValueError("broken pdf")
+        return ["人工智能 " * 20, "text"]
+
+    def iter_files(self, pdf_dir, num_files=None, skip=None, files=None):
+        raise AssertionError("按计划运行时不应列目录读取")
+
+
+class FakeScorer:
+    def __init__(self, api_key, model="glm-4-flash"):
+        self.model = model
+
+    def score_chunk_with_usage(self, chunk, debug=False):
+        return 4.0, {"prompt_tokens": 10, "completion_tokens": 2, "total_tokens": 12}
+
+
+@pytest.fixture
+def planned_run(tmp_path, monkeypatch):
+    pdf_dir = tmp_path / "pdfs"
+    pdf_dir.mkdir()
+    for fname in (GOOD, BROKEN, NO_AI):
+        (pdf_dir / fname).write_bytes(b"%PDF-1.4\n")
+    monkeypatch.setattr(local_settings, "YEARLY_REPORTS_PATH", str(pdf_dir))
+    monkeypatch.setattr(scoring_chunks, "ReportLoader", FakeLoader)
+    monkeypatch.setattr(scoring_chunks, "GLM4FlashJsonScorer", FakeScorer)
+
+    output_csv = str(tmp_path / "chunk_scores.csv")
+    plan_path = output_csv + ".plan.json"
+    entry = {"firm_id": None, "year": 2020, "est_tokens": 0}
+    plan = {
+        "version": PLAN_VERSION,
+        "pdf_dir": str(pdf_dir),
+        "loader": LOADER_PARAMS,
+        "summary": {},
+        "by_year": {},
+        "files": [
+            dict(entry, fname=GOOD, chunks=2, ai_chunk_ids=[1]),
+            dict(entry, fname=BROKEN, chunks=0, ai_chunk_ids=[], error="ValueError: broken pdf"),
+            dict(entry, fname=NO_AI, chunks=1, ai_chunk_ids=[]),
+        ],
+    }
+    with open(plan_path, "w", encoding="utf-8") as f:
+        json.dump(plan, f)
+    return output_csv, plan_path
+
+
+def _rows_by_file(output_csv):
+    with open(output_csv, newline="", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    return {fname: [r for r in rows if r["fname"] == fname] for fname in (GOOD, BROKEN, NO_AI)}
+
+
+def test_plan_skips_files_that_failed_in_dry_run(planned_run):
+    output_csv, plan_path = planned_run
+    scoring_chunks.run_json_scoring_resume_by_lastline(None, output_csv, plan=plan_path)
+
+    rows = _rows_by_file(output_csv)
+    assert [(r["chunk_id"], r["ai_flag"]) for r in rows[GOOD]] == [("1", "1")]
+    assert [(r["chunk_id"], r["ai_flag"]) for r in rows[NO_AI]] == [("0", "0")]
+    assert rows[BROKEN] == []
+    manifest = ProgressManifest.for_output(output_csv)
+    assert manifest.is_file_done(GOOD) and manifest.is_file_done(NO_AI)
+    assert not manifest.is_file_done(BROKEN)
+
+
+def test_retry_failed_survives_a_file_that_still_fails(planned_run):
+    output_csv, plan_path = planned_run
+    scoring_chunks.run_json_scoring_resume_by_lastline(None, output_csv, plan=plan_path, retry_failed=True)
+
+    rows = _rows_by_file(output_csv)
+    assert len(rows[GOOD]) == 1 and len(rows[NO_AI]) == 1
+    assert rows[BROKEN] == []
+    assert not ProgressManifest.for_output(output_csv).is_file_done(BROKEN)
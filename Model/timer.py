@@ -1,4 +1,25 @@
+"""
+timer.py
+
+Timer：单次计时器（不可嵌套，with 结束时打印耗时）。
+
+MetricsRegistry：各流水线阶段的轻量指标（线程安全）。
+    timer(name)        嵌套计时：同一线程内嵌套的阶段名按层级拼接，如 "load/pdf_parse"
+    count(name, n)     计数器，如重试次数、跳过的 chunk 数
+    observe(name, v)   直方图，记录任意数值（如 API 延迟、chunk 长度）
+每个阶段的耗时记入同名直方图，报告中给出次数、总计、均值、p50/p95/p99、最大值。
+直方图保留最多 RESERVOIR_SIZE 个样本（蓄水池抽样），内存和每次记录的开销都是常数。
+report() 打印汇总，write_json() / write_csv() 写出报告。模块级的 METRICS 为默认的共享实例。
+"""
+import csv
+import json
+import random
+import threading
 import time
+from contextlib import contextmanager
+
+RESERVOIR_SIZE = 4096
+
 
 class Timer:
     def __init__(self, name = None):
@@ -25,3 +46,130 @@ class Timer:
         elapsed = self.stop()
         name = f" '{self.name}'" if self.name else ""
         print(f"Timer{name}: {elapsed:.4f} seconds")
+
+
+class Histogram:
+    """次数、总和、最小/最大值精确统计；分位数由蓄水池样本估计。调用方负责加锁。"""
+
+    def __init__(self, reservoir_size = RESERVOIR_SIZE, rng = None):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self._samples = []
+        self._size = reservoir_size
+        self._rng = rng or random.Random(0)
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None or value < self.min else self.min
+        self.max = value if self.max is None or value > self.max else self.max
+        if len(self._samples) < self._size:
+            self._samples.append(value)
+        else:
+            j = self._rng.randrange(self.count)
+            if j < self._size:
+                self._samples[j] = value
+
+    def summary(self):
+        ordered = sorted(self._samples)
+
+        def pick(q):
+            return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))] if ordered else None
+        return {
+            "count": self.count,
+            "total": self.total,
+            "mean": self.total / self.count if self.count else None,
+            "min": self.min,
+            "p50": pick(50),
+            "p95": pick(95),
+            "p99": pick(99),
+            "max": self.max,
+        }
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._histograms = {}
+        self._counters = {}
+        self._started = time.perf_counter()
+
+    @contextmanager
+    def timer(self, name):
+        """计时一个阶段；在另一个 timer 内部调用时，名称记为 "外层/内层"。"""
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        stack.append(name)
+        path = "/".join(stack)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            stack.pop()
+            self.observe(path, elapsed)
+
+    def count(self, name, n = 1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+
+    def observe(self, name, value):
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram()
+            histogram.add(value)
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+            self._started = time.perf_counter()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "elapsed": time.perf_counter() - self._started,
+                "histograms": {name: h.summary() for name, h in sorted(self._histograms.items())},
+                "counters": dict(sorted(self._counters.items())),
+            }
+
+    def report(self):
+        snap = self.snapshot()
+        print(f"\n=== Metrics (wall time {snap['elapsed']:.2f}s) ===")
+        if snap["histograms"]:
+            print(f"{'stage':<36}{'count':>8}{'total':>11}{'mean':>10}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}")
+            for name, s in snap["histograms"].items():
+                print(f"{name:<36}{s['count']:>8}{s['total']:>11.3f}{s['mean']:>10.4f}"
+                      f"{s['p50']:>10.4f}{s['p95']:>10.4f}{s['p99']:>10.4f}{s['max']:>10.4f}")
+        for name, value in snap["counters"].items():
+            print(f"{name:<36}{value:>8}")
+        return snap
+
+    def write_json(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f, ensure_ascii=False, indent=1)
+
+    def write_csv(self, path):
+        """每个直方图一行（kind=histogram），每个计数器一行（kind=counter，值在 count 列）。"""
+        snap = self.snapshot()
+        columns = ["name", "kind", "count", "total", "mean", "min", "p50", "p95", "p99", "max"]
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(columns)
+            for name, s in snap["histograms"].items():
+                writer.writerow([name, "histogram"] + [s[c] for c in columns[2:]])
+            for name, value in snap["counters"].items():
+                writer.writerow([name, "counter", value] + [None] * (len(columns) - 3))
+
+    def write_report(self, prefix):
+        """写出 <prefix>.metrics.json 和 <prefix>.metrics.csv。"""
+        self.write_json(prefix + ".metrics.json")
+        self.write_csv(prefix + ".metrics.csv")
+
+
+METRICS = MetricsRegistry()
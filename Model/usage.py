@@ -0,0 +1,164 @@
+"""
+usage.py
+
+打分 API 的 token、费用与吞吐统计。
+
+UsageLedger 记录每一次 chunk 打分调用（score_file 中成功或重试用完的每个 chunk）：
+    prompt_tokens / completion_tokens / total_tokens（来自 response.usage）、延迟、重试次数
+逐次调用追加到 <output_csv>.usage.csv（续跑时累计，不重复计算已完成的 chunk），
+运行结束时由 write_file_summary() 汇总为按文件的 <output_csv>.usage_by_file.csv（含 firm_id、year、费用），
+report() 输出本次运行的 tokens/秒、chunks/秒 和费用。
+
+用量行在结果行提交之前写入，崩溃后重新打分的 chunk 会留下多行：汇总时按 (fname, chunk_id) 去重，保留最后一行。
+
+费用按 TOKEN_PRICES（元 / 百万 tokens，输入与输出分开计价）计算；未列出的模型费用记为空。
+"""
+import csv
+import os
+import threading
+from typing import Optional
+
+# 元 / 百万 tokens：(输入, 输出)。价格变动时修改这里
+TOKEN_PRICES = {
+    "glm-4-flash": (0.0, 0.0),
+}
+
+CALL_COLUMNS = ["fname", "firm_id", "year", "chunk_id", "prompt_tokens", "completion_tokens", "total_tokens",
+                "latency", "retries", "ok"]
+FILE_COLUMNS = ["fname", "firm_id", "year", "calls", "failed", "prompt_tokens", "completion_tokens",
+                "total_tokens", "latency", "retries", "cost"]
+
+
+def usage_from_response(response) -> dict:
+    """从 API 响应中取出 token 用量；响应中没有 usage 时各项为 0。"""
+    usage = getattr(response, "usage", None)
+    prompt_tokens = int(getattr(usage, "prompt_tokens", 0) or 0)
+    completion_tokens = int(getattr(usage, "completion_tokens", 0) or 0)
+    total_tokens = int(getattr(usage, "total_tokens", 0) or (prompt_tokens + completion_tokens))
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": total_tokens}
+
+
+def token_cost(model: str, prompt_tokens: int, completion_tokens: int) -> Optional[float]:
+    prices = TOKEN_PRICES.get(model)
+    if prices is None:
+        return None
+    return (prompt_tokens * prices[0] + completion_tokens * prices[1]) / 1_000_000
+
+
+def read_calls(path: str) -> dict:
+    """读取逐次调用的 CSV，返回 (fname, chunk_id) -> 行；同一 chunk 有多行时保留最后一行，写了一半的行跳过。"""
+    calls = {}
+    with open(path, "r", newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            if any(row.get(column) is None for column in CALL_COLUMNS):
+                continue
+            try:
+                calls[(row["fname"], int(row["chunk_id"]))] = row
+            except ValueError:
+                continue
+    return calls
+
+
+class UsageLedger:
+    def __init__(self, path: Optional[str] = None, model: str = "glm-4-flash"):
+        """path 为逐次调用的 CSV（None 时只在内存中统计本次运行）。"""
+        self.path = path
+        self.model = model
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.failed = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.retries = 0
+        self.latency = 0.0
+        if path is not None and not os.path.exists(path):
+            with open(path, "w", newline="", encoding="utf-8") as f:
+                csv.writer(f).writerow(CALL_COLUMNS)
+
+    @classmethod
+    def for_output(cls, output_csv: str, model: str = "glm-4-flash") -> "UsageLedger":
+        return cls(output_csv + ".usage.csv", model=model)
+
+    def record(self, fname, firm_id, year, chunk_id, usage: Optional[dict], latency: float, retries: int):
+        """记录一个 chunk 的打分；usage 为 None 表示重试用完仍失败。"""
+        ok = usage is not None
+        usage = usage or {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+        row = [fname, firm_id, year, chunk_id, usage["prompt_tokens"], usage["completion_tokens"],
+               usage["total_tokens"], round(latency, 4), retries, int(ok)]
+        with self._lock:
+            self.calls += 1
+            self.failed += not ok
+            self.prompt_tokens += usage["prompt_tokens"]
+            self.completion_tokens += usage["completion_tokens"]
+            self.retries += retries
+            self.latency += latency
+            if self.path is not None:
+                with open(self.path, "a", newline="", encoding="utf-8") as f:
+                    csv.writer(f).writerow(row)
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    def summary(self, elapsed: float) -> dict:
+        elapsed = max(elapsed, 1e-9)
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "failed": self.failed,
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "total_tokens": self.total_tokens,
+                "retries": self.retries,
+                "avg_latency": self.latency / self.calls if self.calls else 0.0,
+                "tokens_per_sec": self.total_tokens / elapsed,
+                "chunks_per_sec": (self.calls - self.failed) / elapsed,
+                "cost": token_cost(self.model, self.prompt_tokens, self.completion_tokens),
+            }
+
+    def report(self, elapsed: float) -> dict:
+        s = self.summary(elapsed)
+        cost = "未知" if s["cost"] is None else f"{s['cost']:.4f} 元"
+        print(f"[Usage] {s['calls']} 次打分（失败 {s['failed']}，重试 {s['retries']} 次），"
+              f"tokens 输入 {s['prompt_tokens']} / 输出 {s['completion_tokens']} / 合计 {s['total_tokens']}，"
+              f"{s['tokens_per_sec']:.1f} tokens/s，{s['chunks_per_sec']:.2f} chunks/s，"
+              f"平均延迟 {s['avg_latency']:.2f}s，费用 {cost}")
+        return s
+
+    def write_file_summary(self, output_path: Optional[str] = None) -> Optional[str]:
+        """
+        按文件汇总逐次调用的 CSV（包括之前各次运行，每个 chunk 只计最后一次），
+        默认写到 <output_csv>.usage_by_file.csv。
+        """
+        if self.path is None:
+            return None
+        if output_path is None:
+            output_path = self.path[:-len(".usage.csv")] + ".usage_by_file.csv" \
+                if self.path.endswith(".usage.csv") else self.path + ".by_file.csv"
+        per_file = {}
+        with self._lock:
+            calls = read_calls(self.path)
+        for row in calls.values():
+            try:
+                entry = per_file.setdefault(row["fname"], {
+                    "firm_id": row["firm_id"], "year": row["year"], "calls": 0, "failed": 0,
+                    "prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0,
+                    "latency": 0.0, "retries": 0})
+                entry["calls"] += 1
+                entry["failed"] += row["ok"] == "0"
+                entry["prompt_tokens"] += int(row["prompt_tokens"])
+                entry["completion_tokens"] += int(row["completion_tokens"])
+                entry["total_tokens"] += int(row["total_tokens"])
+                entry["latency"] += float(row["latency"])
+                entry["retries"] += int(row["retries"])
+            except (KeyError, TypeError, ValueError):
+                continue  # 崩溃时写了一半的行
+        with open(output_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(FILE_COLUMNS)
+            for fname, e in sorted(per_file.items()):
+                cost = token_cost(self.model, e["prompt_tokens"], e["completion_tokens"])
+                writer.writerow([fname, e["firm_id"], e["year"], e["calls"], e["failed"], e["prompt_tokens"],
+                                 e["completion_tokens"], e["total_tokens"], round(e["latency"], 4),
+                                 e["retries"], cost])
+        return output_path
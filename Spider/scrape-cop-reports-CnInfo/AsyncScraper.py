@@ -0,0 +1,199 @@
+# -*- encoding: utf-8 -*-
+"""
+异步爬取模式（customer_req["async_mode"] = 1，需要 aiohttp）。
+
+单个事件循环内同时爬取全部 (检索关键词, 日期区间)，查询和下载分别由共享的速率控制器限制速率和并发：
+    query_concurrency：同时进行的查询请求数上限（可选，默认 DEFAULT_QUERY_CONCURRENCY）
+    download_concurrency：同时进行的下载数上限（可选，默认与 workers 相同）
+文件名规则、停用词/关键词过滤（AnnouncementFilter）和已下载判断（FuncScraper.prepare_announcement）与线程模式一致。
+"""
+from constant import *
+from utils import *
+from FuncScraper import FuncScraper, MAX_PAGES
+import asyncio
+
+try:
+    import aiohttp
+except ImportError:  # aiohttp 为可选依赖，仅在异步模式下需要
+    aiohttp = None
+
+# Content-Length 由 aiohttp 按实际请求体计算，不能沿用 HEADERS 中写死的值
+ASYNC_HEADERS = {k: v for k, v in HEADERS.items() if k != 'Content-Length'}
+
+
+class AsyncScraper:
+    def __init__(self, customer_req):
+        if aiohttp is None:
+            raise ImportError("异步模式需要安装 aiohttp：pip install aiohttp")
+        self.file_download = customer_req["file_download"]
+        self.query_control, self.download_control = rate_controllers(customer_req, reset=True)
+        self.download_buffer = customer_req.get("download_buffer", DEFAULT_CHUNK_SIZE)
+        self.on_download = customer_req.get("on_download")
+        self.adaptive = customer_req.get("adaptive_interval", 0) == 1
+        self.start_date = customer_req["start_date"]
+        self.end_date = customer_req["end_date"]
+        file_info = FILE_INFO_JSON[customer_req["file_type"]]
+        searchkeys = file_info["search_keys"] if file_info["use_keyword"] == 1 else ['']
+        # 每个检索关键词一个 FuncScraper，只用来构造查询参数和处理公告，不发起请求
+        self.scrapers = [FuncScraper(customer_req, searchkey) for searchkey in searchkeys]
+        self.session = None
+        # 不同关键词/区间可能返回同一份公告，正在下载的文件不重复下载
+        self.in_flight = set()
+
+    async def run(self, DATA_RANGE=None):
+        """DATA_RANGE 为 None 时（自适应模式）按各关键词的结果密度划分区间。"""
+        connector = aiohttp.TCPConnector(
+            limit=self.query_control.max_concurrency + self.download_control.max_concurrency)
+        async with aiohttp.ClientSession(connector=connector, headers=ASYNC_HEADERS) as session:
+            self.session = session
+            if DATA_RANGE is None:
+                plans = await asyncio.gather(*(self.plan_intervals(scraper) for scraper in self.scrapers))
+            else:
+                plans = [DATA_RANGE] * len(self.scrapers)
+            await asyncio.gather(*(self.scrape_interval_safe(scraper, seDate)
+                                   for scraper, intervals in zip(self.scrapers, plans) for seDate in intervals))
+        self.session = None
+        self.scrapers[0].filter.report()
+        self.query_control.report()
+        self.download_control.report()
+        if self.file_download == 0:
+            scraper = self.scrapers[0]
+            MetadataSink.open(metadata_csv_path(scraper.root_file_path, scraper.file_type)).flush()
+
+    async def query_page(self, scraper, seDate, pageNum):
+        """一次请求取回 (announcements, totalpages)；失败时由速率控制器退避后重试。"""
+        data = scraper.build_query(seDate, pageNum)
+
+        async def _query():
+            async with self.session.post(scraper.query_url, data=data) as r:
+                r.raise_for_status()  # 429/503 由速率控制器识别为过载
+                response = await r.json(content_type=None)
+            return response['announcements'], response['totalpages']
+        return await self.query_control.call_async(_query)
+
+    async def plan_intervals(self, scraper):
+        """与 FuncScraper.plan_intervals 相同，同一层的区间并发查询。"""
+        planner, store, key = scraper.interval_planner(self.start_date, self.end_date)
+        intervals = store.get(key)
+        if intervals is not None:
+            return intervals
+
+        async def probe_many(seDates):
+            results = await asyncio.gather(*(self.query_page(scraper, seDate, 1) for seDate in seDates))
+            return [totalpages for _, totalpages in results]
+        intervals = await planner.plan_async(probe_many)
+        store.put(key, intervals)
+        print(f"{scraper.searchkey or '-'} 自适应划分：查询 {planner.probes} 次，共 {len(intervals)} 个区间")
+        return intervals
+
+    async def scrape_interval_safe(self, scraper, seDate):
+        try:
+            await self.scrape_interval(scraper, seDate)
+        except Exception as e:
+            # 查询重试次数用完：该区间在爬取进度中保持未完成，下次运行时继续
+            print(f"{scraper.searchkey or '-'} {seDate}：查询失败，跳过该区间: {e}")
+
+    async def scrape_interval(self, scraper, seDate):
+        """第 1 页取得总页数后，其余各页并发查询，每页的下载在查询返回后立即开始。已完成的区间和页直接跳过。"""
+        frontier, key = scraper.frontier, scraper.searchkey
+        if not frontier.begin_interval(key, seDate):
+            return
+        totalpages = frontier.totalpages(key, seDate)
+        first_result = None
+        if totalpages is None:
+            first_result, totalpages = await self.query_page(scraper, seDate, 1)
+            frontier.set_totalpages(key, seDate, totalpages)
+            if first_result is None:
+                print(f"{key or '-'} {seDate}：无内容")
+                frontier.mark_interval_done(key, seDate)
+                return
+        # 有时候会出现奇怪的bug导致迟迟无法结束，故设定500页的最大值强行停止
+        last_page = min(totalpages + 1, MAX_PAGES)
+        pages = [p for p in range(1, last_page + 1) if not frontier.is_page_done(key, seDate, p)]
+        print(f"{key or '-'} {seDate}：共 {last_page} 页，待处理 {len(pages)} 页")
+        results = await asyncio.gather(*(self.fetch_and_process(scraper, seDate, pageNum,
+                                                                first_result if pageNum == 1 else None)
+                                         for pageNum in pages))
+        if all(results):
+            frontier.mark_interval_done(key, seDate)
+
+    async def fetch_and_process(self, scraper, seDate, pageNum, result=None):
+        """处理一页（result 为空时先查询）；本页全部成功时记入爬取进度并返回 True。"""
+        if result is None:
+            result, _ = await self.query_page(scraper, seDate, pageNum)
+        ok = True if result is None else await self.process_page(scraper, result)
+        if ok:
+            scraper.frontier.mark_page_done(scraper.searchkey, seDate, pageNum)
+        return ok
+
+    async def process_page(self, scraper, result):
+        records, failed = scraper.filter.filter_page(result)
+        downloads = []
+        ok = not failed
+        for record in records:
+            try:
+                task = scraper.prepare_announcement(record)
+            except Exception as e:
+                print(f'处理公告失败: {e}')
+                ok = False
+                continue
+            if task is None:
+                continue
+            if self.file_download == 1:
+                if task["filePath"] in self.in_flight:
+                    continue
+                self.in_flight.add(task["filePath"])
+                downloads.append(self.download(task))
+            elif self.file_download == 0:
+                # 记录写入 CSV 后本页才算完成
+                downloads.append(asyncio.wrap_future(save_to_csv(
+                    task["downloadUrl"], task["fileName"], task["fileShortName"],
+                    scraper.root_file_path, scraper.file_type)))
+            else:
+                raise ValueError("file_download参数错误")
+        return all(await asyncio.gather(*downloads)) and ok
+
+    async def download(self, task):
+        """与 utils.download_file 相同：写入 .part 文件，中断后用 Range 续传，校验通过后原子改名并记入下载记录。返回是否成功"""
+        fileShortName = task["fileShortName"]
+        filePath = task["filePath"]
+        part_path = filePath + PART_SUFFIX
+        check_pdf = filePath.lower().endswith('.pdf')
+
+        async def attempt():
+            offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+            async with self.session.get(task["downloadUrl"], headers=range_headers(offset)) as r:
+                if r.status != 416:
+                    r.raise_for_status()
+                    if r.status != 206:
+                        offset = 0
+                    with open(part_path, 'ab' if offset else 'wb') as part_file:
+                        async for chunk in r.content.iter_chunked(self.download_buffer):
+                            part_file.write(chunk)
+                            self.download_control.add_bytes(len(chunk))
+                expected_size = expected_total_size(r.status, r.headers)
+            finalize_part(part_path, filePath, expected_size, check_pdf)
+
+        try:
+            await self.download_control.call_async(attempt)
+        except Exception as e:
+            print(f'{fileShortName}： \t下载失败: {e}')
+            return False
+        finally:
+            self.in_flight.discard(filePath)
+        print(f'{fileShortName}：\t已下载到 {filePath}')
+        # 下载完成后，保存文件名到记录中。
+        DownloadLedger.open(task["LOCK_FILE_PATH"]).add(task["fileName"])
+        if self.on_download is not None:
+            # 回调可能阻塞（如打分流水线的背压等待），放到线程中执行，避免卡住事件循环
+            await asyncio.to_thread(notify_download, self.on_download, filePath)
+        return True
+
+
+def main(customer_req):
+    DATA_RANGE = None
+    if customer_req.get("adaptive_interval", 0) != 1:
+        DATA_RANGE = create_date_intervals(
+            customer_req["interval"], customer_req["start_date"], customer_req["end_date"])
+    asyncio.run(AsyncScraper(customer_req).run(DATA_RANGE))
+    print('下载完毕')
@@ -1,10 +1,19 @@
 # -*- encoding: utf-8 -*-
 from constant import *
 from utils import *
+from announcement_filter import AnnouncementFilter, DROP_EXISTS, DROP_RECORDED, DROP_NOT_NEWER
+from collections import deque
+from concurrent.futures import Future, wait
+from frontier import CrawlFrontier
+from planner import IntervalPlanner, PlanStore
+import threading
+
+MAX_PAGES = 500
+DEFAULT_PREFETCH_PAGES = 2
 
 
 class FuncScraper:
-    def __init__(self, customer_req):
+    def __init__(self, customer_req, searchkey=''):
         self.file_type = customer_req["file_type"]
         self.root_file_path = customer_req["root_file_path"]
         self.file_download = customer_req["file_download"]
@@ -12,97 +21,122 @@ class FuncScraper:
         self.end_date = customer_req["end_date"]
         self.interval = customer_req["interval"]
         self.workers = customer_req["workers"]
+        # 每个线程的 HTTP 长连接池大小（可选，默认 DEFAULT_POOL_SIZE）
+        self.pool_size = customer_req.get("pool_size", DEFAULT_POOL_SIZE)
+        # 下载缓冲区大小（字节，可选，默认 DEFAULT_CHUNK_SIZE）
+        self.download_buffer = customer_req.get("download_buffer", DEFAULT_CHUNK_SIZE)
+        # 下载线程池在 CircleScrape 中创建并跨页复用，线程（及其 Session 的长连接）不会每页重建
+        self.executor = None
+        # 提前并发查询的页数（可选，默认 DEFAULT_PREFETCH_PAGES）
+        self.prefetch_pages = max(1, customer_req.get("prefetch_pages", DEFAULT_PREFETCH_PAGES))
+        self.query_executor = None
+        self.pending = []
+        # 查询和下载的共享速率控制器：目标速率、有界退避、自适应并发（见 rate_control.py）
+        self.query_control, self.download_control = rate_controllers(customer_req)
+        self.searchkey = searchkey
+        # 查询接口和 PDF 下载地址（可选，默认为巨潮资讯；测试时可指向 stand_in_server.py）
+        self.query_url = customer_req.get("query_url", URL)
+        self.static_url = customer_req.get("static_url", STATIC_URL)
+        # 每下载完成一个文件调用一次 on_download(filePath)（可选，如 Model/pipeline.py 的打分队列）
+        self.on_download = customer_req.get("on_download")
         self.use_keywords = FILE_INFO_JSON[self.file_type]["use_keyword"]
         self.is_duplicate_not_allowed = FILE_INFO_JSON[self.file_type]["is_duplicate_not_allowed"]
         self.cnInfoColumn = FILE_INFO_JSON[self.file_type]["cn_info_column"]
         self.cnInfoCategory = FILE_INFO_JSON[self.file_type]["cn_info_category"]
-        self.must_contain_word = list(set(
-            item for item in FILE_INFO_JSON[self.file_type]["search_keys"]))
+        # 标题/简称清洗、停用词和关键词过滤（每个 file_type 只编译一次，见 announcement_filter.py）
+        self.filter = AnnouncementFilter.open(self.file_type)
+        # 爬取进度，重启后从中断处继续；recrawl 指定需要强制重爬的日期范围（可选）
+        self.saving_path = f'{self.root_file_path}\{self.file_type}'
+        if not os.path.exists(self.saving_path):
+            os.makedirs(self.saving_path)
+        self.frontier = CrawlFrontier.open(f'{self.saving_path}\{self.file_type}.frontier.jsonl',
+                                           customer_req.get("recrawl"))
 
-    def process_page_for_downloads(self, pageNum):
-        """处理指定页码的公告信息并下载相关文件"""
-        DATA['pageNum'] = pageNum
-        DATA['column'] = self.cnInfoColumn
+    def build_query(self, seDate, pageNum):
+        """构造某一区间、某一页的查询参数。每次请求复制一份 DATA，不修改全局模板，便于多线程并发查询。"""
+        data = dict(DATA)
+        data['pageNum'] = pageNum
+        data['column'] = self.cnInfoColumn
+        data['seDate'] = seDate
+        data['searchkey'] = self.searchkey
         if self.use_keywords == 0:
-            DATA['category'] = self.cnInfoCategory
-        # 向网站获取内容和总页数，必须分开获取，否则容易报错
-        result = retry_on_failure(lambda:
-                                  requests.post(URL, data=DATA, headers=HEADERS).json()['announcements'])
-        maxpage = retry_on_failure(lambda:
-                                   requests.post(URL, data=DATA, headers=HEADERS).json()['totalpages']) + 1
+            data['category'] = self.cnInfoCategory
+        return data
+
+    def query_page(self, seDate, pageNum):
+        """一次请求同时取回公告列表和总页数，返回 (announcements, totalpages)。"""
+        data = self.build_query(seDate, pageNum)
+        session = get_session(self.pool_size)
+
+        def _query():
+            r = session.post(self.query_url, data=data, headers=HEADERS)
+            r.raise_for_status()  # 429/503 由速率控制器识别为过载
+            response = r.json()
+            return response['announcements'], response['totalpages']
+        return retry_on_failure(_query, self.query_control)
+
+    def process_page_for_downloads(self, seDate, pageNum, result, maxpage):
+        """处理指定页码的公告信息：提交到线程池后立即返回，不等待本页处理完成"""
         if result is None or pageNum > maxpage:
             print(f"第 {pageNum} 页已无内容或超出最大页数，退出")
             return False
 
-        # 决定是否开启多线程：仅在选择多线程且为下载文件模式时才启用
-        if self.file_download == 1:
-            # 开启多线程处理
-            print(f'多线程处理第 {pageNum} 页，共 {maxpage} 页')
-            with ThreadPoolExecutor(max_workers=self.workers) as executor:
-                executor.map(self.process_announcements, result)
-            return True
-
-    def process_announcements(self, i):
-        """处理返回的json文件"""
-        # 处理标题
-        title = i['announcementTitle']
-        title = re.sub(r'(<em>|</em>|[\/:*?"<>| ])', '', title)
-        title = re.sub(r'_', '-', title)  # 将下划线改掉，防止与标题中新增的下划线冲突。
-        # 获取下载链接
-        downloadUrl = 'http://static.cninfo.com.cn/' + i['adjunctUrl']
-        # 处理时间
-        announcementTime = i["announcementTime"]/1000
-        announcementTime = datetime.datetime.fromtimestamp(
-            announcementTime).strftime('%Y-%m-%d')
-        # 处理简称
-        secName = i['secName'] if i['secName'] is not None else 'None'
-        secName = re.sub(r'\*ST', '＊ST', secName)
-        secName = re.sub(r'(<em>|</em>|em|[\/:*?"<>| ])', '', secName)
-        secName = re.sub(r'Ａ', 'A', secName)
-        secName = re.sub(r'Ｂ', 'B', secName)
-        secName = re.sub(r'_', '-', secName)
-        # 处理代码。如果代码为空，则从企业唯一的id获得
-        secCode = i['secCode']
-        if secCode == None:
-            secCode = i['orgId'][5:11]
-        # 处理文件后缀
-        file_suffix = i['adjunctUrl'].split(".")[1].lower()
-        # 处理会计年度
-        seYear = re.search(r'20\d{2}', title)
-        seYear = str(int(announcementTime[0:4]) -
-                     1) if seYear is None else seYear.group()
-        # 整合文件名
-        # fileName：保存到本地的文件名
-        # fileShortName：输出打印时显示的名字
-        if any(word in self.file_type for word in ["社会责任", "ESG", "CSR"]):
-            # 对于CSR报告，处理后缀
-            csr_tag = get_CSR_tag(title)
-            if csr_tag == "":
-                return
-            fileShortName = rf'{secCode}_{seYear}_{csr_tag}_{secName}'
-            fileName = rf'{fileShortName}_{title}_{announcementTime}.{file_suffix}'
-        elif self.is_duplicate_not_allowed == 1:
-            # is_duplicate_not_allowed时，用企业-年份作为主键
-            # 默认从标题中检索年份数据，
-            # 如果标题中没说，就从发布日期中减1
-            # 因为一年发布一份的报告一般是次年更新，所以年份减1
-            fileShortName = f'{secCode}_{seYear}_{secName}'
-            fileName = f'{fileShortName}_{title}_{announcementTime}.{file_suffix}'
-        else:
-            fileShortName = f'{secCode}_{announcementTime}_{secName}'
-            fileName = f'{fileShortName}_{title}.{file_suffix}'
+        # 整页先过滤，通过的公告交给线程池处理（元数据由 MetadataSink 的单一写线程写入）
+        print(f'多线程处理第 {pageNum} 页，共 {maxpage} 页')
+        records, failed = self.filter.filter_page(result)
+        futures = [self.executor.submit(self._process_announcement_safe, record) for record in records]
+        if failed:
+            # 有公告解析失败时本页不记为完成
+            failure = Future()
+            failure.set_result(False)
+            futures.append(failure)
+        self.pending.extend(futures)
+        self._track_page(seDate, pageNum, futures)
+        return True
 
-        # 接下来开始执行下载前的判断
-        # 1. 对于标题包含停用词的报告，跳过下载
-        if any(re.search(k, title) for k in FILE_INFO_JSON[self.file_type]["stopwords_list"]):
-            print(f'{fileShortName}：\t包括停用词 ({title})')
+    def _track_page(self, seDate, pageNum, futures):
+        """本页公告全部处理成功后记入爬取进度；有失败时本页不标记完成，续跑时重新处理。"""
+        if not futures:
+            self.frontier.mark_page_done(self.searchkey, seDate, pageNum)
             return
+        lock = threading.Lock()
+        state = {"remaining": len(futures), "ok": True}
 
-        # 2. 如果要求标题中带有关键词，则跳过下载不包含关键词的报告
-        if self.use_keywords == 1:
-            if not any(re.search(k, title) for k in self.must_contain_word):
-                print(f'{fileShortName}：\t不含关键词 ({title})')
+        def on_done(future):
+            result = None if future.cancelled() else future.result()
+            if isinstance(result, Future):
+                # 只保存记录的公告：等 MetadataSink 把记录写入 CSV 后才算完成
+                result.add_done_callback(on_done)
                 return
+            with lock:
+                state["remaining"] -= 1
+                state["ok"] = state["ok"] and result is True
+                if state["remaining"]:
+                    return
+            if state["ok"]:
+                self.frontier.mark_page_done(self.searchkey, seDate, pageNum)
+
+        for future in futures:
+            future.add_done_callback(on_done)
+
+    def _process_announcement_safe(self, record):
+        """线程池中执行 process_announcements，异常只打印，不影响同页其它公告。返回是否处理成功。"""
+        try:
+            return self.process_announcements(record)
+        except Exception as e:
+            print(f'处理公告失败: {e}')
+            return False
+
+    def prepare_announcement(self, record):
+        """
+        对通过过滤的公告（AnnouncementFilter.filter_page 的结果）执行下载前的判断。
+        需要下载（或保存记录）时返回任务字典，否则返回 None。线程模式和异步模式共用这一步。
+        """
+        fileName = record["fileName"]
+        fileShortName = record["fileShortName"]
+        announcementTime = record["announcementTime"]
+        # 获取下载链接
+        downloadUrl = self.static_url + record['adjunctUrl']
 
         # 3. 对于当前目录下已经存在的报告，跳过下载
         SAVING_PATH = f'{self.root_file_path}\{self.file_type}'
@@ -112,56 +146,169 @@ class FuncScraper:
         if os.path.exists(filePath):
             # # 判断是否存在
             print(f'{fileShortName}：\t已存在，跳过下载')
-            return
+            self.filter.count(DROP_EXISTS)
+            return None
 
         # 4. 对于记录在文件中的报告，跳过下载
         LOCK_FILE_PATH = f'{self.root_file_path}\{self.file_type}\{self.file_type}.txt'
-        if not os.path.exists(LOCK_FILE_PATH):
-            with open(LOCK_FILE_PATH, 'w') as file:
-                pass
-        with open(LOCK_FILE_PATH, 'r', encoding='utf-8', errors='ignore') as lock_file:
-            downloaded_files = lock_file.readlines()
-            if f'{fileName}\n' in downloaded_files:
-                print(f'{fileShortName}：\t已记录在文件中')
-                return
+        ledger = DownloadLedger.open(LOCK_FILE_PATH)
+        if fileName in ledger:
+            print(f'{fileShortName}：\t已记录在文件中')
+            self.filter.count(DROP_RECORDED)
+            return None
 
         # 5. 在不允许年度重复的情况下，对于没有记录但是已经有同一代码、同一时间报告的文件，比对日期，如果日期更新则下载，否则不下载
         if self.is_duplicate_not_allowed == 1:
-            if compare_latest_report(
-                    downloaded_files, announcementTime, fileShortName[:11]) == False:
-                return
+            if not ledger.is_newer(announcementTime, fileShortName):
+                self.filter.count(DROP_NOT_NEWER)
+                return None
+        return {
+            "downloadUrl": downloadUrl,
+            "filePath": filePath,
+            "fileName": fileName,
+            "fileShortName": fileShortName,
+            "LOCK_FILE_PATH": LOCK_FILE_PATH,
+        }
+
+    def process_announcements(self, record):
+        """
+        处理一条通过过滤的公告。返回 False 表示下载失败，需要在续跑时重试；
+        只保存记录（file_download=0）时返回 MetadataSink 的 Future，记录写入 CSV 后结果为 True。
+        """
+        task = self.prepare_announcement(record)
+        if task is None:
+            return True
         # 6. 一切都符合要求，下载文件或保存文件到本地
         if self.file_download == 1:
-            download_file(downloadUrl, filePath, fileShortName,
-                          LOCK_FILE_PATH, fileName)
+            ok = download_file(task["downloadUrl"], task["filePath"], task["fileShortName"],
+                               task["LOCK_FILE_PATH"], task["fileName"], session=get_session(self.pool_size),
+                               chunk_size=self.download_buffer, controller=self.download_control)
+            if ok:
+                notify_download(self.on_download, task["filePath"])
+            return ok
         elif self.file_download == 0:
-            save_to_csv(downloadUrl, fileName, fileShortName,
-                        self.root_file_path, self.file_type)
+            return save_to_csv(task["downloadUrl"], task["fileName"], task["fileShortName"],
+                               self.root_file_path, self.file_type)
         else:
             raise ValueError("file_download参数错误")
 
+    def interval_planner(self, start_date, end_date):
+        """返回 (planner, store, key)；store.get(key) 不为空时说明之前已划分过，直接沿用。"""
+        planner = IntervalPlanner(start_date, end_date, MAX_PAGES)
+        store = PlanStore(f'{self.saving_path}\{self.file_type}.plan.json')
+        return planner, store, PlanStore.key(self.searchkey, planner.start, planner.end, MAX_PAGES)
+
+    def plan_intervals(self, start_date, end_date):
+        """按结果密度自适应划分日期区间（见 planner.py）；划分结果保存后，重启时沿用。"""
+        planner, store, key = self.interval_planner(start_date, end_date)
+        intervals = store.get(key)
+        if intervals is not None:
+            return intervals
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            intervals = planner.plan(lambda seDates: list(
+                executor.map(lambda seDate: self.query_page(seDate, 1)[1], seDates)))
+        store.put(key, intervals)
+        print(f"自适应划分：查询 {planner.probes} 次，共 {len(intervals)} 个区间")
+        return intervals
+
     def CircleScrape(self, DATA_RANGE):
-        for i, seDate in enumerate(DATA_RANGE):
-            DATA['seDate'] = seDate
-            print(f"当前爬取区间：{seDate}，为列表第 {i+1}/{len(DATA_RANGE)} 个")
-            pageNum = 1
-            while True:
-                if not self.process_page_for_downloads(pageNum):
-                    break
-                # 有时候会出现奇怪的bug导致迟迟无法结束，故设定500页的最大值强行停止
-                if pageNum >= 500:
+        with ThreadPoolExecutor(max_workers=self.workers) as executor, \
+                ThreadPoolExecutor(max_workers=self.prefetch_pages) as query_executor:
+            self.executor = executor
+            self.query_executor = query_executor
+            try:
+                for i, seDate in enumerate(DATA_RANGE):
+                    print(f"当前爬取区间：{seDate}，为列表第 {i+1}/{len(DATA_RANGE)} 个")
+                    try:
+                        self.scrape_interval(seDate)
+                    except Exception as e:
+                        # 查询重试次数用完：该区间在爬取进度中保持未完成，下次运行时继续
+                        print(f"{seDate}：查询失败，跳过该区间: {e}")
+            finally:
+                self.executor = None
+                self.query_executor = None
+                if self.file_download == 0:
+                    MetadataSink.open(metadata_csv_path(self.root_file_path, self.file_type)).flush()
+
+    def scrape_interval(self, seDate):
+        """
+        爬取一个日期区间的全部页。
+        总页数只在第 1 页的响应中读取一次；之后的页由查询线程池提前 prefetch_pages 页并发请求，
+        与当前页的下载同时进行。区间结束时等待该区间的全部下载完成。
+        已记录在爬取进度中的区间和页直接跳过。
+        """
+        if not self.frontier.begin_interval(self.searchkey, seDate):
+            print(f"{seDate}：已完成，跳过")
+            return
+        self.pending = []
+
+        totalpages = self.frontier.totalpages(self.searchkey, seDate)
+        first_page = None
+        if totalpages is None:
+            first_page = Future()
+            first_page.set_result(self.query_page(seDate, 1))
+            totalpages = first_page.result()[1]
+            self.frontier.set_totalpages(self.searchkey, seDate, totalpages)
+        # 有时候会出现奇怪的bug导致迟迟无法结束，故设定500页的最大值强行停止
+        maxpage = totalpages + 1
+        last_page = min(maxpage, MAX_PAGES)
+        pages = iter([p for p in range(1, last_page + 1)
+                      if not self.frontier.is_page_done(self.searchkey, seDate, p)])
+
+        prefetched = deque()
+
+        def fill():
+            while len(prefetched) < self.prefetch_pages:
+                pageNum = next(pages, None)
+                if pageNum is None:
+                    return
+                if pageNum == 1 and first_page is not None:
+                    prefetched.append((pageNum, first_page))
+                else:
+                    prefetched.append((pageNum, self.query_executor.submit(self.query_page, seDate, pageNum)))
+
+        fill()
+        try:
+            while prefetched:
+                pageNum, future = prefetched.popleft()
+                fill()
+                result, _ = future.result()
+                if not self.process_page_for_downloads(seDate, pageNum, result, maxpage):
                     break
-                pageNum += 1
+        finally:
+            for _, future in prefetched:
+                future.cancel()
+            wait(self.pending)
+        # 区间内的公告全部处理成功（记录已写入 CSV）才标记区间完成
+        if all(_announcement_result(future) is True for future in self.pending):
+            self.frontier.mark_interval_done(self.searchkey, seDate)
+        self.pending = []
+
+
+def _announcement_result(future):
+    """公告处理结果；只保存记录时结果是 MetadataSink 的 Future，等待其写入完成。"""
+    result = future.result()
+    while isinstance(result, Future):
+        result = result.result()
+    return result
 
 
 def main(customer_req):
-    DATA_RANGE = create_date_intervals(
-        customer_req["interval"], customer_req["start_date"], customer_req["end_date"])
-    if FILE_INFO_JSON[customer_req["file_type"]]["use_keyword"] == 1:
-        for searchkey in FILE_INFO_JSON[customer_req["file_type"]]["search_keys"]:
+    controllers = rate_controllers(customer_req, reset=True)
+    adaptive = customer_req.get("adaptive_interval", 0) == 1
+    if not adaptive:
+        DATA_RANGE = create_date_intervals(
+            customer_req["interval"], customer_req["start_date"], customer_req["end_date"])
+    file_info = FILE_INFO_JSON[customer_req["file_type"]]
+    searchkeys = file_info["search_keys"] if file_info["use_keyword"] == 1 else ['']
+    for searchkey in searchkeys:
+        if searchkey:
             print(f"当前检索关键词：{searchkey}")
-            DATA['searchkey'] = searchkey
-            FuncScraper(customer_req).CircleScrape(DATA_RANGE)
-    else:
-        FuncScraper(customer_req).CircleScrape(DATA_RANGE)
+        scraper = FuncScraper(customer_req, searchkey)
+        if adaptive:
+            DATA_RANGE = scraper.plan_intervals(customer_req["start_date"], customer_req["end_date"])
+        scraper.CircleScrape(DATA_RANGE)
+    AnnouncementFilter.open(customer_req["file_type"]).report()
+    for controller in controllers:
+        controller.report()
     print('下载完毕')
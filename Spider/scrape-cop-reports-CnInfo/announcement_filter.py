@@ -0,0 +1,145 @@
+# -*- encoding: utf-8 -*-
+"""
+公告过滤（每个 file_type 编译一次，线程模式和异步模式共用）。
+
+原来每条公告都要执行一串未编译的 re.sub 清洗标题和简称，再对停用词表和关键词表逐个 re.search。
+这里在创建时把停用词合并成一个正则、关键词合并成一个正则，字符替换用一张 str.translate 转换表，
+filter_page 一次处理一整页公告，返回通过过滤的记录，并按原因统计被跳过的条数。
+清洗规则、文件名规则和过滤顺序与原来完全一致。
+"""
+import datetime
+import re
+import threading
+from collections import Counter
+
+from constant import FILE_INFO_JSON
+from utils import get_CSR_tag
+
+# 标题：去掉高亮标签和文件名中不允许的字符；下划线改为 '-'，防止与文件名中的下划线冲突
+TITLE_STRIP = re.compile(r'<em>|</em>|[/:*?"<>| ]')
+TITLE_TABLE = str.maketrans({'_': '-'})
+# 简称：额外去掉残留的 'em'，全角 Ａ/Ｂ 改为半角
+SECNAME_STRIP = re.compile(r'<em>|</em>|em|[/:*?"<>| ]')
+SECNAME_TABLE = str.maketrans({'Ａ': 'A', 'Ｂ': 'B', '_': '-'})
+YEAR_PATTERN = re.compile(r'20\d{2}')
+
+# 被跳过的原因
+DROP_STOPWORD = "停用词"
+DROP_NO_KEYWORD = "不含关键词"
+DROP_NO_CSR_TAG = "无CSR类型"
+DROP_EXISTS = "已存在"
+DROP_RECORDED = "已记录"
+DROP_NOT_NEWER = "非更新版本"
+DROP_ERROR = "解析失败"
+
+
+def _union(patterns):
+    """把多个正则合并为一个：任意一个能匹配，合并后的正则就能匹配。"""
+    return re.compile('|'.join(f'(?:{p})' for p in patterns))
+
+
+class AnnouncementFilter:
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, file_type):
+        file_info = FILE_INFO_JSON[file_type]
+        self.file_type = file_type
+        self.is_csr = any(word in file_type for word in ["社会责任", "ESG", "CSR"])
+        self.is_duplicate_not_allowed = file_info["is_duplicate_not_allowed"]
+        self.stopwords = _union(file_info["stopwords_list"]) if file_info["stopwords_list"] else None
+        # 要求标题中带有关键词时才需要关键词正则
+        self.keywords = _union(sorted(set(file_info["search_keys"]))) if file_info["use_keyword"] == 1 else None
+        self.kept = 0
+        self.drops = Counter()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def open(cls, file_type):
+        """获取 file_type 对应的共享实例（正则只编译一次，统计在各关键词的爬虫之间累计）。"""
+        with cls._instances_lock:
+            announcement_filter = cls._instances.get(file_type)
+            if announcement_filter is None:
+                announcement_filter = cls._instances[file_type] = cls(file_type)
+            return announcement_filter
+
+    def parse(self, i):
+        """清洗一条公告并生成文件名。返回 (记录, 跳过原因)，通过过滤时原因为 None。"""
+        title = TITLE_STRIP.sub('', i['announcementTitle']).translate(TITLE_TABLE)
+        announcementTime = datetime.datetime.fromtimestamp(
+            i["announcementTime"] / 1000).strftime('%Y-%m-%d')
+        secName = i['secName'] if i['secName'] is not None else 'None'
+        secName = SECNAME_STRIP.sub('', secName.replace('*ST', '＊ST')).translate(SECNAME_TABLE)
+        # 如果代码为空，则从企业唯一的id获得
+        secCode = i['secCode']
+        if secCode is None:
+            secCode = i['orgId'][5:11]
+        file_suffix = i['adjunctUrl'].split(".")[1].lower()
+        # 会计年度：默认从标题中检索，标题中没有时用发布日期的年份减 1
+        seYear = YEAR_PATTERN.search(title)
+        seYear = str(int(announcementTime[0:4]) - 1) if seYear is None else seYear.group()
+
+        # fileName：保存到本地的文件名；fileShortName：输出打印时显示的名字
+        if self.is_csr:
+            csr_tag = get_CSR_tag(title)
+            if csr_tag == "":
+                return None, DROP_NO_CSR_TAG
+            fileShortName = f'{secCode}_{seYear}_{csr_tag}_{secName}'
+            fileName = f'{fileShortName}_{title}_{announcementTime}.{file_suffix}'
+        elif self.is_duplicate_not_allowed == 1:
+            # is_duplicate_not_allowed时，用企业-年份作为主键
+            fileShortName = f'{secCode}_{seYear}_{secName}'
+            fileName = f'{fileShortName}_{title}_{announcementTime}.{file_suffix}'
+        else:
+            fileShortName = f'{secCode}_{announcementTime}_{secName}'
+            fileName = f'{fileShortName}_{title}.{file_suffix}'
+
+        # 1. 对于标题包含停用词的报告，跳过
+        if self.stopwords is not None and self.stopwords.search(title):
+            print(f'{fileShortName}：\t包括停用词 ({title})')
+            return None, DROP_STOPWORD
+        # 2. 如果要求标题中带有关键词，则跳过不包含关键词的报告
+        if self.keywords is not None and not self.keywords.search(title):
+            print(f'{fileShortName}：\t不含关键词 ({title})')
+            return None, DROP_NO_KEYWORD
+        return {
+            "adjunctUrl": i['adjunctUrl'],
+            "announcementTime": announcementTime,
+            "fileName": fileName,
+            "fileShortName": fileShortName,
+        }, None
+
+    def filter_page(self, announcements):
+        """
+        过滤一整页公告，返回 (通过过滤的记录列表, 解析失败的条数)。
+        单条公告解析出错只跳过该条，调用方据此不把该页记为完成。
+        """
+        records = []
+        drops = Counter()
+        for i in announcements:
+            try:
+                record, reason = self.parse(i)
+            except Exception as e:
+                print(f'处理公告失败: {e}')
+                record, reason = None, DROP_ERROR
+            if reason is None:
+                records.append(record)
+            else:
+                drops[reason] += 1
+        with self._lock:
+            self.kept += len(records)
+            self.drops.update(drops)
+        return records, drops[DROP_ERROR]
+
+    def count(self, reason):
+        """记录过滤之后（下载前的判断中）被跳过的一条公告。"""
+        with self._lock:
+            self.drops[reason] += 1
+
+    def report(self):
+        with self._lock:
+            drops = dict(self.drops)
+            kept = self.kept
+        detail = "，".join(f"{reason} {n} 条" for reason, n in sorted(drops.items(), key=lambda x: -x[1]))
+        print(f"[{self.file_type}] 公告过滤：通过 {kept} 条" + (f"；跳过：{detail}" if detail else ""))
+        return drops
@@ -0,0 +1,171 @@
+# -*- encoding: utf-8 -*-
+"""
+bench_spider.py
+
+爬虫性能的离线基准测试，服务器为本机的巨潮替身（stand_in_server.py），不访问 cninfo.com.cn。
+
+    pooling  HTTP 连接复用：比较每次请求新建连接（requests.post / requests.get）与每线程 Session 长连接
+             （get_session）时的查询页数/秒和下载文件数/秒。本机回环上建连几乎没有开销，
+             因此服务器在每个新连接建立时固定等待 CONNECT_DELAY_MS，模拟真实站点的握手时延。
+    crawl    用 FuncScraper（或 --async 时用 AsyncScraper）完整爬取替身服务器上的合成公告，
+             按服务器侧统计报告 查询/秒、下载/秒 和 MB/秒；可配置页数、时延和错误注入。
+
+用法：python bench_spider.py [pooling|crawl|all] [--days 10 --pages 5 --latency-ms 20 --error-rate 0.01 ...]
+"""
+import argparse
+import contextlib
+import datetime
+import io
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+import AsyncScraper
+import FuncScraper
+from constant import DATA, HEADERS
+from stand_in_server import query_url, stand_in_server, static_url
+from utils import download_file, get_session
+
+CONNECT_DELAY_MS = 30      # 模拟的建连时延
+QUERY_PAGES = 200
+DOWNLOADS = 400
+DOWNLOAD_WORKERS = 10      # 与 spider.py 默认的 workers 一致
+PDF_BYTES = 256 * 1024
+
+
+def bench_queries(base_url: str, pooled: bool) -> float:
+    """模拟 CircleScrape 顺序翻页查询，返回 页/秒。"""
+    post = get_session().post if pooled else requests.post
+    start = time.perf_counter()
+    for page in range(1, QUERY_PAGES + 1):
+        data = dict(DATA, pageNum=page)
+        data['seDate'] = '2020-01-01~2020-01-01'
+        post(query_url(base_url), data=data, headers=HEADERS).json()["announcements"]
+    return QUERY_PAGES / (time.perf_counter() - start)
+
+
+def _bare_download(url, file_path, lock_path, name):
+    with requests.get(url, stream=True) as r:
+        r.raise_for_status()
+        with open(file_path, "wb") as f:
+            for chunk in r.iter_content(chunk_size=8192):
+                f.write(chunk)
+    with open(lock_path, "a", encoding="utf-8") as lock_file:
+        lock_file.write(f"{name}\n")
+
+
+def bench_downloads(base_url: str, pooled: bool) -> float:
+    """DOWNLOAD_WORKERS 个线程并发下载，返回 文件/秒。"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        lock_path = os.path.join(tmp_dir, "lock.txt")
+
+        def task(k):
+            name = f"{k:06d}.pdf"
+            url = f"{base_url}/finalpage/{name}"
+            file_path = os.path.join(tmp_dir, name)
+            if pooled:
+                download_file(url, file_path, name, lock_path, name)
+            else:
+                _bare_download(url, file_path, lock_path, name)
+
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as executor:
+                list(executor.map(task, range(DOWNLOADS)))
+        elapsed = time.perf_counter() - start
+        assert len(os.listdir(tmp_dir)) == DOWNLOADS + 1, "部分文件下载失败"
+    return DOWNLOADS / elapsed
+
+
+def bench_pooling():
+    print(f"模拟建连时延 {CONNECT_DELAY_MS} ms，{QUERY_PAGES} 页查询，"
+          f"{DOWNLOADS} 个 {PDF_BYTES // 1024} KB 文件（{DOWNLOAD_WORKERS} 线程）")
+    with stand_in_server(pages=QUERY_PAGES, connect_delay_ms=CONNECT_DELAY_MS,
+                         pdf_bytes=PDF_BYTES) as (base_url, _):
+        bare_pages = bench_queries(base_url, pooled=False)
+        pooled_pages = bench_queries(base_url, pooled=True)
+        print(f"查询  每次新建连接: {bare_pages:8.1f} 页/秒   Session 长连接: {pooled_pages:8.1f} 页/秒"
+              f"   (x{pooled_pages / bare_pages:.1f})")
+        bare_files = bench_downloads(base_url, pooled=False)
+        pooled_files = bench_downloads(base_url, pooled=True)
+        print(f"下载  每次新建连接: {bare_files:8.1f} 个/秒   Session 长连接: {pooled_files:8.1f} 个/秒"
+              f"   (x{pooled_files / bare_files:.1f})")
+
+
+def bench_crawl(args):
+    """完整爬取 args.days 个单日区间，返回服务器侧统计及 查询/秒、下载/秒、MB/秒。"""
+    server_config = {
+        "pages": args.pages,
+        "pdf_bytes": args.pdf_kb * 1024,
+        "latency_ms": args.latency_ms,
+        "connect_delay_ms": args.connect_delay_ms,
+        "error_rate": args.error_rate,
+        "error_status": args.error_status,
+        "cut_rate": args.cut_rate,
+    }
+    print(f"爬取 {args.days} 天 x {args.pages} 页，{args.pdf_kb} KB/文件，时延 {args.latency_ms} ms，"
+          f"错误率 {args.error_rate:.1%}，断流率 {args.cut_rate:.1%}，{'异步' if args.use_async else '线程'}模式")
+    with tempfile.TemporaryDirectory() as tmp_dir, stand_in_server(**server_config) as (base_url, server):
+        customer_req = {
+            "file_type": "A股年报",
+            "root_file_path": os.path.join(tmp_dir, "data"),
+            "start_date": "2020-01-01",
+            "end_date": (datetime.date(2020, 1, 1) + datetime.timedelta(days=args.days)).strftime("%Y-%m-%d"),
+            "interval": 0,  # 单日区间
+            "workers": args.workers,
+            "file_download": 1,
+            "query_rate": None,
+            "download_rate": None,
+            "query_concurrency": args.query_concurrency,
+            "query_url": query_url(base_url),
+            "static_url": static_url(base_url),
+        }
+        start = time.perf_counter()
+        log = io.StringIO()
+        with contextlib.redirect_stdout(log):
+            (AsyncScraper if args.use_async else FuncScraper).main(customer_req)
+        elapsed = time.perf_counter() - start
+        stats = server.stats()
+    stats.update({
+        "elapsed": elapsed,
+        "queries_per_sec": stats["queries"] / elapsed,
+        "downloads_per_sec": stats["downloads"] / elapsed,
+        "mb_per_sec": stats["bytes_sent"] / elapsed / 1024 / 1024,
+    })
+    # 速率控制器的汇总（请求数、错误与过载次数）
+    for line in log.getvalue().splitlines():
+        if line.startswith(("[query] 请求", "[download] 请求")):
+            print(line)
+    print(f"用时 {elapsed:.2f} 秒：查询 {stats['queries']} 次 ({stats['queries_per_sec']:.1f} 次/秒)，"
+          f"下载 {stats['downloads']} 个 ({stats['downloads_per_sec']:.1f} 个/秒)，"
+          f"{stats['mb_per_sec']:.2f} MB/秒，注入错误 {stats['errors_injected']} 次")
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="爬虫离线基准测试")
+    parser.add_argument("mode", nargs="?", default="all", choices=["pooling", "crawl", "all"])
+    parser.add_argument("--days", type=int, default=10, help="爬取的单日区间数")
+    parser.add_argument("--pages", type=int, default=5, help="每个区间的页数")
+    parser.add_argument("--pdf-kb", type=int, default=PDF_BYTES // 1024, help="每个 PDF 的大小（KB）")
+    parser.add_argument("--latency-ms", type=int, default=20, help="服务器处理每个请求的时延")
+    parser.add_argument("--connect-delay-ms", type=int, default=CONNECT_DELAY_MS, help="每个新连接的建连时延")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="注入错误的概率")
+    parser.add_argument("--error-status", type=int, default=500,
+                        help="注入错误的状态码：500 为偶发错误，503 / 429 为服务器过载")
+    parser.add_argument("--cut-rate", type=float, default=0.0, help="下载中途断开的概率")
+    parser.add_argument("--workers", type=int, default=DOWNLOAD_WORKERS)
+    parser.add_argument("--query-concurrency", type=int, default=4)
+    parser.add_argument("--async", dest="use_async", action="store_true", help="使用异步模式（需要 aiohttp）")
+    args = parser.parse_args()
+    if args.mode in ("pooling", "all"):
+        bench_pooling()
+    if args.mode in ("crawl", "all"):
+        bench_crawl(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -9,7 +9,9 @@ import tempfile
 import pandas as pd
 from concurrent.futures import ThreadPoolExecutor
 import jieba
+from trade import TRADE  # 行业门类定义在无依赖的 trade.py 中，这里保留 constant.TRADE 的引用
 URL = 'http://www.cninfo.com.cn/new/hisAnnouncement/query'
+STATIC_URL = 'http://static.cninfo.com.cn/'
 HEADERS = {
     'Accept': '*/*',
     'Accept-Encoding': 'gzip, deflate',
@@ -22,10 +24,6 @@ HEADERS = {
     'Referer': 'http://www.cninfo.com.cn/new/commonUrl/pageOfSearch?url=disclosure/list/search',
     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/93.0.4577.82 Safari/537.36',
     'X-Requested-With': 'XMLHttpRequest'}
-TRADE = ['农、林、牧、渔业', '电力、热力、燃气及水生产和供应业', '交通运输、仓储和邮政业',
-         '金融业', '科学研究和技术服务业', '教育', '综合', '采矿业', '建筑业', '住宿和餐饮业',
-         '房地产业', '水利、环境和公共设施管理业', '卫生和社会工作', '制造业', '批发和零售业',
-         '信息传输、软件和信息技术服务业', '租赁和商务服务业', '居民服务、修理和其他服务业', '文化、体育和娱乐业']
 
 DATA = {
     'pageNum': '',
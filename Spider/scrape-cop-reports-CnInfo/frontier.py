@@ -0,0 +1,131 @@
+# -*- encoding: utf-8 -*-
+"""
+爬取进度（frontier），保存在 {file_type}.frontier.jsonl，重启后从中断处继续。
+
+文件为仅追加的 JSON Lines，每行一条事件，key 为检索关键词（不按关键词检索时为空字符串），seDate 为日期区间：
+    {"key": "", "seDate": "2020-04-01~2020-04-02", "event": "total", "totalpages": 35}  第 1 页查询得到的总页数
+    {"key": "", "seDate": "...", "event": "page", "page": 3}                           该页的公告全部处理成功
+    {"key": "", "seDate": "...", "event": "done"}                                      整个区间完成
+    {"key": "", "seDate": "...", "event": "reset"}                                     强制重爬，清空该区间此前的记录
+续跑时已完成的区间直接跳过；未完成的区间只查询尚未完成的页，已知总页数时也不再重复查询第 1 页。
+
+recrawl 用于强制重爬：None 表示不重爬；"all" 表示全部重爬；
+或日期范围列表，如 ["2020-04-01~2020-04-30"]，与之有重叠的区间在本次运行中重爬一次。
+"""
+import datetime
+import json
+import os
+import threading
+
+
+def _parse_range(seDate):
+    start, _, end = seDate.partition('~')
+    return (datetime.datetime.strptime(start.strip(), "%Y-%m-%d").date(),
+            datetime.datetime.strptime((end or start).strip(), "%Y-%m-%d").date())
+
+
+class CrawlFrontier:
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, path, recrawl=None):
+        self.path = path
+        self._state = {}
+        self._lock = threading.Lock()
+        self._recrawl_all = recrawl == "all"
+        self._recrawl_ranges = [] if recrawl in (None, "all") else [_parse_range(r) for r in recrawl]
+        self._reset_this_run = set()
+        self._load()
+
+    @classmethod
+    def open(cls, path, recrawl=None):
+        """获取 path 对应的共享实例（各关键词的爬虫共用一个进度文件）。"""
+        key = os.path.abspath(path)
+        with cls._instances_lock:
+            frontier = cls._instances.get(key)
+            if frontier is None:
+                frontier = cls._instances[key] = cls(path, recrawl)
+            return frontier
+
+    # ------------------------------------------------------------------
+    # 查询
+    # ------------------------------------------------------------------
+    def begin_interval(self, key, seDate):
+        """
+        开始爬取一个区间前调用。若该区间在 recrawl 范围内且本次运行尚未重置，则清空其记录。
+        返回 False 表示区间已完成、可以跳过。
+        """
+        with self._lock:
+            if (key, seDate) not in self._reset_this_run and self._should_recrawl(seDate):
+                self._reset_this_run.add((key, seDate))
+                if (key, seDate) in self._state:
+                    self._apply_and_append({"key": key, "seDate": seDate, "event": "reset"})
+            state = self._state.get((key, seDate))
+            return not (state and state["done"])
+
+    def totalpages(self, key, seDate):
+        state = self._state.get((key, seDate))
+        return state["total"] if state else None
+
+    def is_page_done(self, key, seDate, page):
+        state = self._state.get((key, seDate))
+        return bool(state) and page in state["pages"]
+
+    # ------------------------------------------------------------------
+    # 记录（线程安全）
+    # ------------------------------------------------------------------
+    def set_totalpages(self, key, seDate, totalpages):
+        with self._lock:
+            self._apply_and_append({"key": key, "seDate": seDate, "event": "total", "totalpages": totalpages})
+
+    def mark_page_done(self, key, seDate, page):
+        with self._lock:
+            self._apply_and_append({"key": key, "seDate": seDate, "event": "page", "page": page})
+
+    def mark_interval_done(self, key, seDate):
+        with self._lock:
+            self._apply_and_append({"key": key, "seDate": seDate, "event": "done"})
+
+    # ------------------------------------------------------------------
+    # 内部实现
+    # ------------------------------------------------------------------
+    def _should_recrawl(self, seDate):
+        if self._recrawl_all:
+            return True
+        if not self._recrawl_ranges:
+            return False
+        start, end = _parse_range(seDate)
+        return any(start <= r_end and r_start <= end for r_start, r_end in self._recrawl_ranges)
+
+    def _apply(self, record):
+        interval = (record["key"], record["seDate"])
+        event = record["event"]
+        if event == "reset":
+            self._state.pop(interval, None)
+            return
+        state = self._state.setdefault(interval, {"total": None, "pages": set(), "done": False})
+        if event == "total":
+            state["total"] = record["totalpages"]
+        elif event == "page":
+            state["pages"].add(record["page"])
+        elif event == "done":
+            state["done"] = True
+
+    def _apply_and_append(self, record):
+        self._apply(record)
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        line = ''
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    self._apply(json.loads(line))
+                except (ValueError, KeyError):
+                    continue  # 崩溃时写了一半的行
+        if line and not line.endswith('\n'):
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write('\n')
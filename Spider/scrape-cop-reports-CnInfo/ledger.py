@@ -0,0 +1,105 @@
+# -*- encoding: utf-8 -*-
+"""
+下载记录（{file_type}.txt）的内存索引。
+
+记录文件格式不变：每行一个已下载的文件名，仅追加写入。启动时读取一次，之后：
+    - 文件名是否已记录：集合查询，O(1)
+    - 同一企业-年度（fileShortName[:11]，即 "代码_年份"）已记录报告的最新发布日期：字典查询，O(1)
+同一路径在进程内只有一个 DownloadLedger 实例（DownloadLedger.open），多个下载线程共用，读写由锁保护。
+"""
+import datetime
+import os
+import re
+import threading
+
+_DATE_PATTERN = re.compile(r"_(\d{4}-\d{2}-\d{2})\.\w+")
+FIRM_YEAR_KEY_LEN = 11  # "000001_2023"
+
+
+class DownloadLedger:
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, path):
+        self.path = path
+        self._files = set()
+        self._latest = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    @classmethod
+    def open(cls, path):
+        """获取 path 对应的共享实例（首次调用时加载记录文件）。"""
+        key = os.path.abspath(path)
+        with cls._instances_lock:
+            ledger = cls._instances.get(key)
+            if ledger is None:
+                ledger = cls._instances[key] = cls(path)
+            return ledger
+
+    def __contains__(self, fileName):
+        return fileName in self._files
+
+    def __len__(self):
+        return len(self._files)
+
+    def latest_date(self, firm_year_key):
+        """该企业-年度已记录报告中最新的发布日期，没有记录时返回 None。"""
+        return self._latest.get(firm_year_key)
+
+    def is_newer(self, announcementTime, fileShortName):
+        """
+        在不允许年度重复的情况下，比对同一代码、同一年份已记录报告的日期：
+        待下载报告比已有记录晚一天以上才需要下载（不同来源或下载时记录的日期可能因四舍五入差一天）。
+        """
+        key = fileShortName[:FIRM_YEAR_KEY_LEN]
+        latest = self._latest.get(key)
+        if latest is None:
+            return True
+        time_of_downloading_file = datetime.datetime.strptime(announcementTime, "%Y-%m-%d").date()
+        if time_of_downloading_file - latest <= datetime.timedelta(days=1):
+            print(f'{fileShortName}：\t有新版不下载:{latest}')
+            return False
+        print(f'{fileShortName}：\t需要更新:{latest}')
+        return True
+
+    def add(self, fileName):
+        """记录一个已下载的文件：先追加到记录文件，再更新索引。"""
+        with self._lock:
+            if fileName in self._files:
+                return
+            with open(self.path, 'a', encoding='utf-8', errors='ignore') as lock_file:
+                lock_file.write(f'{fileName}\n')
+            self._index(fileName)
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            with open(self.path, 'w'):
+                pass
+            return
+        line = ''
+        with open(self.path, 'r', encoding='utf-8', errors='ignore') as lock_file:
+            for line in lock_file:
+                fileName = line.rstrip('\n')
+                if fileName:
+                    self._index(fileName)
+        # 最后一行没有换行符时先补上，避免追加的记录与之连成一行
+        if line and not line.endswith('\n'):
+            with open(self.path, 'a', encoding='utf-8') as lock_file:
+                lock_file.write('\n')
+
+    def _index(self, fileName):
+        self._files.add(fileName)
+        # 与原来逐行正则匹配的规则一致："代码_年份_..._YYYY-MM-DD.后缀"
+        if len(fileName) <= FIRM_YEAR_KEY_LEN or fileName[FIRM_YEAR_KEY_LEN] != '_':
+            return
+        match = _DATE_PATTERN.search(fileName)
+        if match is None:
+            return
+        try:
+            date = datetime.datetime.strptime(match.group(1), "%Y-%m-%d").date()
+        except ValueError:
+            return
+        key = fileName[:FIRM_YEAR_KEY_LEN]
+        if key not in self._latest or date > self._latest[key]:
+            self._latest[key] = date
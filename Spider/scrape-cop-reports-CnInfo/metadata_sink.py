@@ -0,0 +1,155 @@
+# -*- encoding: utf-8 -*-
+"""
+file_download=0 模式下的元数据输出（{file_type}.csv）。
+
+启动时读取一次已有 CSV，把下载链接放入内存集合；之后每条公告只做一次集合查询，
+新记录放入队列，由唯一的写线程按批追加到 CSV，多个爬取线程不会同时写文件。
+列与原来一致：股票代码, 年份, [类型,] 股票简称, 文件标题, 发布日期, 下载链接（按文件名分列结果决定）。
+
+add() 返回一个 Future：记录写入 CSV 后结果为 True。写入失败时整批最多重试 WRITE_ATTEMPTS 次，
+仍失败则把这批链接移出内存集合（之后可以重新登记）并把 Future 设为 False，
+调用方据此不把所在页记为完成，续跑时重新处理。
+"""
+import csv
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+BATCH_ROWS = 500
+FLUSH_INTERVAL = 1.0  # 秒
+WRITE_ATTEMPTS = 3
+WRITE_RETRY_DELAY = 1.0  # 秒，第 n 次重试前等待 WRITE_RETRY_DELAY * 2 ** (n - 1)
+
+
+def _done_future(result):
+    future = Future()
+    future.set_result(result)
+    return future
+
+
+def split_file_name(fileName):
+    """按文件名分列，返回列名到取值的字典；不符合要求时返回 None。"""
+    split_name = os.path.splitext(fileName)[0].split('_')
+    if len(split_name) == 6:
+        column_names = ['股票代码', '年份', '类型', '股票简称', '文件标题', '发布日期']
+    elif len(split_name) == 5:
+        column_names = ['股票代码', '年份', '股票简称', '文件标题', '发布日期']
+    elif len(split_name) == 4:
+        column_names = ['股票代码', '发布日期', '股票简称', '文件标题']
+    else:
+        return None
+    return dict(zip(column_names, split_name))
+
+
+class MetadataSink:
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, csv_path):
+        self.csv_path = csv_path
+        self._urls = set()
+        self._pending = {}  # 已登记、尚未写入的链接 -> Future
+        self.failed = 0
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._load()
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
+
+    @classmethod
+    def open(cls, csv_path):
+        """获取 csv_path 对应的共享实例（首次调用时加载已有记录并启动写线程）。"""
+        key = os.path.abspath(csv_path)
+        with cls._instances_lock:
+            sink = cls._instances.get(key)
+            if sink is None:
+                sink = cls._instances[key] = cls(csv_path)
+            return sink
+
+    def __contains__(self, downloadUrl):
+        return downloadUrl in self._urls
+
+    def add(self, downloadUrl, fileName, fileShortName):
+        """
+        登记一条公告，返回 Future：写入 CSV 后为 True，重试用完仍写入失败为 False。
+        文件名不符合要求（不需要记录）时返回已完成的 True；链接正在等待写入时返回同一个 Future。
+        """
+        new_entry = split_file_name(fileName)
+        if new_entry is None:
+            print("文件名分列结果不符合要求，跳过。")
+            return _done_future(True)
+        new_entry['下载链接'] = downloadUrl
+        with self._lock:
+            pending = self._pending.get(downloadUrl)
+            if pending is not None:
+                return pending
+            if downloadUrl in self._urls:
+                print(f'{fileShortName}：\t链接已存在')
+                return _done_future(True)
+            self._urls.add(downloadUrl)
+            future = self._pending[downloadUrl] = Future()
+        self._queue.put((new_entry, future))
+        print(f'{fileShortName}：\t已保存记录')
+        return future
+
+    def flush(self):
+        """阻塞到队列中的记录全部处理完（写入或重试用完），返回累计写入失败的记录数。"""
+        self._queue.join()
+        if self.failed:
+            print(f'元数据写入失败 {self.failed} 条，所在页未记为完成，续跑时重新处理')
+        return self.failed
+
+    def _load(self):
+        if not os.path.exists(self.csv_path):
+            return
+        with open(self.csv_path, 'r', encoding='utf-8-sig', errors='ignore', newline='') as f:
+            for row in csv.DictReader(f):
+                url = row.get('下载链接')
+                if url:
+                    self._urls.add(url)
+
+    def _write_loop(self):
+        while True:
+            batch = [self._queue.get()]
+            try:
+                while len(batch) < BATCH_ROWS:
+                    batch.append(self._queue.get(timeout=FLUSH_INTERVAL))
+            except queue.Empty:
+                pass
+            try:
+                ok = self._write_with_retry([entry for entry, _ in batch])
+                with self._lock:
+                    for entry, _ in batch:
+                        url = entry['下载链接']
+                        self._pending.pop(url, None)
+                        if not ok:
+                            self._urls.discard(url)
+                    if not ok:
+                        self.failed += len(batch)
+                for _, future in batch:
+                    future.set_result(ok)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write_with_retry(self, entries):
+        for attempt in range(WRITE_ATTEMPTS):
+            try:
+                self._write_batch(entries)
+                return True
+            except Exception as e:
+                # 常见原因是 CSV 被其他程序（如 Excel）占用
+                print(f'元数据写入失败（第 {attempt + 1}/{WRITE_ATTEMPTS} 次）: {e}')
+                if attempt + 1 < WRITE_ATTEMPTS:
+                    time.sleep(WRITE_RETRY_DELAY * 2 ** attempt)
+        return False
+
+    def _write_batch(self, batch):
+        is_new = not os.path.exists(self.csv_path)
+        with open(self.csv_path, 'a', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            if is_new:
+                writer.writerow(batch[0].keys())
+            writer.writerows(entry.values() for entry in batch)
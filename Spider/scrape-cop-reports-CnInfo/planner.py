@@ -0,0 +1,111 @@
+# -*- encoding: utf-8 -*-
+"""
+自适应日期区间划分（customer_req["adaptive_interval"] = 1）。
+
+固定 interval 天的区间在公告稀少时每天浪费一次查询，在 4 月年报高峰又会超过 500 页上限。
+这里先查询整个日期范围第 1 页得到总页数，超过上限的区间对半拆分后继续查询（同一层的区间并发查询），
+直到每个区间都不超过上限；最后把相邻的小区间合并，使合并后页数之和仍不超过上限。
+这样区间数最少，爬取时的查询次数也最少。单日区间无法再拆分，超过上限时只能截断并给出提示。
+
+划分结果保存在 {file_type}.plan.json 中，重启后沿用同一划分，保证与爬取进度（frontier）中的区间一致。
+"""
+import datetime
+import json
+import os
+import threading
+
+DATE_FORMAT = "%Y-%m-%d"
+
+
+def _format(start, end):
+    return f"{start.strftime(DATE_FORMAT)}~{end.strftime(DATE_FORMAT)}"
+
+
+class IntervalPlanner:
+    def __init__(self, start_date="2000-01-01", end_date=None, max_pages=500):
+        self.start = datetime.datetime.strptime(start_date, DATE_FORMAT).date()
+        self.end = (datetime.date.today() if end_date is None
+                    else datetime.datetime.strptime(end_date, DATE_FORMAT).date())
+        self.max_pages = max_pages
+        self.probes = 0
+
+    def plan(self, probe_many):
+        """
+        probe_many(seDates) 返回每个区间第 1 页查询得到的 totalpages（可以并发查询）。
+        返回日期区间字符串列表，格式与 create_date_intervals 相同。
+        """
+        leaves = []
+        level = [(self.start, self.end)]
+        while level:
+            totals = probe_many([_format(s, e) for s, e in level])
+            self.probes += len(level)
+            level = self._split(level, totals, leaves)
+        return self._merge(leaves)
+
+    async def plan_async(self, probe_many):
+        """与 plan 相同，probe_many 为协程函数。"""
+        leaves = []
+        level = [(self.start, self.end)]
+        while level:
+            totals = await probe_many([_format(s, e) for s, e in level])
+            self.probes += len(level)
+            level = self._split(level, totals, leaves)
+        return self._merge(leaves)
+
+    def _split(self, level, totals, leaves):
+        """不超过上限的区间放入 leaves，超过上限的区间对半拆分，返回下一层待查询的区间。"""
+        next_level = []
+        for (start, end), totalpages in zip(level, totals):
+            # 与爬取时一致：需要查询的页数为 totalpages + 1
+            pages = (totalpages or 0) + 1
+            if pages <= self.max_pages or start == end:
+                if pages > self.max_pages:
+                    print(f"{_format(start, end)}：单日 {pages} 页，超过 {self.max_pages} 页上限，将被截断")
+                leaves.append((start, end, pages))
+                continue
+            mid = start + (end - start) // 2
+            next_level.append((start, mid))
+            next_level.append((mid + datetime.timedelta(days=1), end))
+        return next_level
+
+    def _merge(self, leaves):
+        """按日期顺序合并相邻区间。各区间页数向上取整，合并后的实际页数不超过页数之和。"""
+        leaves.sort()
+        merged = []
+        for start, end, pages in leaves:
+            if merged and merged[-1][2] + pages <= self.max_pages:
+                merged[-1] = (merged[-1][0], end, merged[-1][2] + pages)
+            else:
+                merged.append((start, end, pages))
+        return [_format(start, end) for start, end, _ in merged]
+
+
+class PlanStore:
+    """{file_type}.plan.json：按 (检索关键词, 起止日期, 页数上限) 保存划分结果。"""
+    _lock = threading.Lock()
+
+    def __init__(self, path):
+        self.path = path
+
+    @staticmethod
+    def key(searchkey, start_date, end_date, max_pages):
+        return f"{searchkey}|{start_date}|{end_date}|{max_pages}"
+
+    def get(self, key):
+        with self._lock:
+            return self._read().get(key)
+
+    def put(self, key, intervals):
+        with self._lock:
+            plans = self._read()
+            plans[key] = intervals
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(plans, f, ensure_ascii=False, indent=1)
+            os.replace(tmp_path, self.path)
+
+    def _read(self):
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, 'r', encoding='utf-8') as f:
+            return json.load(f)
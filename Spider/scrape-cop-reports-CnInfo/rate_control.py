@@ -0,0 +1,254 @@
+# -*- encoding: utf-8 -*-
+"""
+爬虫的请求速率控制（查询和下载各一个共享实例，所有线程/协程共用）。
+
+    - 令牌桶：平均请求速率不超过 rate 次/秒（rate 为 None 时不限速）
+    - 并发上限按 AIMD 调整：连续成功且延迟低于 latency_target 时逐步加 1，
+      服务器过载时减半，延迟过高时减 1，范围为 [min_concurrency, max_concurrency]
+    - 出错后有界的指数退避，上限 max_backoff，并加随机抖动：
+        偶发错误（断流、5xx 等）只让出错的请求自己退避：transient_backoff * 2^(本请求的尝试次数-1)；
+        服务器过载（HTTP 429/503，或连续 max(PAUSE_AFTER_ERRORS, 当前并发上限) 次错误，即在途请求全部失败）时
+        并发上限减半，并全局暂停：base_backoff * 2^(过载次数-1)（有 Retry-After 时取两者较大值），
+        期间所有线程都不发出新请求；过载次数在下一次成功后清零
+    - 每个请求最多尝试 max_attempts 次，之后抛出最后一次的异常
+    - 统计请求数、错误率、平均延迟、字节数，report() 输出实际吞吐
+
+open(name, **config) 返回共享实例；实例已存在时按 config 更新对应的配置项。
+每次爬取开始时 reset() 清空统计和退避状态（同一进程中多次运行 main() 时不会沿用上一次的状态）。
+
+同步代码用 call(func)，异步代码用 await call_async(coro_func)。
+"""
+import asyncio
+import random
+import threading
+import time
+
+DEFAULT_MAX_ATTEMPTS = 8
+PAUSE_AFTER_ERRORS = 3  # 连续错误的最少次数（并发时取当前并发上限），达到后视为服务器过载
+OVERLOAD_STATUS = (429, 503)
+CONFIG_KEYS = ("rate", "min_concurrency", "max_concurrency", "base_backoff", "transient_backoff", "max_backoff",
+               "max_attempts", "latency_target")
+
+
+def _status_of(error):
+    """requests 的 HTTPError（response.status_code）或 aiohttp 的 ClientResponseError（status）的状态码。"""
+    response = getattr(error, "response", None)
+    status = getattr(response, "status_code", None)
+    return status if status is not None else getattr(error, "status", None)
+
+
+def _retry_after(error):
+    headers = getattr(getattr(error, "response", None), "headers", None) or getattr(error, "headers", None)
+    try:
+        return float(headers.get("Retry-After")) if headers else None
+    except (TypeError, ValueError):
+        return None
+
+
+class RateController:
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, name, rate=None, min_concurrency=1, max_concurrency=10, base_backoff=1.0,
+                 transient_backoff=0.2, max_backoff=60.0, max_attempts=DEFAULT_MAX_ATTEMPTS, latency_target=10.0):
+        self.name = name
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._in_flight = 0
+        self.configure(rate=rate, min_concurrency=min_concurrency, max_concurrency=max_concurrency,
+                       base_backoff=base_backoff, transient_backoff=transient_backoff, max_backoff=max_backoff,
+                       max_attempts=max_attempts, latency_target=latency_target)
+        self.reset()
+
+    @classmethod
+    def open(cls, name, **config):
+        """获取名为 name 的共享实例；实例已存在时用 config 中给出的项更新配置。"""
+        with cls._instances_lock:
+            controller = cls._instances.get(name)
+            if controller is None:
+                return cls._instances.setdefault(name, cls(name, **config))
+        if config:
+            controller.configure(**config)
+        return controller
+
+    def configure(self, **config):
+        """更新给出的配置项（其余保持不变）；并发上限的范围变化时，当前上限重置为 max_concurrency。"""
+        unknown = set(config) - set(CONFIG_KEYS)
+        if unknown:
+            raise TypeError(f"RateController 不支持的配置项: {sorted(unknown)}")
+        with self._cond:
+            old_range = (getattr(self, "min_concurrency", None), getattr(self, "max_concurrency", None))
+            for key, value in config.items():
+                setattr(self, key, value)
+            self.min_concurrency = max(1, self.min_concurrency)
+            self.max_concurrency = max(self.min_concurrency, self.max_concurrency)
+            if (self.min_concurrency, self.max_concurrency) != old_range:
+                self.limit = self.max_concurrency
+            self._cond.notify_all()
+
+    def reset(self):
+        """清空统计和退避状态，并发上限恢复为 max_concurrency；应在没有请求进行时调用。"""
+        with self._cond:
+            self.limit = self.max_concurrency
+            self._async_cond = None
+            self._async_loop = None
+            self._next_token = 0.0
+            self._pause_until = 0.0
+            self._consecutive_errors = 0
+            self._consecutive_overloads = 0
+            self._success_streak = 0
+
+            self._started = time.monotonic()
+            self.requests = 0
+            self.errors = 0
+            self.overloads = 0
+            self.bytes = 0
+            self._latency_total = 0.0
+
+    # ------------------------------------------------------------------
+    # 同步接口
+    # ------------------------------------------------------------------
+    def call(self, func):
+        """执行 func()，失败时退避后重试，最多 max_attempts 次。"""
+        for attempt in range(1, self.max_attempts + 1):
+            with self._cond:
+                while self._in_flight >= self.limit:
+                    self._cond.wait()
+                self._in_flight += 1
+                wait = self._reserve()
+            if wait > 0:
+                time.sleep(wait)
+            start = time.monotonic()
+            try:
+                result = func()
+            except Exception as e:
+                delay, overload = self._release(start, attempt, error=e)
+                if attempt == self.max_attempts:
+                    raise
+                print(f'[{self.name}] Error: {e}, 第 {attempt} 次失败，{delay:.1f} 秒后重试')
+                if not overload:
+                    time.sleep(delay)  # 全局暂停由 _reserve 统一等待
+                continue
+            self._release(start, attempt)
+            return result
+
+    # ------------------------------------------------------------------
+    # 异步接口（同一个实例只在一个事件循环中使用）
+    # ------------------------------------------------------------------
+    async def call_async(self, coro_func):
+        loop = asyncio.get_running_loop()
+        if self._async_loop is not loop:
+            # asyncio.Condition 绑定创建它的事件循环；新的一次运行（新的事件循环）重新创建
+            self._async_cond = asyncio.Condition()
+            self._async_loop = loop
+        for attempt in range(1, self.max_attempts + 1):
+            async with self._async_cond:
+                await self._async_cond.wait_for(lambda: self._in_flight < self.limit)
+                with self._lock:
+                    self._in_flight += 1
+                    wait = self._reserve()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            start = time.monotonic()
+            try:
+                result = await coro_func()
+            except Exception as e:
+                delay, overload = self._release(start, attempt, error=e)
+                async with self._async_cond:
+                    self._async_cond.notify_all()
+                if attempt == self.max_attempts:
+                    raise
+                print(f'[{self.name}] Error: {e}, 第 {attempt} 次失败，{delay:.1f} 秒后重试')
+                if not overload:
+                    await asyncio.sleep(delay)
+                continue
+            self._release(start, attempt)
+            async with self._async_cond:
+                self._async_cond.notify_all()
+            return result
+
+    def add_bytes(self, nbytes):
+        with self._lock:
+            self.bytes += nbytes
+
+    # ------------------------------------------------------------------
+    # 统计
+    # ------------------------------------------------------------------
+    def stats(self):
+        with self._lock:
+            elapsed = max(time.monotonic() - self._started, 1e-9)
+            return {
+                "requests": self.requests,
+                "errors": self.errors,
+                "error_rate": self.errors / self.requests if self.requests else 0.0,
+                "overloads": self.overloads,
+                "requests_per_sec": (self.requests - self.errors) / elapsed,
+                "avg_latency": self._latency_total / self.requests if self.requests else 0.0,
+                "mb_per_sec": self.bytes / elapsed / 1024 / 1024,
+                "concurrency_limit": self.limit,
+            }
+
+    def report(self):
+        s = self.stats()
+        text = (f"[{self.name}] 请求 {s['requests']} 次，成功 {s['requests_per_sec']:.2f} 次/秒，"
+                f"错误 {s['errors']} 次 ({s['error_rate']:.1%}，其中过载 {s['overloads']} 次)，平均延迟 {s['avg_latency']:.2f} 秒，"
+                f"当前并发上限 {s['concurrency_limit']}")
+        if self.bytes:
+            text += f"，{s['mb_per_sec']:.2f} MB/s"
+        print(text)
+        return s
+
+    # ------------------------------------------------------------------
+    # 内部实现（调用时已持有 self._lock）
+    # ------------------------------------------------------------------
+    def _reserve(self):
+        """预约一个令牌，返回需要等待的秒数（包括全局退避的剩余时间）。"""
+        now = time.monotonic()
+        start = max(now, self._pause_until)
+        if self.rate:
+            start = max(start, self._next_token)
+            self._next_token = start + 1.0 / self.rate
+        return start - now
+
+    def _release(self, start, attempt, error=None):
+        """
+        记录一次请求的结果并调整并发上限。出错时返回 (退避秒数, 是否过载)：
+        过载时已设置全局暂停，否则由调用方只让本请求等待退避秒数。
+        """
+        latency = time.monotonic() - start
+        with self._cond:
+            self._in_flight -= 1
+            self.requests += 1
+            self._latency_total += latency
+            delay, overload = 0.0, False
+            if error is not None:
+                self.errors += 1
+                self._consecutive_errors += 1
+                self._success_streak = 0
+                overload = (_status_of(error) in OVERLOAD_STATUS
+                            or self._consecutive_errors >= max(PAUSE_AFTER_ERRORS, self.limit))
+                if overload:
+                    self.overloads += 1
+                    self._consecutive_overloads += 1
+                    self._consecutive_errors = 0
+                    self.limit = max(self.min_concurrency, self.limit // 2)
+                    delay = min(self.max_backoff, self.base_backoff * 2 ** (self._consecutive_overloads - 1))
+                    delay = random.uniform(delay / 2, delay)
+                    delay = max(delay, min(self.max_backoff, _retry_after(error) or 0.0))
+                    self._pause_until = max(self._pause_until, time.monotonic() + delay)
+                else:
+                    delay = min(self.max_backoff, self.transient_backoff * 2 ** (attempt - 1))
+                    delay = random.uniform(delay / 2, delay)
+            else:
+                self._consecutive_errors = 0
+                self._consecutive_overloads = 0
+                if latency > self.latency_target:
+                    self._success_streak = 0
+                    self.limit = max(self.min_concurrency, self.limit - 1)
+                else:
+                    self._success_streak += 1
+                    if self._success_streak >= self.limit:
+                        self._success_streak = 0
+                        self.limit = min(self.max_concurrency, self.limit + 1)
+            self._cond.notify_all()
+            return delay, overload
@@ -1,4 +1,5 @@
-from FuncScraper import main
+import FuncScraper
+import AsyncScraper
 
 customer_req = {
     "file_type": "A股年报",  # 文件类型
@@ -6,10 +7,25 @@ customer_req = {
     "start_date": "2019-01-01",  # 起始日期。默认为 2000-01-01,
     "end_date": "2023-01-01",  # None,  # 结束日期。默认为今天
     "interval": 1,  # 起始日期和结束日期之间的间隔。
+    "adaptive_interval": 0,  # 1：按结果密度自动拆分/合并日期区间（忽略 interval）； 0：固定 interval 天
     "reverseInterval": 1,  # 从后向前爬
     "workers": 10,  # 同时爬取的线程数。建议最大不要超过CPU线程数的150%。
+    "pool_size": 4,  # 每个线程对同一主机保持的 HTTP 长连接数
+    "prefetch_pages": 2,  # 处理当前页时提前并发查询的页数
+    "download_buffer": 262144,  # 下载缓冲区大小（字节）
     "file_download": 1,  # 1：下载到本地； 0：保存到文件
+    "recrawl": None,  # 强制重爬：None 不重爬（从上次中断处继续）；"all" 全部重爬；或日期范围列表，如 ["2020-04-01~2020-04-30"]
+    "async_mode": 0,  # 1：异步模式（需要 aiohttp），同时爬取全部日期区间和关键词； 0：线程模式
+    "query_concurrency": 4,  # 同时进行的查询数上限；下载并发数上限默认等于 workers
+    "query_rate": 3.0,  # 查询请求的目标速率（次/秒）；出错时自动退避并降低并发
+    "download_rate": 10.0,  # 下载请求的目标速率（次/秒）
+    "query_url": "http://www.cninfo.com.cn/new/hisAnnouncement/query",  # 查询接口；离线测试时可指向 stand_in_server.py
+    "static_url": "http://static.cninfo.com.cn/",  # PDF 下载地址前缀
+    "on_download": None,  # 每下载完成一个文件调用 on_download(filePath)；流式打分见 Model/pipeline.py
 }
 
 if __name__ == '__main__':
-    main(customer_req)
\ No newline at end of file
+    if customer_req.get("async_mode", 0) == 1:
+        AsyncScraper.main(customer_req)
+    else:
+        FuncScraper.main(customer_req)
\ No newline at end of file
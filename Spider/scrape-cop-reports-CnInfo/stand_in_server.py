@@ -0,0 +1,240 @@
+# -*- encoding: utf-8 -*-
+"""
+本机运行的巨潮资讯替身服务器，用于离线测试和基准测试爬虫，不访问 cninfo.com.cn。
+
+    POST /new/hisAnnouncement/query   与真实接口相同的表单参数，返回合成的公告列表
+    GET  /finalpage/...               返回合成的 PDF，支持 Range 续传（206 / 416）
+
+可配置项（stand_in_server(**config)）：
+    pages              每个日期区间的页数（pages_per_day 为 None 时使用）
+    pages_per_day      按区间天数计算页数：ceil(天数 * pages_per_day)，用于测试自适应区间划分
+    page_size          每页公告数，与 DATA['pageSize'] 一致
+    stopword_ratio     标题带“摘要”（会被停用词过滤掉）的公告比例
+    pdf_bytes          每个 PDF 的大小
+    latency_ms         每个请求的处理时延
+    connect_delay_ms   每个新连接建立时的时延，模拟 TCP（及 TLS）握手
+    error_rate         按此概率返回 error_status，用于测试退避重试
+    error_status       注入错误的状态码：默认 500（偶发错误，只让出错的请求退避），
+                       503 / 429 表示服务器过载（速率控制器全局暂停并降低并发）
+    cut_rate           按此概率只发送一半 PDF 后断开连接，用于测试断点续传
+    seed               随机数种子，相同配置下注入的错误可复现
+
+爬虫通过 customer_req 的 query_url / static_url 指向替身服务器，见 query_url() / static_url()。
+server.stats() 返回服务器侧统计（查询数、下载数、发送字节数、注入的错误数）。
+
+用法：python stand_in_server.py [端口]，在前台运行，供手动调试。
+"""
+import contextlib
+import datetime
+import json
+import math
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+from frontier import _parse_range
+
+QUERY_PATH = '/new/hisAnnouncement/query'
+MAX_UNIQUE_PAGES = 90
+RANGE_PATTERN = re.compile(r'bytes=(\d+)-')
+
+DEFAULT_CONFIG = {
+    "pages": 5,
+    "pages_per_day": None,
+    "page_size": 30,
+    "stopword_ratio": 0.1,
+    "pdf_bytes": 256 * 1024,
+    "latency_ms": 0,
+    "connect_delay_ms": 0,
+    "error_rate": 0.0,
+    "error_status": 500,
+    "cut_rate": 0.0,
+    "seed": 0,
+}
+
+
+def query_url(base_url):
+    return base_url + QUERY_PATH
+
+
+def static_url(base_url):
+    return base_url + '/'
+
+
+class StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, server_address, **config):
+        unknown = set(config) - set(DEFAULT_CONFIG)
+        if unknown:
+            raise ValueError(f"未知的配置项: {sorted(unknown)}")
+        self.config = dict(DEFAULT_CONFIG, **config)
+        self._random = random.Random(self.config["seed"])
+        self._lock = threading.Lock()
+        self.queries = 0
+        self.downloads = 0
+        self.bytes_sent = 0
+        self.errors_injected = 0
+        pdf_bytes = self.config["pdf_bytes"]
+        self.pdf_body = b"%PDF-1.4\n" + b"0" * max(0, pdf_bytes - 9)
+        super().__init__(server_address, _StandInHandler)
+
+    def stats(self):
+        with self._lock:
+            return {"queries": self.queries, "downloads": self.downloads,
+                    "bytes_sent": self.bytes_sent, "errors_injected": self.errors_injected}
+
+    def roll(self, rate):
+        """按概率 rate 决定是否注入错误（线程安全、可复现）。"""
+        if not rate:
+            return False
+        with self._lock:
+            hit = self._random.random() < rate
+            self.errors_injected += hit
+            return hit
+
+    def count(self, queries=0, downloads=0, nbytes=0):
+        with self._lock:
+            self.queries += queries
+            self.downloads += downloads
+            self.bytes_sent += nbytes
+
+    def page_count(self, seDate):
+        if self.config["pages_per_day"] is None:
+            return self.config["pages"]
+        start, end = _parse_range(seDate)
+        days = (end - start).days + 1
+        return max(1, math.ceil(days * self.config["pages_per_day"]))
+
+    def announcements(self, seDate, pageNum):
+        """
+        合成某一区间某一页的公告；同一区间、同一页每次返回相同的内容。
+        同一年内各区间、各页的股票代码互不重复（每区间不超过 MAX_UNIQUE_PAGES 页时），
+        因此按企业-年份去重的报告类型也不会把合成公告当作重复报告跳过。
+        """
+        start, _ = _parse_range(seDate)
+        page_size = self.config["page_size"]
+        timestamp = int(datetime.datetime.combine(start, datetime.time(12)).timestamp() * 1000)
+        stopword_every = round(1 / self.config["stopword_ratio"]) if self.config["stopword_ratio"] else 0
+        day_of_year = start.timetuple().tm_yday - 1
+        first = (day_of_year * MAX_UNIQUE_PAGES + pageNum - 1) * page_size
+        result = []
+        for k in range(page_size):
+            n = first + k
+            title = f"{start.year - 1}年年度报告"
+            if stopword_every and n % stopword_every == 0:
+                title += "摘要"
+            result.append({
+                "secCode": f"{n % 1000000:06d}",
+                "secName": f"测试{n % 1000:03d}",
+                "orgId": f"gssz0{n % 1000000:06d}",
+                "announcementTitle": title,
+                "announcementTime": timestamp,
+                "adjunctUrl": f"finalpage/{start}/{start.year}{n:07d}.PDF",
+            })
+        return result
+
+
+class _StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # 支持 keep-alive
+    disable_nagle_algorithm = True  # 响应头和正文分两次写出，避免 Nagle 与延迟 ACK 叠加出的 40ms 停顿
+
+    def setup(self):
+        super().setup()
+        if self.server.config["connect_delay_ms"]:
+            time.sleep(self.server.config["connect_delay_ms"] / 1000)
+
+    def log_message(self, format, *args):
+        pass
+
+    def _delay(self):
+        if self.server.config["latency_ms"]:
+            time.sleep(self.server.config["latency_ms"] / 1000)
+
+    def _send(self, status, body, content_type, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self):
+        status = self.server.config["error_status"]
+        self._send(status, self.responses.get(status, ("Error",))[0].encode(), "text/plain")
+
+    def do_POST(self):
+        form = parse_qs(self.rfile.read(int(self.headers.get("Content-Length", 0))).decode("utf-8"))
+        self._delay()
+        if self.path != QUERY_PATH:
+            self._send(404, b"Not Found", "text/plain")
+            return
+        if self.server.roll(self.server.config["error_rate"]):
+            self._send_error()
+            return
+        seDate = form.get("seDate", [""])[0]
+        pageNum = int(form.get("pageNum", ["1"])[0] or 1)
+        pages = self.server.page_count(seDate) if seDate else 0
+        announcements = self.server.announcements(seDate, pageNum) if 1 <= pageNum <= pages else None
+        # 与真实接口一致：爬虫查询 1 ~ totalpages + 1 页，超出后 announcements 为 null
+        body = json.dumps({"announcements": announcements, "totalpages": max(0, pages - 1)},
+                          ensure_ascii=False).encode("utf-8")
+        self.server.count(queries=1)
+        self._send(200, body, "application/json;charset=UTF-8")
+
+    def do_GET(self):
+        self._delay()
+        if self.server.roll(self.server.config["error_rate"]):
+            self._send_error()
+            return
+        pdf_body = self.server.pdf_body
+        match = RANGE_PATTERN.match(self.headers.get("Range", ""))
+        offset = int(match.group(1)) if match else 0
+        if offset >= len(pdf_body) > 0:
+            self._send(416, b"", "application/pdf", {"Content-Range": f"bytes */{len(pdf_body)}"})
+            return
+        body = pdf_body[offset:]
+        if match:
+            status, headers = 206, {"Content-Range": f"bytes {offset}-{len(pdf_body) - 1}/{len(pdf_body)}"}
+        else:
+            status, headers = 200, {}
+        if self.server.roll(self.server.config["cut_rate"]):
+            # 声明完整长度，只发送一半后断开
+            self.send_response(status)
+            self.send_header("Content-Type", "application/pdf")
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body[:len(body) // 2])
+            self.server.count(nbytes=len(body) // 2)
+            self.close_connection = True
+            return
+        self._send(status, body, "application/pdf", headers)
+        self.server.count(downloads=1, nbytes=len(body))
+
+
+@contextlib.contextmanager
+def stand_in_server(port=0, **config):
+    """在后台线程中启动替身服务器，返回 (base_url, server)。"""
+    server = StandInServer(("127.0.0.1", port), **config)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}", server
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8000
+    server = StandInServer(("127.0.0.1", port))
+    print(f"替身服务器：query_url={query_url(f'http://127.0.0.1:{port}')}  "
+          f"static_url={static_url(f'http://127.0.0.1:{port}')}")
+    server.serve_forever()
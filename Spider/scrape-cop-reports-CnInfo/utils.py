@@ -1,4 +1,36 @@
 from constant import *
+from ledger import DownloadLedger
+from metadata_sink import MetadataSink
+from rate_control import RateController
+import threading
+from requests.adapters import HTTPAdapter
+
+DEFAULT_POOL_SIZE = 4  # 每个线程的 Session 对同一主机保持的最大长连接数
+DEFAULT_CHUNK_SIZE = 256 * 1024  # 下载时每次读写的字节数
+DEFAULT_DOWNLOAD_ATTEMPTS = 5
+DEFAULT_QUERY_RATE = 3.0  # 查询请求的目标速率（次/秒）
+DEFAULT_DOWNLOAD_RATE = 10.0  # 下载请求的目标速率（次/秒）
+DEFAULT_QUERY_CONCURRENCY = 4
+PART_SUFFIX = '.part'
+PDF_MAGIC = b'%PDF-'
+
+_thread_local = threading.local()
+
+
+def get_session(pool_size=DEFAULT_POOL_SIZE):
+    """
+    获取当前线程专属的 requests.Session。
+    同一线程内的查询和下载复用 keep-alive 长连接，避免每个请求重新建立 TCP 连接；
+    Session 不跨线程共享，pool_size 仅在该线程第一次创建 Session 时生效。
+    """
+    session = getattr(_thread_local, "session", None)
+    if session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        _thread_local.session = session
+    return session
 
 
 def create_date_intervals(interval, start_date="2000-01-01", end_date=None):
@@ -27,126 +59,137 @@ def create_date_intervals(interval, start_date="2000-01-01", end_date=None):
     return intervals
 
 
-def retry_on_failure(func):
-    """对于请求失败的情况，暂停一段时间"""
-    pause_time = 3
-    try:
-        result = func()
-        return result
-    except Exception as e:
-        print(f'Error: {e}, 暂停 {pause_time} 秒')
-        time.sleep(pause_time)
-        return retry_on_failure(func)
+def rate_controllers(customer_req, reset=False):
+    """
+    查询和下载各自的共享速率控制器（见 rate_control.py），所有线程/协程共用。
+    配置按 customer_req 更新；reset=True 时清空上一次运行的统计和退避状态（每次爬取开始时调用一次）。
+    """
+    query = RateController.open(
+        "query", rate=customer_req.get("query_rate", DEFAULT_QUERY_RATE),
+        max_concurrency=customer_req.get("query_concurrency", DEFAULT_QUERY_CONCURRENCY))
+    download = RateController.open(
+        "download", rate=customer_req.get("download_rate", DEFAULT_DOWNLOAD_RATE),
+        max_concurrency=customer_req.get("download_concurrency", customer_req["workers"]),
+        max_attempts=DEFAULT_DOWNLOAD_ATTEMPTS)
+    if reset:
+        query.reset()
+        download.reset()
+    return query, download
+
+
+def retry_on_failure(func, controller=None):
+    """对于请求失败的情况，由速率控制器统一退避后重试；重试次数用完后抛出最后一次的异常"""
+    controller = controller if controller is not None else RateController.open("default")
+    return controller.call(func)
+
+
+# CSR 报告的类型标签，每类关键词合并为一个正则
+CSR_TAG_PATTERNS = [
+    ("#CSR", re.compile("社会责任|CSR")),
+    ("#ESG", re.compile("ESG|管治|治理")),
+    ("#SD", re.compile("可持续")),
+    ("#ENV", re.compile("环境报告书")),
+]
 
 
 def get_CSR_tag(title):
-    csr_dict = ["社会责任", "CSR"]
-    esg_dict = ["ESG", "管治", "治理"]
-    sd_dict = ["可持续"]
-    env_dict = ["环境报告书"]
-    tags = []
-    for csr_word in csr_dict:
-        if csr_word in title:
-            tags.append("#CSR")
-            break
-    for esg_word in esg_dict:
-        if esg_word in title:
-            tags.append("#ESG")
-            break
-    for sd_word in sd_dict:
-        if sd_word in title:
-            tags.append("#SD")
-            break
-    for env_dict in env_dict:
-        if env_dict in title:
-            tags.append("#ENV")
-            break
-    return ''.join(tags)
-
-
-def compare_latest_report(downloaded_files, announcementTime, fileShortName):
-    # 根据企业的代码和年份，在记录中寻找其发布日期，保存到 matching_files
-    pattern = re.compile(
-        rf"{re.escape(f'{fileShortName}')}_.*_(\d{{4}}-\d{{2}}-\d{{2}}).*")
-    matching_files = [
-        f for f in downloaded_files if pattern.match(f)]
-    # 如果存在这样的文件，执行比对
-    if len(matching_files) != 0:
-        # 获取存在的文件的最大日期 time_in_downloaded_files，
-        # 以及对应文件 latest_file
-        # 尽管记录中的文件极大概率是不重复的，但也不一定，比如pdf和txt的文件都在里面，或者里面有历史文件的下载记录。
-        latest_file = max(matching_files, key=lambda x: datetime.datetime.strptime(
-            re.search(r"_(\d{4}\-\d{2}\-\d{2})\.\w+", x).group(1), "%Y-%m-%d"))
-        time_in_downloaded_files = datetime.datetime.strptime(
-            re.search(r"_(\d{4}-\d{2}-\d{2})\.\w+", latest_file).group(1), "%Y-%m-%d")
-        # 获取当前可能需要下载的报告日期，并减去1天，因为不同来源或下载时记录的文件，由于四舍五入会差一天
-        time_of_downloading_file = datetime.datetime.strptime(
-            announcementTime, "%Y-%m-%d")
-        # 如果日期更新，则下载，否则不下载
-        if time_of_downloading_file - time_in_downloaded_files <= datetime.timedelta(days=1):
-            print(
-                f'{fileShortName}：\t有新版不下载:{str(time_in_downloaded_files)[:10]}')
-            return False
-        print(f'{fileShortName}：\t需要更新:{time_in_downloaded_files}')
-
-
-def download_file(downloadUrl, filePath, fileShortName, LOCK_FILE_PATH, fileName):
-    """分块下载文件，并只在下载完成后才保存到本地"""
+    return ''.join(tag for tag, pattern in CSR_TAG_PATTERNS if pattern.search(title))
+
+
+def range_headers(offset):
+    """下载请求头：已有 offset 字节时只请求剩余部分。断点续传按原始字节计算偏移，因此不接受压缩传输。"""
+    headers = {'Accept-Encoding': 'identity'}
+    if offset:
+        headers['Range'] = f'bytes={offset}-'
+    return headers
+
+
+def expected_total_size(status, headers):
+    """根据响应头推算完整文件的字节数，未知时返回 None。"""
+    if status in (206, 416):
+        # Content-Range: bytes 100-999/1000 或 bytes */1000
+        total = headers.get('Content-Range', '').rpartition('/')[2]
+    else:
+        total = headers.get('Content-Length', '')
+    return int(total) if total.isdigit() else None
+
+
+def finalize_part(part_path, filePath, expected_size, check_pdf):
+    """
+    校验 .part 文件后原子改名为目标文件。
+    长度不足时保留 .part 以便续传；长度超出或不是 PDF 时删除 .part，下次从头下载。
+    """
+    size = os.path.getsize(part_path)
+    if expected_size is not None and size < expected_size:
+        raise IOError(f'文件不完整 ({size}/{expected_size} 字节)')
+    if expected_size is not None and size > expected_size:
+        os.remove(part_path)
+        raise IOError(f'文件长度异常 ({size}/{expected_size} 字节)')
+    if check_pdf:
+        with open(part_path, 'rb') as f:
+            head = f.read(len(PDF_MAGIC))
+        if head != PDF_MAGIC:
+            os.remove(part_path)
+            raise IOError('不是有效的 PDF 文件')
+    os.replace(part_path, filePath)
+
+
+def download_file(downloadUrl, filePath, fileShortName, LOCK_FILE_PATH, fileName, session=None,
+                  chunk_size=DEFAULT_CHUNK_SIZE, controller=None):
+    """
+    分块下载到目标文件旁的 .part 文件，中断后用 Range 请求从已下载的位置续传；
+    长度和 PDF 文件头校验通过后原子改名为目标文件，再记入下载记录。
+    重试（次数、退避、并发）由速率控制器决定；仍失败时保留 .part，下次运行时继续续传。
+    """
+    session = session if session is not None else get_session()
+    controller = controller if controller is not None else RateController.open(
+        "download", max_attempts=DEFAULT_DOWNLOAD_ATTEMPTS)
+    part_path = filePath + PART_SUFFIX
+    check_pdf = filePath.lower().endswith('.pdf')
+
+    def attempt():
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        with session.get(downloadUrl, stream=True, headers=range_headers(offset)) as r:
+            # 416：.part 已经是完整文件，直接校验
+            if r.status_code != 416:
+                r.raise_for_status()
+                if r.status_code != 206:
+                    offset = 0  # 服务器不支持 Range，从头下载
+                with open(part_path, 'ab' if offset else 'wb') as part_file:
+                    for chunk in r.iter_content(chunk_size=chunk_size):
+                        part_file.write(chunk)
+                        controller.add_bytes(len(chunk))
+            expected_size = expected_total_size(r.status_code, r.headers)
+        finalize_part(part_path, filePath, expected_size, check_pdf)
+
     try:
-        with requests.get(downloadUrl, stream=True) as r:
-            r.raise_for_status()
-            with tempfile.NamedTemporaryFile(delete=False) as tmp_file:
-                for chunk in r.iter_content(chunk_size=8192):
-                    if chunk:
-                        tmp_file.write(chunk)
-                temp_name = tmp_file.name
-        shutil.move(temp_name, filePath)
-        print(f'{fileShortName}：\t已下载到 {filePath}')
-        # 下载完成后，保存文件名到记录中。
-        with open(LOCK_FILE_PATH, 'a', encoding='utf-8', errors='ignore') as lock_file:
-            lock_file.write(f'{fileName}\n')
+        controller.call(attempt)
     except Exception as e:
         print(f'{fileShortName}： \t下载失败: {e}')
+        return False
+    print(f'{fileShortName}：\t已下载到 {filePath}')
+    # 下载完成后，保存文件名到记录中。
+    DownloadLedger.open(LOCK_FILE_PATH).add(fileName)
+    return True
 
 
-def save_to_csv(downloadUrl, fileName, fileShortName, root_file_path, file_type):
-    # 从fileName中获取内容
-    fileName = os.path.splitext(fileName)[0]
-    # 分列文件名，获取各个列
-    split_name = fileName.split('_')
-
-    # 根据分列的结果来决定列名和是否继续
-    if len(split_name) == 6:
-        column_names = ['股票代码', '年份', '类型', '股票简称', '文件标题', '发布日期']
-    elif len(split_name) == 5:
-        column_names = ['股票代码', '年份', '股票简称', '文件标题', '发布日期']
-    elif len(split_name) == 4:
-        column_names = ['股票代码', '发布日期', '股票简称', '文件标题']
-    else:
-        print("文件名分列结果不符合要求，跳过。")
-        return
-    new_entry = dict(zip(column_names, split_name))
-    new_entry['下载链接'] = downloadUrl
-
-    # 检查CSV文件是否存在，如果存在就加载，否则创建一个空的DataFrame
-    csv_filename = f'{root_file_path}\{file_type}\{file_type}.csv'
-    if not os.path.exists(csv_filename):
-        df = pd.DataFrame(columns=new_entry.keys())
-        df.to_csv(csv_filename, index=False)
-    df = pd.read_csv(csv_filename, encoding='utf-8-sig',
-                     encoding_errors="ignore", dtype=str)
-    # 检查文件是否存在。在这里可以用链接作为主键
-    if downloadUrl in df['下载链接'].values:
-        print(f'{fileShortName}：\t链接已存在')
+def notify_download(on_download, filePath):
+    """下载完成后调用 customer_req["on_download"] 回调（如打分流水线的入队），回调出错不影响爬取。"""
+    if on_download is None:
         return
+    try:
+        on_download(filePath)
+    except Exception as e:
+        print(f'on_download 回调失败: {e}')
 
-    # 将新的文件名和下载链接添加到DataFrame中
-    df = pd.DataFrame([new_entry], columns=new_entry.keys())
 
-    # 将DataFrame保存到CSV文件中
-    df.to_csv(csv_filename, mode='a', header=False, index=False)
-    print(f'{fileShortName}：\t已保存记录')
+def save_to_csv(downloadUrl, fileName, fileShortName, root_file_path, file_type):
+    """
+    登记一条公告的元数据到 {file_type}.csv：链接去重在内存中完成，写入由 MetadataSink 的写线程批量追加。
+    返回 Future，记录写入 CSV 后结果为 True，写入失败为 False。
+    """
+    return MetadataSink.open(metadata_csv_path(root_file_path, file_type)).add(downloadUrl, fileName, fileShortName)
 
 
-# 使用示例
-# save_to_csv('example_file.txt', 'http://example.com/download/link')
+def metadata_csv_path(root_file_path, file_type):
+    return f'{root_file_path}\{file_type}\{file_type}.csv'